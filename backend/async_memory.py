@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class MemoryBusyError(Exception):
+    """
+    Raised when the search queue is full and a call is rejected instead of queued.
+    """
+
+class AsyncMemory:
+    """
+    An asyncio facade over Memory that runs embedding and search calls in a bounded
+    thread pool, so they do not block the Tornado IOLoop.
+
+    Ollama HTTP calls and Faiss searches release the GIL, so calls from concurrent
+    requests overlap. Calls wait at most timeout seconds for a result, and once
+    max_queue calls are waiting for a worker, new ones are rejected with
+    MemoryBusyError rather than piling up.
+    """
+
+    def __init__(self, memory, max_workers=4, max_queue=64, timeout=30.0):
+        """
+        Args:
+            memory (Memory): The memory to run calls against.
+            max_workers (int): Number of worker threads.
+            max_queue (int): Number of calls that may wait for a worker before new calls are rejected.
+            timeout (float): Default seconds a call may take, including time spent queued.
+        """
+        self.memory = memory
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memory")
+        self._lock = threading.Lock()
+        self._pending = 0  # Calls submitted and not yet finished, queued or running
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._busy_seconds = 0.0
+        self._max_queue_depth = 0
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._busy_seconds += time.perf_counter() - start
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the worker pool and await its result.
+
+        Args:
+            fn (callable): A blocking callable, usually a Memory method.
+            timeout (float, optional): Seconds to wait for the result. Defaults to self.timeout.
+
+        Raises:
+            MemoryBusyError: If max_queue calls are already waiting for a worker.
+            asyncio.TimeoutError: If the result does not arrive in time. The call itself
+                runs to completion in its worker thread.
+        """
+        with self._lock:
+            queued = self._pending - self._running
+            if queued >= self.max_queue:
+                self._rejected += 1
+                raise MemoryBusyError(f"Search queue is full ({queued} calls waiting).")
+            self._pending += 1
+            self._max_queue_depth = max(self._max_queue_depth, queued + 1)
+        future = self._executor.submit(self._call, fn, args, kwargs)
+        future.add_done_callback(self._finished)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise
+
+    async def get_embeddings(self, texts, timeout=None, **kwargs):
+        return await self.run(self.memory.get_embeddings, texts, timeout=timeout, **kwargs)
+
+    async def search_memory(self, query, timeout=None, **kwargs):
+        return await self.run(self.memory.search_memory, query, timeout=timeout, **kwargs)
+
+    async def search_many(self, queries, timeout=None, **kwargs):
+        return await self.run(self.memory.search_many, queries, timeout=timeout, **kwargs)
+
+    async def search_hybrid(self, query, timeout=None, **kwargs):
+        return await self.run(self.memory.search_hybrid, query, timeout=timeout, **kwargs)
+
+    async def search_documents(self, query, timeout=None, **kwargs):
+        return await self.run(self.memory.search_documents, query, timeout=timeout, **kwargs)
+
+    async def search_documents_many(self, queries, timeout=None, **kwargs):
+        return await self.run(self.memory.search_documents_many, queries, timeout=timeout, **kwargs)
+
+    async def add_memories(self, contents, timeout=None, **kwargs):
+        return await self.run(self.memory.add_memories, contents, timeout=timeout, **kwargs)
+
+    def metrics(self):
+        """
+        Return queue-depth and throughput counters.
+
+        Returns:
+            dict: workers, queued (waiting for a worker), running, max_queue_depth,
+            completed, failed, rejected, timed_out and mean_call_ms.
+        """
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "workers": self.max_workers,
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "mean_call_ms": 1000 * self._busy_seconds / finished if finished else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,81 @@
+"""
+Benchmark ingest throughput of Memory.add_memory (one document per call) against
+Memory.add_memories (batched embedding and insertion).
+
+The default backend needs a running Ollama daemon with the all-minilm model
+pulled; --backend hashing or onnx runs without one. The embedding cache is
+disabled so both paths pay the full embedding cost.
+
+Usage:
+    python bench_ingest.py --docs 500 --batch-size 64
+    python bench_ingest.py --backend onnx --max-concurrency 2
+"""
+import argparse
+import random
+import time
+
+from embedding_backends import BACKEND_NAMES, create_backend
+from vector_db import Memory
+
+WORDS = [
+    "agreement", "judgment", "appeal", "contract", "tenancy", "lease", "court", "high",
+    "supreme", "constitution", "act", "section", "land", "employment", "company", "tax",
+    "uganda", "kenya", "tanzania", "rwanda", "petition", "ruling", "application", "loan",
+]
+
+
+def make_documents(count, seed=0):
+    """
+    Build deterministic synthetic document titles.
+    """
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) for _ in range(count)]
+
+
+def bench_per_item(docs, backend):
+    memory = Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    start = time.perf_counter()
+    for doc in docs:
+        memory.add_memory(doc, metadata={"doc_name": doc})
+    elapsed = time.perf_counter() - start
+    memory.close()
+    return elapsed
+
+
+def bench_batched(docs, batch_size, backend):
+    memory = Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    start = time.perf_counter()
+    memory.add_memories(docs, metadatas=[{"doc_name": doc} for doc in docs], batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    memory.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory ingest benchmark")
+    parser.add_argument("--docs", type=int, default=500, help="Number of synthetic documents")
+    parser.add_argument("--batch-size", type=int, default=64, help="Batch size for add_memories")
+    parser.add_argument("--backend", default="ollama", help=f"Embedding backend, one of {BACKEND_NAMES}")
+    parser.add_argument("--max-batch-size", type=int, help="Override the backend's max batch size")
+    parser.add_argument("--max-concurrency", type=int, help="Override the backend's concurrency limit")
+    args = parser.parse_args()
+
+    docs = make_documents(args.docs)
+    backend = create_backend(args.backend)
+    backend.set_limits(args.max_batch_size or backend.max_batch_size, args.max_concurrency or backend.max_concurrency)
+
+    # Warm up the embedding model so the first timed call does not pay its load time
+    Memory(use_gpu=False, cache_path=None, embedding_backend=backend).get_embedding("warm up")
+
+    per_item = bench_per_item(docs, backend)
+    batched = bench_batched(docs, args.batch_size, backend)
+
+    print(f"\n{'mode':<12}{'seconds':>10}{'docs/sec':>12}")
+    print(f"{'per-item':<12}{per_item:>10.2f}{len(docs) / per_item:>12.1f}")
+    print(f"{'batched':<12}{batched:>10.2f}{len(docs) / batched:>12.1f}")
+    print(f"\nSpeed-up: {per_item / batched:.1f}x")
+    print(f"Backend: {backend.stats()}")
+
+
+if __name__ == "__main__":
+    main()
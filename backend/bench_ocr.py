@@ -0,0 +1,91 @@
+"""
+Benchmark OCR throughput of scanned PDFs across OCR modes and worker processes.
+
+The pages without a usable text layer of every PDF in static/uploads/lib_docs
+are rasterised and OCRed in each OCR mode (one Tesseract pass per page, or one
+per text block) with 1, 2, 4, ... worker processes up to the number of cores. Pages per second, the
+speed-up over the first run and the peak RSS of the benchmark process, which
+holds no page images, are reported.
+
+Requires Tesseract and Poppler.
+
+Usage:
+    python bench_ocr.py
+    python bench_ocr.py --workers 1,4,8 --max-pages 20
+    python bench_ocr.py --modes page --workers 1
+"""
+import argparse
+import os
+import resource
+import time
+from io import BytesIO
+
+import PyPDF2
+
+from document_text import OCR_MODES, has_text_layer, ocr_pdf
+
+LIB_DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static/uploads/lib_docs")
+
+
+def scanned_pdfs(directory, max_pages):
+    """
+    Find the PDF pages with no usable text layer.
+
+    Returns:
+        list[tuple]: (filename, file body, numbers of the pages to OCR) for each PDF with scanned pages.
+    """
+    documents = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(directory, filename), "rb") as f:
+            body = f.read()
+        try:
+            reader = PyPDF2.PdfReader(BytesIO(body))
+            scanned = [
+                page_number for page_number, page in enumerate(reader.pages, start=1)
+                if not has_text_layer(page.extract_text() or "")
+            ]
+        except Exception as e:
+            print(f"Skipping {filename}: {e}")
+            continue
+        if scanned:
+            documents.append((filename, body, scanned[:max_pages]))
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR throughput benchmark")
+    parser.add_argument("--directory", default=LIB_DOCS_DIR, help="Directory of PDFs")
+    default_workers = ",".join(str(1 << i) for i in range((os.cpu_count() or 1).bit_length()))
+    parser.add_argument("--workers", default=default_workers, help="Comma-separated worker counts")
+    parser.add_argument("--modes", default=",".join(OCR_MODES), help="Comma-separated OCR modes")
+    parser.add_argument("--max-pages", type=int, default=50, help="Most pages OCRed per document")
+    args = parser.parse_args()
+
+    documents = scanned_pdfs(args.directory, args.max_pages)
+    if not documents:
+        raise SystemExit(f"No scanned PDFs found in {args.directory}")
+    n_pages = sum(len(pages) for _, _, pages in documents)
+    print(f"{len(documents)} PDFs with scanned pages, {n_pages} pages")
+
+    results = []
+    for mode in args.modes.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            print(f"OCRing in {mode} mode with {workers} workers...")
+            start = time.perf_counter()
+            for _, body, pages in documents:
+                ocr_pdf(body, pages, workers=workers, time_budget=None, mode=mode)
+            results.append((mode, workers, time.perf_counter() - start))
+
+    # Speed-ups are relative to the first mode with the first worker count
+    baseline = results[0][2]
+    print(f"\n{'mode':<9}{'workers':>8}{'seconds':>10}{'pages/sec':>12}{'speed-up':>10}")
+    for mode, workers, elapsed in results:
+        print(f"{mode:<9}{workers:>8}{elapsed:>10.2f}{n_pages / elapsed:>12.2f}{baseline / elapsed:>9.1f}x")
+
+    print(f"\nPeak RSS of this process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Report the memory cost and accuracy of quantized Memory indexes against the
+flat float32 baseline.
+
+For each index type, with and without exact re-ranking, it prints the bytes per
+vector held in RAM, the bytes per vector kept on disk for re-ranking, recall@k
+against exact flat search and the mean query latency. Vectors are synthetic and
+clustered by default, or read back from a saved index. No Ollama daemon is needed.
+Quantized layouts need MIN_TRAINING_VECTORS vectors to train, so smaller sets are refused.
+
+Usage:
+    python bench_quantization.py --vectors 100000 --dimension 384 --k 10
+    python bench_quantization.py --from-index faiss_db/faiss_index.bin
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from vector_db import MIN_TRAINING_VECTORS, Memory
+
+CONFIGS = [
+    ("flat", 0),
+    ("sq8", 0),
+    ("sq8", 4),
+    ("pq", 0),
+    ("pq", 4),
+    ("ivf_pq", 0),
+    ("ivf_pq", 4),
+]
+
+
+def synthetic_vectors(n_vectors, n_queries, dimension, seed=0):
+    """
+    Draw corpus and query vectors from the same mixture of Gaussian clusters, which
+    quantizes more like real embeddings than uniform noise does.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(n_vectors // 500, 8), dimension)).astype(np.float32)
+
+    def draw(count):
+        labels = rng.integers(len(centres), size=count)
+        return centres[labels] + 0.3 * rng.standard_normal((count, dimension), dtype=np.float32)
+
+    return draw(n_vectors), draw(n_queries)
+
+
+def index_vectors(index_filepath, n_queries, seed=0):
+    """
+    Read the vectors of a saved index and hold out some of them as queries.
+    """
+    memory = Memory(use_gpu=False, cache_path=None)
+    memory.index = faiss.read_index(index_filepath)
+    memory.dimension = memory.index.d
+    _, vectors = memory._reconstruct_all()
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    return vectors[order[n_queries:]], vectors[order[:n_queries]]
+
+
+def exact_neighbours(vectors, queries, k):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index.search(queries, k)[1]
+
+
+def measure(index_type, rerank_factor, vectors, queries, truth, k, pq_m):
+    memory = Memory(use_gpu=False, cache_path=None, index_type=index_type, rerank_factor=rerank_factor, pq_m=pq_m)
+    memory.add_vectors(vectors, [""] * len(vectors), [{}] * len(vectors))
+
+    ram_bytes = len(faiss.serialize_index(memory.index))
+    disk_bytes = len(memory.full_vectors) * vectors.shape[1] * 4 if memory.full_vectors is not None else 0
+
+    start = time.perf_counter()
+    hits = memory._vector_hits(queries, k)
+    elapsed = time.perf_counter() - start
+
+    found = sum(len(set(truth_row.tolist()) & {faiss_id for faiss_id, _ in hit_row}) for truth_row, hit_row in zip(truth, hits))
+    memory.close()
+    return {
+        "ram_bytes_per_vector": ram_bytes / len(vectors),
+        "disk_bytes_per_vector": disk_bytes / len(vectors),
+        "recall": found / (len(queries) * k),
+        "query_ms": 1000 * elapsed / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized index report")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Number of synthetic vectors")
+    parser.add_argument("--dimension", type=int, default=384, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query for recall@k")
+    parser.add_argument("--pq-m", type=int, default=48, help="Sub-quantizers for pq and ivf_pq")
+    parser.add_argument("--from-index", help="Use the vectors of a saved Faiss index instead of synthetic ones")
+    args = parser.parse_args()
+
+    if args.from_index:
+        vectors, queries = index_vectors(args.from_index, args.queries)
+    else:
+        vectors, queries = synthetic_vectors(args.vectors, args.queries, args.dimension)
+    if len(vectors) < MIN_TRAINING_VECTORS:
+        parser.error(f"{len(vectors)} vectors are too few: quantized indexes need {MIN_TRAINING_VECTORS} to train")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(args.k, len(vectors))
+    truth = exact_neighbours(vectors, queries, k)
+
+    rows = []
+    for index_type, rerank_factor in CONFIGS:
+        print(f"Building {index_type} (rerank x{rerank_factor}) with {len(vectors)} vectors...")
+        rows.append((index_type, rerank_factor, measure(index_type, rerank_factor, vectors, queries, truth, k, args.pq_m)))
+
+    print(f"\n{'index':<8}{'rerank':>8}{'RAM B/vec':>12}{'disk B/vec':>12}{f'recall@{k}':>12}{'ms/query':>10}")
+    for index_type, rerank_factor, result in rows:
+        print(
+            f"{index_type:<8}{rerank_factor or '-':>8}{result['ram_bytes_per_vector']:>12.1f}"
+            f"{result['disk_bytes_per_vector']:>12.1f}{result['recall']:>12.3f}{result['query_ms']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark Memory retrieval as the library grows.
+
+For each corpus size and index configuration it reports ingest throughput,
+index build time, p50/p99 search_memory latency, recall@k against exact search,
+resident memory and on-disk size. Texts are embedded with the deterministic
+HashingBackend, so results are reproducible offline, without an Ollama daemon,
+and comparable between releases: save a run with --json and pass it to a later
+run with --baseline to print the change.
+
+The corpus is synthetic Zipf-distributed text, or the chunks of the documents in
+static/uploads/lib_docs (repeated to reach sizes larger than the library). Each
+configuration is measured in a fresh process so RSS figures do not accumulate.
+Layouts that need training are skipped for sizes below MIN_TRAINING_VECTORS,
+which Memory refuses to build them with.
+
+Usage:
+    python bench_retrieval.py --sizes 1000,10000,50000
+    python bench_retrieval.py --corpus library --sizes 500,2000 --json run.json
+    python bench_retrieval.py --baseline run.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from embedding_backends import HashingBackend
+from vector_db import MIN_TRAINING_VECTORS, TRAINED_INDEX_TYPES, Memory
+
+CONFIGS = [
+    ("flat", 0),
+    ("hnsw", 0),
+    ("ivf_flat", 0),
+    ("sq8", 0),
+    ("sq8", 4),
+    ("ivf_pq", 4),
+]
+
+LIB_DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static/uploads/lib_docs")
+
+LEGAL_WORDS = [
+    "agreement", "judgment", "appeal", "contract", "tenancy", "lease", "court", "high",
+    "supreme", "constitution", "act", "section", "land", "employment", "company", "tax",
+    "uganda", "kenya", "tanzania", "rwanda", "petition", "ruling", "application", "loan",
+]
+
+
+def synthetic_corpus(size, seed=0, vocabulary=20_000):
+    """
+    Build documents of 50-180 words drawn from a Zipf distribution, like natural text.
+    """
+    rng = np.random.default_rng(seed)
+    words = LEGAL_WORDS + [f"w{i}" for i in range(vocabulary - len(LEGAL_WORDS))]
+    docs = []
+    for _ in range(size):
+        ids = np.minimum(rng.zipf(1.2, rng.integers(50, 181)), vocabulary) - 1
+        docs.append(" ".join(words[i] for i in ids))
+    return docs
+
+
+def library_corpus(size):
+    """
+    Extract and chunk the documents in lib_docs, repeating the chunks up to size.
+    """
+    from library_indexer import iter_document_chunks
+    chunks = []
+    for filename in sorted(os.listdir(LIB_DOCS_DIR)):
+        doc = {"doc_name": filename, "doc_url": f"/static/uploads/lib_docs/{filename}"}
+        chunks.extend(content for content, _ in iter_document_chunks(doc))
+    if not chunks:
+        raise SystemExit(f"No documents could be extracted from {LIB_DOCS_DIR}")
+    return [chunks[i % len(chunks)] for i in range(size)]
+
+
+def make_queries(docs, n_queries, seed=1):
+    """
+    Take a window of 4-10 consecutive words from randomly chosen documents.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(len(docs), size=n_queries):
+        words = docs[i].split()
+        length = int(rng.integers(4, 11))
+        start = int(rng.integers(max(len(words) - length, 0) + 1))
+        queries.append(" ".join(words[start:start + length]))
+    return queries
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def rss_mb():
+    """
+    Return (current, peak) resident memory in MB.
+    """
+    current = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return current, peak
+
+
+def measure(corpus_path, size, index_type, rerank_factor, dimension, n_queries, k, batch_size):
+    """
+    Runs in a child process: ingest size documents, build the index and query it.
+    """
+    with open(corpus_path) as f:
+        docs = json.load(f)[:size]
+    queries = make_queries(docs, n_queries)
+    backend = HashingBackend(dimension=dimension)
+
+    # Ingest into a flat index, as the library indexer does, then build the configured type
+    memory = Memory(use_gpu=False, cache_path=None, rerank_factor=rerank_factor, embedding_backend=backend)
+    start = time.perf_counter()
+    memory.add_memories(docs, vector_ids=[str(i) for i in range(len(docs))], batch_size=batch_size)
+    ingest_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    if index_type != "flat":
+        memory.rebuild_index(index_type)
+    build_seconds = time.perf_counter() - start
+
+    # Exact neighbours of every query over the same embeddings
+    vectors = backend.embed(docs)
+    query_vectors = backend.embed(queries)
+    truth = faiss.knn(query_vectors, vectors, k)[1]
+
+    latencies, found = [], 0
+    for query, truth_row in zip(queries, truth):
+        start = time.perf_counter()
+        results = memory.search_memory(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        found += len({int(result["id"]) for result in results} & set(truth_row.tolist()))
+    current_rss, peak_rss = rss_mb()
+
+    with tempfile.TemporaryDirectory() as directory:
+        memory.save_to_disk(os.path.join(directory, "faiss_index.bin"), os.path.join(directory, "metadata.db"))
+        disk_mb = directory_size(directory) / 1024 / 1024
+    memory.close()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "ingest_docs_per_second": len(docs) / ingest_seconds,
+        "build_seconds": build_seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "recall": found / (len(queries) * k),
+        "rss_mb": current_rss,
+        "peak_rss_mb": peak_rss,
+        "disk_mb": disk_mb,
+    }
+
+
+def config_name(index_type, rerank_factor):
+    return f"{index_type}+rerank{rerank_factor}" if rerank_factor else index_type
+
+
+def format_change(value, baseline):
+    if baseline is None or value is None or not baseline:
+        return ""
+    return f" ({100 * (value - baseline) / baseline:+.0f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory retrieval benchmark")
+    parser.add_argument("--corpus", choices=["synthetic", "library"], default="synthetic", help="Documents to index")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated corpus sizes, in documents")
+    parser.add_argument("--configs", help="Comma-separated configurations such as flat,hnsw,sq8+rerank4. All if omitted")
+    parser.add_argument("--dimension", type=int, default=384, help="Stub embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query for recall@k")
+    parser.add_argument("--batch-size", type=int, default=64, help="Batch size for add_memories")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        spec = json.loads(args.child)
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            result = measure(**spec)
+            sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    configs = CONFIGS
+    if args.configs:
+        names = args.configs.split(",")
+        configs = [(name.split("+rerank")[0], int(name.split("+rerank")[1]) if "+rerank" in name else 0) for name in names]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(row["size"], row["config"]): row for row in json.load(f)["results"]}
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.json")
+        print(f"Building a {args.corpus} corpus of {max(sizes)} documents...")
+        docs = synthetic_corpus(max(sizes)) if args.corpus == "synthetic" else library_corpus(max(sizes))
+        with open(corpus_path, "w") as f:
+            json.dump(docs, f)
+
+        for size in sizes:
+            for index_type, rerank_factor in configs:
+                name = config_name(index_type, rerank_factor)
+                if index_type in TRAINED_INDEX_TYPES and size < MIN_TRAINING_VECTORS:
+                    print(f"Skipping {name} with {size} documents: it needs {MIN_TRAINING_VECTORS} to train")
+                    continue
+                print(f"Measuring {name} with {size} documents...")
+                spec = {
+                    "corpus_path": corpus_path, "size": size, "index_type": index_type,
+                    "rerank_factor": rerank_factor, "dimension": args.dimension,
+                    "n_queries": args.queries, "k": args.k, "batch_size": args.batch_size,
+                }
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", json.dumps(spec)],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                rows.append({"size": size, "config": name, **json.loads(output.strip().splitlines()[-1])})
+
+    print(
+        f"\n{'docs':>8} {'config':<14}{'ingest/s':>10}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{f'recall@{args.k}':>11}{'RSS MB':>9}{'disk MB':>9}"
+    )
+    for row in rows:
+        previous = baseline.get((row["size"], row["config"]), {})
+        print(
+            f"{row['size']:>8} {row['config']:<14}{row['ingest_docs_per_second']:>10.0f}{row['build_seconds']:>9.2f}"
+            f"{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}{row['recall']:>11.3f}"
+            f"{row['rss_mb'] or 0:>9.1f}{row['disk_mb']:>9.1f}"
+        )
+        if previous:
+            print(
+                f"{'':>8} {'vs baseline':<14}"
+                f"{format_change(row['ingest_docs_per_second'], previous.get('ingest_docs_per_second')):>10}"
+                f"{format_change(row['build_seconds'], previous.get('build_seconds')):>9}"
+                f"{format_change(row['p50_ms'], previous.get('p50_ms')):>9}"
+                f"{format_change(row['p99_ms'], previous.get('p99_ms')):>9}"
+                f"{row['recall'] - previous.get('recall', row['recall']):>+11.3f}"
+                f"{format_change(row['rss_mb'], previous.get('rss_mb')):>9}"
+                f"{format_change(row['disk_mb'], previous.get('disk_mb')):>9}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus": args.corpus, "k": args.k, "dimension": args.dimension, "results": rows}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark server-startup cost of Memory.load_from_disk with eager loading against
+memory-mapped loading.
+
+A synthetic index of random vectors is written to a temporary directory, then each
+mode is measured in a fresh process: time to load, time to the first query and
+peak RSS. No Ollama daemon is needed.
+
+Usage:
+    python bench_startup.py --vectors 200000 --dimension 384
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from vector_db import Memory
+
+
+def build_index(directory, n_vectors, dimension, index_type):
+    memory = Memory(use_gpu=False, cache_path=None, index_type=index_type)
+    rng = np.random.default_rng(0)
+    for start in range(0, n_vectors, 50_000):
+        count = min(50_000, n_vectors - start)
+        vectors = rng.standard_normal((count, dimension), dtype=np.float32)
+        contents = [f"document {start + i}" for i in range(count)]
+        memory.add_vectors(vectors, contents, [{"doc_name": content} for content in contents])
+    index_path = os.path.join(directory, "faiss_index.bin")
+    metadata_path = os.path.join(directory, "metadata.db")
+    memory.save_to_disk(index_path, metadata_path)
+    return index_path, metadata_path
+
+
+def measure(index_path, metadata_path, use_mmap, dimension):
+    """
+    Runs in a child process so each mode starts from a cold interpreter.
+    """
+    start = time.perf_counter()
+    memory = Memory(use_gpu=False, cache_path=None)
+    memory.load_from_disk(index_path, metadata_path, use_mmap=use_mmap, use_wal=False)
+    loaded = time.perf_counter() - start
+
+    query = np.random.default_rng(1).standard_normal((1, dimension), dtype=np.float32)
+    memory.index.search(query, 5, params=memory._search_params()) # type: ignore
+    first_query = time.perf_counter() - start
+
+    result = {"load_seconds": loaded, "first_query_seconds": first_query}
+    result.update(memory_usage())
+    return result
+
+
+def memory_usage():
+    """
+    Split resident memory into private (anonymous) and shareable (file-backed) pages.
+
+    Memory-mapped index pages are file-backed, so every worker process mapping the
+    same file shares one copy of them.
+    """
+    usage = {"private_mb": None, "shared_file_mb": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    usage["private_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("RssFile:"):
+                    usage["shared_file_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        # Not Linux: fall back to peak RSS as the private figure
+        usage["private_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
+
+
+def format_mb(value):
+    return "n/a" if value is None else f"{value:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory startup benchmark")
+    parser.add_argument("--vectors", type=int, default=200_000, help="Number of synthetic vectors")
+    parser.add_argument("--dimension", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--index-type", default="flat", help="Index type to build")
+    parser.add_argument("--child", nargs=3, metavar=("INDEX", "METADATA", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        index_path, metadata_path, mode = args.child
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            result = measure(index_path, metadata_path, mode == "mmap", args.dimension)
+            sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Building a {args.index_type} index with {args.vectors} vectors...")
+        index_path, metadata_path = build_index(directory, args.vectors, args.dimension, args.index_type)
+        size_mb = (os.path.getsize(index_path) + os.path.getsize(metadata_path)) / 1024 / 1024
+        print(f"On-disk size: {size_mb:.1f} MB")
+
+        print(f"\n{'mode':<8}{'load s':>10}{'first query s':>16}{'private MB':>13}{'shared file MB':>17}")
+        for mode in ("eager", "mmap"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--dimension", str(args.dimension), "--child", index_path, metadata_path, mode],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<8}{result['load_seconds']:>10.3f}{result['first_query_seconds']:>16.3f}"
+                f"{format_mb(result['private_mb']):>13}{format_mb(result['shared_file_mb']):>17}"
+            )
+
+
+if __name__ == "__main__":
+    main()
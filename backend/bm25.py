@@ -0,0 +1,283 @@
+import io
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Largest term frequency a posting can hold
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+
+# Postings of removed documents, as a share of live documents, that trigger a merge
+MAX_DEAD_RATIO = 0.2
+
+def tokenize(text):
+    """
+    Split text into lowercase word tokens. Citation numbers such as "2019" or "71"
+    are kept as tokens of their own.
+    """
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+class BM25Index:
+    """
+    An inverted index scoring documents with Okapi BM25, keyed by Faiss ID.
+
+    Postings are kept in compressed-sparse-row form: one int64 array of document
+    IDs and one uint16 array of term frequencies for the whole vocabulary, sliced by
+    a per-term offset array. Documents added since the last merge go to small
+    per-term append buffers, and removed documents are filtered out at query time
+    until the next merge drops their postings. A query therefore only touches the
+    postings of its own terms.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        Create an empty index.
+
+        Args:
+            k1 (float): Term-frequency saturation.
+            b (float): Document-length normalisation.
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._terms = {}  # term -> term ID
+        self._offsets = np.zeros(1, dtype=np.int64)  # Merged postings of term t are ids[offsets[t]:offsets[t+1]]
+        self._ids = np.empty(0, dtype=np.int64)
+        self._tfs = np.empty(0, dtype=np.uint16)
+        self._delta = {}  # term ID -> (array of doc IDs, array of term frequencies) added since the last merge
+        self._doc_len = np.zeros(0, dtype=np.uint32)  # Token count per Faiss ID, 0 when absent
+        self._dead = set()  # Removed Faiss IDs whose postings have not been merged away yet
+        self.n_docs = 0
+        self.total_len = 0
+
+    def __len__(self):
+        return self.n_docs
+
+    def _grow(self, max_id):
+        if max_id >= len(self._doc_len):
+            doc_len = np.zeros(max(max_id + 1, 2 * len(self._doc_len)), dtype=np.uint32)
+            doc_len[:len(self._doc_len)] = self._doc_len
+            self._doc_len = doc_len
+
+    def _contains(self, doc_id):
+        return doc_id < len(self._doc_len) and self._doc_len[doc_id] > 0
+
+    def add(self, doc_ids, texts):
+        """
+        Index documents, replacing any already indexed under the same IDs.
+
+        Args:
+            doc_ids (list[int]): Faiss IDs of the documents.
+            texts (list[str]): Text of each document.
+        """
+        doc_ids = [int(i) for i in doc_ids]
+        if not doc_ids:
+            return
+        with self._lock:
+            self.remove([i for i in doc_ids if self._contains(i)])
+            # A reused ID must not pick up its old postings
+            if self._dead.intersection(doc_ids):
+                self._merge()
+            self._grow(max(doc_ids))
+            for doc_id, text in zip(doc_ids, texts):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                if length == 0:
+                    continue
+                for term, tf in counts.items():
+                    term_id = self._terms.setdefault(term, len(self._terms))
+                    postings = self._delta.get(term_id)
+                    if postings is None:
+                        postings = self._delta[term_id] = (array('q'), array('H'))
+                    postings[0].append(doc_id)
+                    postings[1].append(min(tf, MAX_TERM_FREQUENCY))
+                self._doc_len[doc_id] = length
+                self.n_docs += 1
+                self.total_len += length
+
+    def remove(self, doc_ids):
+        """
+        Remove documents from the index. Unknown IDs are ignored.
+        """
+        with self._lock:
+            for doc_id in doc_ids:
+                doc_id = int(doc_id)
+                if not self._contains(doc_id):
+                    continue
+                self.total_len -= int(self._doc_len[doc_id])
+                self.n_docs -= 1
+                self._doc_len[doc_id] = 0
+                self._dead.add(doc_id)
+            if len(self._dead) > MAX_DEAD_RATIO * max(self.n_docs, 1):
+                self._merge()
+
+    def _postings(self, term_id):
+        """
+        Return the (doc_ids, term_frequencies) arrays of one term, including removed documents.
+        """
+        ids, tfs = [], []
+        if term_id + 1 < len(self._offsets):
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            ids.append(self._ids[start:end])
+            tfs.append(self._tfs[start:end])
+        delta = self._delta.get(term_id)
+        if delta is not None:
+            # Copied: a view would keep add() from appending to the buffers while a search holds it
+            ids.append(np.frombuffer(delta[0], dtype=np.int64).copy())
+            tfs.append(np.frombuffer(delta[1], dtype=np.uint16).copy())
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint16)
+        if len(ids) == 1:
+            return ids[0], tfs[0]
+        return np.concatenate(ids), np.concatenate(tfs)
+
+    def _merge(self):
+        """
+        Fold the append buffers into the merged postings and drop removed documents.
+        """
+        n_terms = len(self._terms)
+        base_terms = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int64), np.diff(self._offsets))
+        terms = [base_terms]
+        ids = [self._ids]
+        tfs = [self._tfs]
+        for term_id, (delta_ids, delta_tfs) in self._delta.items():
+            terms.append(np.full(len(delta_ids), term_id, dtype=np.int64))
+            ids.append(np.frombuffer(delta_ids, dtype=np.int64))
+            tfs.append(np.frombuffer(delta_tfs, dtype=np.uint16))
+        terms, ids, tfs = np.concatenate(terms), np.concatenate(ids), np.concatenate(tfs)
+
+        if self._dead:
+            live = ~np.isin(ids, np.fromiter(self._dead, dtype=np.int64, count=len(self._dead)))
+            terms, ids, tfs = terms[live], ids[live], tfs[live]
+
+        order = np.argsort(terms, kind="stable")
+        terms = terms[order]
+        self._ids = ids[order]
+        self._tfs = tfs[order]
+        self._offsets = np.searchsorted(terms, np.arange(n_terms + 1, dtype=np.int64)).astype(np.int64)
+        self._delta = {}
+        self._dead = set()
+
+    def search(self, query, k=10, allowed_ids=None):
+        """
+        Score documents against a query.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            allowed_ids (np.ndarray, optional): Sorted Faiss IDs to restrict the search to.
+
+        Returns:
+            list[tuple]: (faiss_id, score) pairs, best first.
+        """
+        with self._lock:
+            if self.n_docs == 0:
+                return []
+            term_ids = [self._terms[t] for t in dict.fromkeys(tokenize(query)) if t in self._terms]
+            if not term_ids:
+                return []
+            avg_len = self.total_len / self.n_docs
+            doc_len = self._doc_len
+
+            hit_ids, hit_scores = [], []
+            for term_id in term_ids:
+                ids, tfs = self._postings(term_id)
+                lengths = doc_len[ids]
+                live = lengths > 0
+                if self._dead and not live.all():
+                    ids, tfs, lengths = ids[live], tfs[live], lengths[live]
+                if len(ids) == 0:
+                    continue
+                # Document frequency counts every live document, so filtering does not change scores
+                df = len(ids)
+                if allowed_ids is not None:
+                    allowed = np.isin(ids, allowed_ids, assume_unique=True)
+                    ids, tfs, lengths = ids[allowed], tfs[allowed], lengths[allowed]
+                    if len(ids) == 0:
+                        continue
+                idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+                tfs = tfs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths.astype(np.float32) / avg_len)
+                hit_ids.append(ids)
+                hit_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not hit_ids:
+            return []
+        ids, inverse = np.unique(np.concatenate(hit_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def renumber(self, doc_ids):
+        """
+        Give the documents with the given IDs the dense IDs 0..n-1, in the order given,
+        and drop every other document. Mirrors MetadataStore.renumber.
+
+        Args:
+            doc_ids (list[int]): Current Faiss IDs in ascending order.
+        """
+        with self._lock:
+            self._merge()
+            doc_ids = np.asarray(doc_ids, dtype=np.int64)
+            mapping = np.full(len(self._doc_len) + 1, -1, dtype=np.int64)
+            known = doc_ids[doc_ids < len(self._doc_len)]
+            mapping[known] = np.searchsorted(doc_ids, known)
+
+            new_ids = mapping[np.minimum(self._ids, len(self._doc_len))]
+            live = new_ids >= 0
+            terms = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int64), np.diff(self._offsets))[live]
+            self._ids, self._tfs = new_ids[live], self._tfs[live]
+            self._offsets = np.searchsorted(terms, np.arange(len(self._terms) + 1, dtype=np.int64)).astype(np.int64)
+
+            doc_len = np.zeros(len(doc_ids), dtype=np.uint32)
+            doc_len[np.searchsorted(doc_ids, known)] = self._doc_len[known]
+            self._doc_len = doc_len
+            self.n_docs = int(np.count_nonzero(doc_len))
+            self.total_len = int(doc_len.sum())
+
+    def save(self, path):
+        """
+        Merge pending changes and write the index to a file, atomically.
+        """
+        with self._lock:
+            self._merge()
+            buffer = io.BytesIO()
+            np.savez(
+                buffer,
+                terms=np.frombuffer("\n".join(self._terms).encode("utf-8"), dtype=np.uint8),
+                offsets=self._offsets,
+                ids=self._ids,
+                tfs=self._tfs,
+                doc_len=self._doc_len,
+                params=np.array([self.k1, self.b], dtype=np.float64)
+            )
+        with open(path + ".tmp", "wb") as f:
+            f.write(buffer.getbuffer())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by save.
+        """
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            terms = data["terms"].tobytes().decode("utf-8")
+            index._terms = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+            index._offsets = data["offsets"]
+            index._ids = data["ids"]
+            index._tfs = data["tfs"]
+            index._doc_len = data["doc_len"]
+        index.n_docs = int(np.count_nonzero(index._doc_len))
+        index.total_len = int(index._doc_len.sum())
+        return index
@@ -0,0 +1,510 @@
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from io import BytesIO
+import cv2
+import numpy as np
+import PyPDF2
+import pytesseract
+from docx import Document
+from pdf2image import convert_from_path
+from extraction_cache import DEFAULT_EXTRACTION_CACHE_PATH, ExtractionCache, content_hash
+
+SUPPORTED_EXTENSIONS = (".docx", ".pdf")
+
+# Processes reading PDF pages and OCRing scanned ones in parallel, one per core by default
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+
+# Seconds one document's OCR may take; pages not done by then are left out
+OCR_TIME_BUDGET_SECONDS = 300
+
+# Resolution scanned pages are rasterised at
+OCR_DPI = 200
+
+# Most pages one OCR task rasterises at once, which bounds each worker's memory
+OCR_MAX_PAGES_PER_TASK = 4
+
+# Pages whose text layer one task reads
+TEXT_LAYER_PAGES_PER_TASK = 16
+
+# Alphanumeric characters a PDF page's text layer needs to be used instead of OCR
+MIN_PAGE_TEXT_CHARS = 20
+
+# How pages are read: "page" runs one layout-aware Tesseract pass per page,
+# "contour" runs Tesseract on every text block found by dilation
+OCR_MODES = ("page", "contour")
+OCR_MODE = os.getenv("OCR_MODE", "page")
+
+# Tesseract's fully automatic page segmentation, which finds blocks, paragraphs and lines
+OCR_PAGE_CONFIG = "--psm 3"
+
+# Extracted text is cached in SQLite by file hash; an empty path disables the cache.
+# The library indexer opens the same file, so the server and ingest share entries.
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", DEFAULT_EXTRACTION_CACHE_PATH)
+EXTRACTION_CACHE_MAX_ENTRIES = 5_000
+
+# Bump when a change to extraction alters its output, so cached text is not reused
+EXTRACTOR_VERSION = 2
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_inherited_from_parent = []
+
+def _reset_after_fork():
+    # A forked child, such as a pool worker, cannot use its parent's pool or SQLite
+    # connection, and a lock held by another parent thread at fork time would never
+    # be released. The parent's objects must not be closed in the child either, so
+    # they are kept referenced; forked processes exit with os._exit.
+    global _process_pool, _process_pool_lock, _extraction_cache, _extraction_cache_lock
+    _inherited_from_parent.extend([_process_pool, _extraction_cache])
+    _process_pool = None
+    _process_pool_lock = threading.Lock()
+    _extraction_cache = None
+    _extraction_cache_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_process_pool():
+    """
+    Return the process pool of OCR_WORKERS workers that reads PDF pages and OCRs
+    them for every extraction in this process, starting it on first use.
+
+    Workers are forked rather than spawned: a spawned worker re-imports the main
+    module, and main.py loads the vector database at import time. All of them are
+    forked at once, here, so a server that calls this before it loads Faiss, whose
+    OpenMP threads do not survive a fork, or starts its own threads, forks them
+    from a single-threaded process. Workers never start pools of their own.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("fork"))
+            _process_pool.submit(int).result()
+        return _process_pool
+
+def _ocr_page_contours(gray) -> str:
+    """
+    OCR one page image, block by block.
+
+    Text blocks are found by dilating the thresholded page until the words of a
+    block merge, and each block's bounding box is read with Tesseract. Each block
+    starts a Tesseract process, so dense pages are slow.
+    """
+    # Performing OTSU threshold
+    ret, thresh1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)
+
+    # Specify structure shape and kernel size. 
+    # Kernel size increases or decreases the area 
+    # of the rectangle to be detected.
+    # A smaller value like (10, 10) will detect 
+    # each word instead of a sentence.
+    rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (18, 18))
+
+    # Applying dilation on the threshold image
+    dilation = cv2.dilate(thresh1, rect_kernel, iterations = 1)
+
+    # Finding contours
+    contours, hierarchy = cv2.findContours(dilation, cv2.RETR_EXTERNAL, 
+                                                    cv2.CHAIN_APPROX_NONE)
+
+    text = ""
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+
+        # Cropping the text block for giving input to OCR
+        cropped = gray[y:y + h, x:x + w]
+        text += pytesseract.image_to_string(cropped)
+    return text
+
+def _ocr_page_layout(gray) -> str:
+    """
+    OCR one page image in a single Tesseract pass.
+
+    Tesseract segments the page itself and reports every word with its block,
+    paragraph, line and word numbers; the text is rebuilt from those in its reading
+    order, with a line break per line and a blank line between paragraphs.
+    """
+    data = pytesseract.image_to_data(gray, config=OCR_PAGE_CONFIG, output_type=pytesseract.Output.DICT)
+    lines = {}  # (block, paragraph, line) -> [(word number, word)]
+    for i, word in enumerate(data["text"]):
+        # Level 5 rows are words; the others describe the page, blocks, paragraphs and lines
+        if int(data["level"][i]) != 5 or not word or not word.strip():
+            continue
+        key = (int(data["block_num"][i]), int(data["par_num"][i]), int(data["line_num"][i]))
+        lines.setdefault(key, []).append((int(data["word_num"][i]), word.strip()))
+
+    text = ""
+    paragraph = None
+    for key in sorted(lines):
+        if paragraph is not None and key[:2] != paragraph:
+            text += "\n"
+        paragraph = key[:2]
+        text += " ".join(word for _, word in sorted(lines[key])) + "\n"
+    return text
+
+def ocr_page(gray, mode=None) -> str:
+    """
+    OCR one page image.
+
+    Args:
+        gray (np.ndarray): The page as an 8-bit grayscale image.
+        mode (str, optional): One of OCR_MODES. Defaults to OCR_MODE.
+
+    Raises:
+        ValueError: If the mode is unsupported.
+    """
+    mode = mode or OCR_MODE
+    if mode == "page":
+        return _ocr_page_layout(gray)
+    if mode == "contour":
+        return _ocr_page_contours(gray)
+    raise ValueError(f"Unsupported OCR mode '{mode}'. Expected one of {OCR_MODES}.")
+
+def _iter_parallel(fn, task_args, workers, deadline):
+    """
+    Run fn over task_args, in the shared process pool unless workers is 1, and yield
+    each result in task order as soon as it and the ones before it are done.
+
+    At most two tasks per worker run ahead of the consumer, so results do not pile
+    up behind a slow one, and concurrent extractions share the pool instead of
+    each taking all of it. Stops at the first task not done by the deadline, a
+    time.monotonic() value, and drops the queued tasks; running ones finish in the
+    background.
+
+    Yields:
+        tuple: (task index, result).
+    """
+    if workers == 1 or len(task_args) == 1:
+        for i, args in enumerate(task_args):
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f"OCR time budget exhausted with {len(task_args) - i} of {len(task_args)} tasks left")
+                return
+            yield i, fn(*args)
+        return
+
+    pool = get_process_pool()
+    futures = {}
+    submitted = 0
+    try:
+        for i in range(len(task_args)):
+            while submitted < min(len(task_args), i + 2 * workers):
+                futures[submitted] = pool.submit(fn, *task_args[submitted])
+                submitted += 1
+            timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            try:
+                result = futures[i].result(timeout=timeout)
+            except FuturesTimeoutError:
+                print(f"OCR time budget exhausted with {len(task_args) - i} of {len(task_args)} tasks left")
+                return
+            del futures[i]
+            yield i, result
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+def _ocr_page_range(pdf_path, first_page, last_page, dpi=OCR_DPI, mode=None):
+    """
+    Rasterise a range of PDF pages straight into grayscale arrays and OCR them.
+    """
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page, grayscale=True)
+    return [ocr_page(np.asarray(image), mode) for image in images]
+
+def _page_ranges(page_numbers, per_task):
+    """
+    Group sorted page numbers into runs of consecutive pages at most per_task long.
+
+    Returns:
+        list[tuple]: (first page, last page) of each run.
+    """
+    ranges = []
+    for page in page_numbers:
+        if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < per_task:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+def _check_ocr_mode(mode):
+    mode = mode or OCR_MODE
+    if mode not in OCR_MODES:
+        raise ValueError(f"Unsupported OCR mode '{mode}'. Expected one of {OCR_MODES}.")
+    return mode
+
+def _iter_ocr_file(pdf_path, page_numbers, workers, deadline, dpi, mode):
+    """
+    OCR pages of a PDF file on disk, yielding (page number, text) in page order as
+    the pages are read. Stops at the first page not done by the deadline.
+    """
+    page_numbers = sorted(set(page_numbers))
+    if not page_numbers:
+        return
+    # At least two runs per worker keeps the workers evenly loaded
+    per_task = max(1, min(OCR_MAX_PAGES_PER_TASK, math.ceil(len(page_numbers) / (2 * workers))))
+    ranges = _page_ranges(page_numbers, per_task)
+    task_args = [(pdf_path, first, last, dpi, mode) for first, last in ranges]
+    for i, range_texts in _iter_parallel(_ocr_page_range, task_args, workers, deadline):
+        first, last = ranges[i]
+        yield from zip(range(first, last + 1), range_texts)
+
+def ocr_pdf(
+        file_body: bytes,
+        page_numbers,
+        workers=None,
+        time_budget=OCR_TIME_BUDGET_SECONDS,
+        dpi=OCR_DPI,
+        mode=None
+    ):
+    """
+    OCR pages of a PDF, rasterising and reading them a few pages at a time.
+
+    The pages are split into runs of at most OCR_MAX_PAGES_PER_TASK consecutive
+    pages, and each worker rasterises its own run from a temporary copy of the PDF,
+    so no process holds more than one run of page images however long the document
+    is, and page images never go through disk.
+
+    Args:
+        file_body (bytes): The PDF file.
+        page_numbers (iterable[int]): The 1-based numbers of the pages to OCR, e.g. range(1, page_count + 1).
+        workers (int, optional): Number of pool workers the document may keep busy. Defaults to OCR_WORKERS.
+        time_budget (float, optional): Seconds to wait for the whole document. No limit if None.
+        dpi (int): Rasterisation resolution.
+        mode (str, optional): One of OCR_MODES. Defaults to OCR_MODE.
+
+    Returns:
+        dict[int, str]: The text of each requested page. Pages not done in time are left out.
+
+    Raises:
+        ValueError: If the mode is unsupported.
+    """
+    mode = _check_ocr_mode(mode)
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(file_body)
+        return dict(_iter_ocr_file(pdf_path, page_numbers, workers or OCR_WORKERS, deadline, dpi, mode))
+    finally:
+        os.remove(pdf_path)
+
+def get_extraction_cache():
+    """
+    Return the extraction cache shared by everything in this process, opening it
+    on first use, or None if EXTRACTION_CACHE_PATH is empty.
+    """
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None and EXTRACTION_CACHE_PATH:
+            _extraction_cache = ExtractionCache(EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_ENTRIES)
+        return _extraction_cache
+
+def extractor_key(filename, ocr_mode=None):
+    """
+    Describe the settings that shape extracted text, so cached text from other settings is not reused.
+    """
+    return f"v{EXTRACTOR_VERSION}:{os.path.splitext(filename)[1].lower()}:{ocr_mode or OCR_MODE}:{MIN_PAGE_TEXT_CHARS}"
+
+def has_text_layer(text: str) -> bool:
+    """
+    Whether a page's extracted text is usable, rather than empty or the stray
+    characters a scanned page's text layer often holds, such as a page number.
+    """
+    return sum(c.isalnum() for c in text) >= MIN_PAGE_TEXT_CHARS
+
+def _iter_docx_segments(file_body):
+    document = Document(BytesIO(file_body))
+    for i, paragraph in enumerate(document.paragraphs):
+        yield paragraph.text, {"page": None, "paragraph": i, "source": "docx"}
+
+def _read_text_layers(pdf_path, filename, first_page, last_page):
+    """
+    Read the text layer of a range of PDF pages. A page that cannot be read gets an empty one.
+    """
+    reader = PyPDF2.PdfReader(pdf_path)
+    texts = []
+    for page_number in range(first_page, last_page + 1):
+        try:
+            texts.append(reader.pages[page_number - 1].extract_text() or "")
+        except Exception as e:
+            print(f"Error reading the text layer of page {page_number} of {filename}: {e}")
+            texts.append("")
+    return texts
+
+def _iter_pdf_segments(filename, file_body, ocr_workers, ocr_time_budget, ocr_mode):
+    """
+    Yield the pages of a PDF, reading the text layer a range of pages at a time and
+    OCRing runs of pages without one as they are reached, both in the shared
+    process pool.
+    """
+    workers = ocr_workers or OCR_WORKERS
+    mode = _check_ocr_mode(ocr_mode)
+    deadline = time.monotonic() + ocr_time_budget if ocr_time_budget is not None else None
+    # Scanned pages are OCRed in runs of this many, so the workers stay busy
+    run_limit = 2 * workers * OCR_MAX_PAGES_PER_TASK
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    text_layers = None
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(file_body)
+        page_count = len(PyPDF2.PdfReader(pdf_path).pages)
+        ranges = [
+            (first, min(first + TEXT_LAYER_PAGES_PER_TASK - 1, page_count))
+            for first in range(1, page_count + 1, TEXT_LAYER_PAGES_PER_TASK)
+        ]
+        run = {}  # page number -> text layer of scanned pages waiting for OCR
+
+        def ocr_run():
+            print(f"OCRing pages {min(run)}-{max(run)} of {filename}")
+            for page_number, text in _iter_ocr_file(pdf_path, run, workers, deadline, OCR_DPI, mode):
+                layer_text = run.pop(page_number)
+                # Keep whatever the text layer had if OCR found less
+                if sum(c.isalnum() for c in layer_text) > sum(c.isalnum() for c in text):
+                    text = layer_text
+                yield text, {"page": page_number, "paragraph": None, "source": "ocr"}
+            # Pages left once the time budget ran out
+            for page_number, layer_text in sorted(run.items()):
+                yield layer_text, {"page": page_number, "paragraph": None, "source": "ocr_timed_out"}
+            run.clear()
+
+        # Text layers are read without a deadline; the time budget is OCR's
+        text_layers = _iter_parallel(
+            _read_text_layers, [(pdf_path, filename, first, last) for first, last in ranges], workers, None
+        )
+        for i, texts in text_layers:
+            for page_number, text in enumerate(texts, start=ranges[i][0]):
+                if not has_text_layer(text):
+                    run[page_number] = text
+                    if len(run) < run_limit:
+                        continue
+                if run:
+                    yield from ocr_run()
+                if has_text_layer(text):
+                    yield text, {"page": page_number, "paragraph": None, "source": "text_layer"}
+        if run:
+            yield from ocr_run()
+    except Exception as e:
+        print(f"Error reading PDF file {filename}: {e}")
+        raise ValueError(f"Could not read PDF file {filename}.") from e
+    finally:
+        if text_layers is not None:
+            text_layers.close()
+        os.remove(pdf_path)
+
+def iter_segments_uncached(
+        filename: str,
+        file_body: bytes,
+        ocr_workers: int = None, # type: ignore
+        ocr_time_budget: float = OCR_TIME_BUDGET_SECONDS,
+        ocr_mode: str = None # type: ignore
+    ):
+    """
+    Yield the segments of a file as they are extracted, without consulting the
+    extraction cache; see iter_segments.
+    """
+    if filename.lower().endswith(".docx"):
+        segments = _iter_docx_segments(file_body)
+    elif filename.lower().endswith(".pdf"):
+        segments = _iter_pdf_segments(filename, file_body, ocr_workers, ocr_time_budget, ocr_mode)
+    else:
+        raise ValueError(f"Unsupported file type: {filename}. Only .docx and .pdf are supported.")
+    offset = 0
+    for text, position in segments:
+        yield text, {**position, "offset": offset}
+        offset += len(text) + 1
+
+def extract_segments_uncached(
+        filename: str,
+        file_body: bytes,
+        ocr_workers: int = None, # type: ignore
+        ocr_time_budget: float = OCR_TIME_BUDGET_SECONDS,
+        ocr_mode: str = None # type: ignore
+    ):
+    """
+    Extract every segment of a file without consulting the extraction cache.
+
+    Returns:
+        tuple: (segments, complete), where complete is False if OCR ran out of time.
+    """
+    segments = list(iter_segments_uncached(filename, file_body, ocr_workers, ocr_time_budget, ocr_mode))
+    return segments, all(position["source"] != "ocr_timed_out" for _, position in segments)
+
+def iter_segments(
+        filename: str,
+        file_body: bytes,
+        ocr_workers: int = None, # type: ignore
+        ocr_time_budget: float = OCR_TIME_BUDGET_SECONDS,
+        ocr_mode: str = None, # type: ignore
+        use_cache: bool = True
+    ):
+    """
+    Extract the text of a docx or pdf file, yielding it a segment at a time as it is
+    extracted, so chunking and embedding can start before the document is done.
+
+    Word documents yield one segment per paragraph. PDFs yield one per page: pages
+    with a usable text layer (see has_text_layer) as they are read, and pages
+    without one in runs as they are OCRed, so typed documents with scanned annexes
+    keep both and only one run of OCR results is held at a time.
+
+    A file seen before, by the server or by the library indexer, is replayed from
+    the shared extraction cache, keyed by a hash of the file bytes; a fully
+    consumed extraction is added to it unless OCR ran out of time.
+
+    Args:
+        filename (str): The file name; its extension selects the format.
+        file_body (bytes): The file.
+        ocr_workers, ocr_time_budget, ocr_mode: See ocr_pdf.
+        use_cache (bool): Whether to read and fill the extraction cache.
+
+    Yields:
+        tuple: (text, position), where position holds the segment's 1-based page
+        number (None in Word documents), its paragraph index (None in PDFs), its
+        character offset in the text extract_text returns, and its source:
+        "docx", "text_layer", "ocr", or "ocr_timed_out" for scanned pages OCR did
+        not reach within the time budget.
+
+    Raises:
+        ValueError: If the file type is unsupported or the PDF cannot be read.
+    """
+    cache = get_extraction_cache() if use_cache else None
+    if cache is None:
+        yield from iter_segments_uncached(filename, file_body, ocr_workers, ocr_time_budget, ocr_mode)
+        return
+
+    digest = content_hash(file_body)
+    extractor = extractor_key(filename, ocr_mode)
+    segments = cache.get(digest, extractor)
+    if segments is not None:
+        yield from segments
+        return
+
+    segments = []
+    for segment in iter_segments_uncached(filename, file_body, ocr_workers, ocr_time_budget, ocr_mode):
+        segments.append(segment)
+        yield segment
+    if all(position["source"] != "ocr_timed_out" for _, position in segments):
+        cache.put(digest, extractor, segments)
+
+def extract_text(
+        filename: str,
+        file_body: bytes,
+        ocr_workers: int = None, # type: ignore
+        ocr_time_budget: float = OCR_TIME_BUDGET_SECONDS,
+        ocr_mode: str = None # type: ignore
+    ) -> str:
+    """
+    Extracts text content from docx or pdf file data.
+    Employ OCD processing for the scanned pages of pdf files.
+
+    The text of all segments is joined; use iter_segments to keep page numbers or
+    to consume the text while it is extracted.
+
+    Raises:
+        ValueError: If the file type is unsupported or the PDF cannot be read.
+    """
+    return " ".join(text for text, _ in iter_segments(filename, file_body, ocr_workers, ocr_time_budget, ocr_mode))
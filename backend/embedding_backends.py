@@ -0,0 +1,293 @@
+import threading
+import time
+import zlib
+import numpy as np
+import ollama
+from bm25 import tokenize
+
+DEFAULT_OLLAMA_MODEL = "all-minilm:latest"
+
+# The model Ollama serves as all-minilm, for running it in-process
+DEFAULT_SENTENCE_TRANSFORMER_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Names accepted by create_backend, e.g. from the EMBEDDING_BACKEND environment variable
+BACKEND_NAMES = ("ollama", "sentence-transformers", "onnx", "hashing")
+
+class EmbeddingBackend:
+    """
+    Turns batches of texts into embedding vectors.
+
+    embed() splits its input into batches of at most max_batch_size texts and lets
+    at most max_concurrency batches run at once across all threads, so one backend
+    shared by several Memory objects cannot overload the model behind it.
+    Subclasses implement _embed_batch, and key_for if they can embed with a model
+    other than their own.
+    """
+
+    # Identifies the vector space in the embedding cache; backends that produce
+    # interchangeable vectors must share it, all others must not
+    model_key = None
+
+    def __init__(self, max_batch_size=64, max_concurrency=4):
+        """
+        Args:
+            max_batch_size (int): Largest number of texts sent to the model in one call.
+            max_concurrency (int, optional): Largest number of calls in flight at once. Unlimited if None.
+        """
+        self._lock = threading.Lock()
+        self.set_limits(max_batch_size, max_concurrency)
+        self.calls = 0
+        self.texts = 0
+        self.seconds = 0.0
+
+    def set_limits(self, max_batch_size, max_concurrency):
+        """
+        Change the batch size and concurrency limits. Calls already waiting keep the old limit.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def key_for(self, model=None):
+        """
+        Return the model_key of the embeddings produced with the given model.
+
+        Args:
+            model (str, optional): A model to use instead of the backend's own.
+
+        Raises:
+            ValueError: If the backend cannot embed with that model.
+        """
+        if model is not None and model != self.model_key:
+            raise ValueError(f"{type(self).__name__} cannot embed with model '{model}'.")
+        return self.model_key
+
+    def _embed_batch(self, texts, model):
+        raise NotImplementedError
+
+    def _run_batch(self, texts, model):
+        slots = self._slots
+        if slots is not None:
+            slots.acquire()
+        start = time.perf_counter()
+        try:
+            vectors = np.asarray(self._embed_batch(texts, model), dtype=np.float32)
+        finally:
+            if slots is not None:
+                slots.release()
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise Exception(f"{type(self).__name__} returned {len(vectors)} embeddings for {len(texts)} texts.")
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+            self.seconds += time.perf_counter() - start
+        return vectors
+
+    def embed(self, texts, model=None):
+        """
+        Embed texts.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            model (str, optional): A model to use instead of the backend's own.
+
+        Returns:
+            np.ndarray: A float32 matrix with one embedding per row.
+        """
+        texts = list(texts)
+        self.key_for(model)
+        batches = [
+            self._run_batch(texts[start:start + self.max_batch_size], model)
+            for start in range(0, len(texts), self.max_batch_size)
+        ]
+        return np.vstack(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+    def embed_keyed(self, texts, model=None):
+        """
+        Embed texts and report which vector space the embeddings belong to.
+
+        Returns:
+            tuple: (embeddings, model_key).
+        """
+        return self.embed(texts, model), self.key_for(model)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "model": self.model_key,
+                "calls": self.calls,
+                "texts": self.texts,
+                "mean_batch_ms": 1000 * self.seconds / self.calls if self.calls else 0.0,
+            }
+
+class OllamaBackend(EmbeddingBackend):
+    """
+    Embeds with a model served by the Ollama daemon.
+    """
+
+    def __init__(self, model=DEFAULT_OLLAMA_MODEL, host=None, timeout=None, max_batch_size=64, max_concurrency=4):
+        """
+        Args:
+            model (str): Name of the Ollama model.
+            host (str, optional): Ollama server URL. Defaults to the OLLAMA_HOST environment variable.
+            timeout (float, optional): Seconds to wait for the daemon before a call fails.
+        """
+        super().__init__(max_batch_size, max_concurrency)
+        self.model = model
+        self.model_key = model  # The key embeddings were cached under before backends were pluggable
+        self._client = ollama.Client(host=host, timeout=timeout) if host or timeout else None
+
+    def key_for(self, model=None):
+        return model or self.model_key
+
+    def _embed_batch(self, texts, model):
+        embed = self._client.embed if self._client is not None else ollama.embed
+        embeddings = embed(model or self.model, texts).embeddings
+        if embeddings is None:
+            raise Exception("Embeddings not found in Ollama's output.")
+        return embeddings
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Embeds in-process on the CPU with sentence-transformers, optionally through its
+    ONNX Runtime backend. No daemon is involved, so it also serves as a fallback
+    when Ollama is down.
+    """
+
+    def __init__(
+            self,
+            model=DEFAULT_SENTENCE_TRANSFORMER_MODEL,
+            device="cpu",
+            runtime="torch",
+            max_batch_size=64,
+            max_concurrency=1
+        ):
+        """
+        Args:
+            model (str): sentence-transformers model name or path.
+            device (str): Torch device to run on.
+            runtime (str): "torch" or "onnx".
+            max_concurrency (int): Calls in flight at once. One call already uses every core.
+
+        Raises:
+            ImportError: If sentence-transformers is not installed.
+        """
+        super().__init__(max_batch_size, max_concurrency)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("The sentence-transformers backend needs `pip install sentence-transformers`.") from e
+        kwargs = {"backend": runtime} if runtime != "torch" else {}
+        self._load = lambda name: SentenceTransformer(name, device=device, **kwargs)
+        self.model_name = model
+        self.model = self._load(model)
+        self.model_key = f"sentence-transformers:{model}"
+        self._other_models = {}  # Models loaded for a model override, by name
+
+    def key_for(self, model=None):
+        return f"sentence-transformers:{model}" if model else self.model_key
+
+    def _embed_batch(self, texts, model):
+        encoder = self.model
+        if model and model != self.model_name:
+            with self._lock:
+                if model not in self._other_models:
+                    self._other_models[model] = self._load(model)
+                encoder = self._other_models[model]
+        return encoder.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Embeds texts by hashing their word tokens into a fixed number of signed buckets.
+
+    It needs no model and is deterministic across processes, which makes it suited
+    to tests and to benchmarking ingest and search without a daemon. Similar texts
+    share buckets, but it captures no meaning beyond shared words.
+    """
+
+    def __init__(self, dimension=384, max_batch_size=1024, max_concurrency=None):
+        super().__init__(max_batch_size, max_concurrency)
+        self.dimension = dimension
+        self.model_key = f"hashing:{dimension}"
+
+    def _embed_batch(self, texts, model):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[row, h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class FallbackBackend(EmbeddingBackend):
+    """
+    Embeds with a primary backend and switches to a fallback when the primary fails,
+    retrying the primary after retry_after seconds.
+
+    Both backends must produce vectors in the same space, such as all-minilm through
+    Ollama and all-MiniLM-L6-v2 in-process, or searches mix incomparable vectors.
+    Fallback embeddings are reported under the fallback's model_key, so they are not
+    cached as the primary's.
+    """
+
+    def __init__(self, primary, fallback, retry_after=30.0):
+        super().__init__(max_batch_size=max(primary.max_batch_size, fallback.max_batch_size), max_concurrency=None)
+        self.primary = primary
+        self.fallback = fallback
+        self.retry_after = retry_after
+        self.model_key = primary.model_key
+        self._primary_down_until = 0.0
+        self.fallbacks = 0
+
+    def key_for(self, model=None):
+        return self.primary.key_for(model)
+
+    def embed_keyed(self, texts, model=None):
+        if time.monotonic() >= self._primary_down_until:
+            try:
+                return self.primary.embed(texts, model), self.primary.key_for(model)
+            except Exception as e:
+                print(f"{type(self.primary).__name__} failed ({e}); using {type(self.fallback).__name__} for {self.retry_after}s")
+                self._primary_down_until = time.monotonic() + self.retry_after
+        with self._lock:
+            self.fallbacks += 1
+        return self.fallback.embed(texts, model), self.fallback.key_for(model)
+
+    def embed(self, texts, model=None):
+        return self.embed_keyed(texts, model)[0]
+
+    def stats(self):
+        return {
+            "backend": type(self).__name__,
+            "model": self.model_key,
+            "fallbacks": self.fallbacks,
+            "primary": self.primary.stats(),
+            "fallback": self.fallback.stats(),
+        }
+
+def create_backend(spec="ollama", ollama_timeout=None):
+    """
+    Create a backend from a name in BACKEND_NAMES. "a+b" creates a FallbackBackend
+    that falls back from a to b, e.g. "ollama+onnx".
+
+    Args:
+        spec (str): The backend name(s).
+        ollama_timeout (float, optional): Seconds the Ollama backend waits for the daemon.
+    """
+    names = [name.strip() for name in spec.split("+")]
+    unknown = [name for name in names if name not in BACKEND_NAMES]
+    if unknown or not 1 <= len(names) <= 2:
+        raise ValueError(f"Unsupported embedding backend '{spec}'. Expected one of {BACKEND_NAMES}, or two joined by '+'.")
+
+    def create(name):
+        if name == "ollama":
+            return OllamaBackend(timeout=ollama_timeout)
+        if name == "sentence-transformers":
+            return SentenceTransformerBackend()
+        if name == "onnx":
+            return SentenceTransformerBackend(runtime="onnx")
+        return HashingBackend()
+
+    backends = [create(name) for name in names]
+    return backends[0] if len(backends) == 1 else FallbackBackend(*backends)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import numpy as np
+from sqlite_cache import SQLiteCache
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "faiss_db/embedding_cache.db")
+
+class EmbeddingCache(SQLiteCache):
+    """
+    A persistent, content-addressed cache of embedding vectors stored in SQLite.
+
+    Entries are keyed by the embedding model name plus a SHA-256 hash of the text,
+    capped at max_entries and evicted least-recently-used first.
+    """
+
+    TABLE = "embeddings"
+    SCHEMA = "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL"
+    COLUMNS = ("key", "vector")
+    KEY_COLUMNS = ("key",)
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=200_000):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Filepath of the SQLite cache database.
+            max_entries (int): Maximum number of embeddings kept before LRU eviction.
+        """
+        super().__init__(path, max_entries)
+
+    @staticmethod
+    def _key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """
+        Look up cached embeddings for several texts.
+
+        Args:
+            model (str): Name of the embedding model.
+            texts (list[str]): The texts to look up.
+
+        Returns:
+            list: One np.ndarray per text, or None where the text is not cached.
+        """
+        keys = [self._key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._touch((key,))
+                    results.append(np.frombuffer(blob, dtype=np.float32))
+        return results
+
+    def put_many(self, model, texts, vectors):
+        """
+        Store embeddings for several texts, evicting the least recently used entries if
+        the cache grows past max_entries.
+
+        Args:
+            model (str): Name of the embedding model.
+            texts (list[str]): The texts the vectors were generated from.
+            vectors (np.ndarray): A float32 matrix with one embedding per row.
+        """
+        rows = [
+            (self._key(model, text), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._put_rows(rows)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import zlib
+from sqlite_cache import SQLiteCache
+
+DEFAULT_EXTRACTION_CACHE_PATH = os.path.join(os.path.dirname(__file__), "faiss_db/extraction_cache.db")
+
+def content_hash(file_body: bytes) -> str:
+    """
+    Return the SHA-256 hex digest of a file's bytes.
+    """
+    return hashlib.sha256(file_body).hexdigest()
+
+class ExtractionCache(SQLiteCache):
+    """
+    A persistent, content-addressed cache of the text extracted from documents,
+    stored in SQLite.
+
+    Entries are keyed by a SHA-256 hash of the file bytes plus a description of
+    the extractor, so changing the OCR mode or the extraction code does not serve
+    stale text. Each entry holds every text segment of the document, with its
+    position, compressed. The cache is capped at max_entries and evicted
+    least-recently-used first.
+    """
+
+    TABLE = "extractions"
+    SCHEMA = (
+        "digest TEXT NOT NULL, extractor TEXT NOT NULL, segments BLOB NOT NULL, "
+        "last_used INTEGER NOT NULL, PRIMARY KEY (digest, extractor)"
+    )
+    COLUMNS = ("digest", "extractor", "segments")
+    KEY_COLUMNS = ("digest", "extractor")
+
+    def __init__(self, path=DEFAULT_EXTRACTION_CACHE_PATH, max_entries=5_000):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Filepath of the SQLite cache database.
+            max_entries (int): Maximum number of documents kept before LRU eviction.
+        """
+        super().__init__(path, max_entries)
+
+    def get(self, digest, extractor):
+        """
+        Look up the segments extracted from a file.
+
+        Args:
+            digest (str): content_hash of the file.
+            extractor (str): Description of the extractor settings the segments must come from.
+
+        Returns:
+            list: (text, position) tuples, or None if the file is not cached.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segments FROM extractions WHERE digest = ? AND extractor = ?", (digest, extractor)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch((digest, extractor))
+        return [tuple(segment) for segment in json.loads(zlib.decompress(row[0]))]
+
+    def put(self, digest, extractor, segments):
+        """
+        Store the segments extracted from a file, evicting the least recently used
+        entries if the cache grows past max_entries.
+
+        Args:
+            digest (str): content_hash of the file.
+            extractor (str): Description of the extractor settings.
+            segments (list[tuple]): (text, position) for each segment, as yielded by document_text.iter_segments.
+        """
+        blob = zlib.compress(json.dumps(segments).encode("utf-8"))
+        with self._lock:
+            self._put_rows([(digest, extractor, blob)])
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: Number of entries, their compressed size in MB, hits, misses, evictions and the hit rate.
+        """
+        with self._lock:
+            size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(segments)), 0) FROM extractions").fetchone()[0]
+        return {**super().stats(), "size_mb": size / 1024 / 1024}
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from document_text import (
+    OCR_TIME_BUDGET_SECONDS, OCR_WORKERS, extract_segments_uncached, extractor_key, get_extraction_cache,
+    get_process_pool
+)
+from extraction_cache import content_hash
+
+# Seconds of a job's timeout kept back from OCR, for reading the remaining text pages
+# and sending the segments back before the caller gives up. At most half the timeout.
+OCR_MARGIN_SECONDS = 10
+
+def _extract_job(filename, file_body, ocr_workers, ocr_deadline):
+    """
+    Run extract_segments_uncached on a job thread, OCRing until ocr_deadline.
+
+    The deadline is wall-clock time, set when the job was submitted, so time the
+    job spent queued for a thread comes out of its OCR budget.
+    """
+    return extract_segments_uncached(filename, file_body, ocr_workers, max(ocr_deadline - time.time(), 0))
+
+class ExtractionBusyError(Exception):
+    """
+    Raised when the extraction queue is full and a job is rejected instead of queued.
+    """
+
+class ExtractionExecutor:
+    """
+    An asyncio facade that extracts document text off the Tornado IOLoop.
+
+    Files are first looked up in the extraction cache, off the IOLoop; only misses
+    become jobs. Each job runs on one of max_workers threads, which hands PDF
+    parsing and OCR to document_text's process pool, so the jobs share one set of
+    forked workers instead of each forking its own.
+
+    Once max_queue jobs are waiting for a thread, new ones are rejected with
+    ExtractionBusyError rather than piling up, and a job's result is awaited for at
+    most timeout seconds. OCR inside a job stops OCR_MARGIN_SECONDS before then,
+    counting time spent queued, so a scan that uses its whole budget still returns
+    its partial text in time and the pool does not stay busy after its caller gave up.
+    """
+
+    def __init__(self, max_workers=2, max_queue=8, timeout=OCR_TIME_BUDGET_SECONDS):
+        """
+        Start the shared process pool, so its workers are forked before the caller
+        loads Faiss or starts threads of its own.
+
+        Args:
+            max_workers (int): Number of jobs run at once. Each keeps its share of OCR_WORKERS busy.
+            max_queue (int): Number of jobs that may wait for a thread before new jobs are rejected.
+            timeout (float): Default seconds a job may take, including time spent queued.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.ocr_workers = max(1, OCR_WORKERS // max_workers)
+        get_process_pool()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extraction")
+        self._lock = threading.Lock()
+        self._pending = 0  # Jobs submitted and not yet finished, queued or running
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._cache_hits = 0
+        self._job_seconds = 0.0
+        self._max_queue_depth = 0
+
+    def _queued(self):
+        return max(self._pending - self.max_workers, 0)
+
+    def _finished(self, future, start):
+        with self._lock:
+            self._pending -= 1
+            self._job_seconds += time.perf_counter() - start
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    async def extract_segments(self, filename, file_body, timeout=None):
+        """
+        Extract the text segments of a file, like document_text.iter_segments, but
+        return them all at once.
+
+        Raises:
+            ExtractionBusyError: If max_queue jobs are already waiting for a thread.
+            asyncio.TimeoutError: If the job does not finish in time.
+            ValueError: If the file type is unsupported or the PDF cannot be read.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        cache = get_extraction_cache()
+        if cache is not None:
+            # Hashing a large upload takes long enough to matter on the IOLoop
+            digest = await loop.run_in_executor(None, content_hash, file_body)
+            extractor = extractor_key(filename)
+            segments = await loop.run_in_executor(None, cache.get, digest, extractor)
+            if segments is not None:
+                with self._lock:
+                    self._cache_hits += 1
+                return segments
+
+        with self._lock:
+            queued = self._queued()
+            if queued >= self.max_queue:
+                self._rejected += 1
+                raise ExtractionBusyError(f"Document extraction queue is full ({queued} jobs waiting).")
+            self._pending += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued())
+        start = time.perf_counter()
+        ocr_deadline = time.time() + timeout - min(OCR_MARGIN_SECONDS, timeout / 2)
+        future = self._executor.submit(_extract_job, filename, file_body, self.ocr_workers, ocr_deadline)
+        future.add_done_callback(lambda f: self._finished(f, start))
+        try:
+            segments, complete = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # A job still queued is dropped; a running one stops OCRing at its time budget
+            future.cancel()
+            with self._lock:
+                self._timed_out += 1
+            raise
+
+        if cache is not None and complete:
+            await loop.run_in_executor(None, cache.put, digest, extractor, segments)
+        return segments
+
+    async def extract_text(self, filename, file_body, timeout=None):
+        """
+        Extract the text of a file, like document_text.extract_text. See extract_segments.
+        """
+        segments = await self.extract_segments(filename, file_body, timeout=timeout)
+        return " ".join(text for text, _ in segments)
+
+    def metrics(self):
+        """
+        Return queue-depth and throughput counters.
+
+        Returns:
+            dict: workers, queued (waiting for a thread), running, max_queue_depth,
+            completed, failed, rejected, timed_out, cache_hits and mean_job_ms.
+        """
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "workers": self.max_workers,
+                "queued": self._queued(),
+                "running": min(self._pending, self.max_workers),
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "cache_hits": self._cache_hits,
+                "mean_job_ms": 1000 * self._job_seconds / finished if finished else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
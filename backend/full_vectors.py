@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import numpy as np
+
+class FullVectorFile:
+    """
+    Full float32 copies of the vectors in a quantized index, kept on disk.
+
+    Row i of the file holds the vector with Faiss ID i, so rows are written and
+    read by ID with no lookup table. Reads go through a read-only memory map, so
+    only the pages of re-ranked candidates are brought into memory.
+    """
+
+    def __init__(self, dimension, path=None):
+        """
+        Open (or create) the vector file.
+
+        Args:
+            dimension (int): Vector dimension.
+            path (str, optional): Filepath of the vector file. A temporary file, deleted on close, if None.
+        """
+        self.dimension = dimension
+        self._row_bytes = dimension * np.dtype(np.float32).itemsize
+        self._lock = threading.RLock()
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".f32")
+            os.close(fd)
+        self.path = os.path.abspath(path)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._map = None
+
+    def __len__(self):
+        return os.fstat(self._fd).st_size // self._row_bytes
+
+    def write(self, faiss_ids, vectors):
+        """
+        Write vectors to the rows of their Faiss IDs, overwriting any previous ones.
+
+        Args:
+            faiss_ids (np.ndarray): Faiss IDs of the vectors.
+            vectors (np.ndarray): A float32 matrix with one vector per row.
+        """
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(faiss_ids) == 0:
+            return
+        with self._lock:
+            start = int(faiss_ids[0])
+            if np.array_equal(faiss_ids, np.arange(start, start + len(faiss_ids))):
+                # Consecutive IDs, as assigned by add_vectors, go out in one write
+                os.pwrite(self._fd, vectors.tobytes(), start * self._row_bytes)
+            else:
+                for faiss_id, vector in zip(faiss_ids, vectors):
+                    os.pwrite(self._fd, vector.tobytes(), int(faiss_id) * self._row_bytes)
+            self._map = None
+
+    def read(self, faiss_ids):
+        """
+        Read the vectors stored under the given Faiss IDs.
+
+        Returns:
+            np.ndarray: A float32 matrix with one vector per ID.
+        """
+        with self._lock:
+            rows = len(self)
+            if self._map is None or len(self._map) != rows:
+                self._map = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dimension)) if rows else None
+            if self._map is None:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            return np.asarray(self._map[np.asarray(faiss_ids, dtype=np.int64)])
+
+    def renumber(self, faiss_ids):
+        """
+        Rewrite the file so the vectors with the given Faiss IDs get rows 0..n-1, in the order given.
+        Mirrors MetadataStore.renumber.
+        """
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(faiss_ids), 65536):
+                    f.write(self.read(faiss_ids[start:start + 65536]).tobytes())
+            self._reopen(tmp_path, self.path)
+
+    def save_as(self, path, reopen=False):
+        """
+        Copy the file to path, flushed to stable storage. With reopen, continue working
+        against the copy; otherwise the copy is left untouched by later writes.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if path == self.path:
+                os.fsync(self._fd)
+                return
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                offset = 0
+                while True:
+                    data = os.pread(self._fd, 1 << 24, offset)
+                    if not data:
+                        break
+                    f.write(data)
+                    offset += len(data)
+            if not reopen:
+                with open(tmp_path, "rb+") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+                return
+            previous, temporary = self.path, self._temporary
+            self._reopen(tmp_path, path)
+            if temporary:
+                os.remove(previous)
+                self._temporary = False
+
+    def _reopen(self, tmp_path, path):
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        self._map = None
+        os.close(self._fd)
+        os.replace(tmp_path, path)
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR)
+
+    def close(self):
+        with self._lock:
+            self._map = None
+            os.close(self._fd)
+            if self._temporary and os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,401 @@
+import os
+import re
+import shutil
+import threading
+import time
+from metadata_store import DEFAULT_METADATA_PATH
+from vector_db import Memory
+
+FAISS_DB_DIR = os.path.join(os.path.dirname(__file__), "faiss_db")
+
+# The namespace stored at the original faiss_db/faiss_index.bin and metadata.db paths
+DEFAULT_NAMESPACE = "default"
+
+NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Versioned snapshots of a namespace live in snapshots/<version>/ under its directory,
+# and the CURRENT file names the one to load
+SNAPSHOTS_DIRNAME = "snapshots"
+CURRENT_FILENAME = "CURRENT"
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# Seconds a replaced Memory stays open for searches still running against it
+RETIRE_DELAY_SECONDS = 60
+
+class SnapshotVersions:
+    """
+    Creates and publishes the versions a namespace's Memory writes its changes to,
+    so the files of a published snapshot are never modified.
+    """
+
+    def __init__(self, manager, namespace):
+        self.manager = manager
+        self.namespace = namespace
+
+    def create(self):
+        """
+        Create an unpublished version and return its (index, metadata) filepaths.
+        """
+        return self.manager.paths(self.namespace, self.manager._create_version(self.namespace))
+
+    def publish(self, index_filepath, base_filepath):
+        """
+        Point CURRENT at a version saved by a checkpoint, unless CURRENT has moved on
+        from the snapshot it was based on, e.g. to one built offline.
+        """
+        version = os.path.basename(os.path.dirname(index_filepath))
+        if os.path.abspath(self.manager.paths(self.namespace)[0]) != os.path.abspath(base_filepath):
+            print(f"Namespace '{self.namespace}' snapshot '{version}' saved; CURRENT names a newer snapshot")
+            return
+        self.manager.set_current(self.namespace, version)
+        print(f"Namespace '{self.namespace}' snapshot '{version}' published")
+
+    def discard(self, index_filepath):
+        """
+        Delete an unpublished version.
+        """
+        shutil.rmtree(os.path.dirname(index_filepath), ignore_errors=True)
+
+class IndexManager:
+    """
+    Holds one Memory per namespace, so a query against one corpus searches only
+    that corpus's vectors. Namespaces are loaded from disk on first use.
+
+    A namespace can hold versioned snapshots, selected by the version named in its
+    CURRENT file. reload() loads another snapshot next to the serving one and swaps
+    the two with a single reference assignment, so queries keep being answered from
+    the old snapshot until the new one is ready. The files of a snapshot are never
+    modified: changes are logged next to it and checkpointed into a new version,
+    which then becomes CURRENT.
+    """
+
+    def __init__(
+            self,
+            root=FAISS_DB_DIR,
+            memory_factory=None,
+            use_mmap=True,
+            retire_delay=RETIRE_DELAY_SECONDS
+        ):
+        """
+        Args:
+            root (str): Directory holding the default namespace's files and a namespaces/ directory for the others.
+            memory_factory (callable, optional): Returns a new, empty Memory. Defaults to Memory(use_gpu=False).
+            use_mmap (bool): Whether namespaces are memory-mapped when loaded.
+            retire_delay (float): Seconds a Memory replaced by reload() stays open before it is closed.
+        """
+        self.root = root
+        self.memory_factory = memory_factory or (lambda: Memory(use_gpu=False))
+        self.use_mmap = use_mmap
+        self.retire_delay = retire_delay
+        self._memories = {}  # namespace -> Memory
+        self._load_locks = {}  # namespace -> lock serialising its load
+        self._lock = threading.Lock()
+        self._reload_listeners = []
+        self._retiring = {}  # threading.Timer -> the replaced Memory it will close
+
+    @staticmethod
+    def _validate(namespace):
+        if not isinstance(namespace, str) or not NAMESPACE_PATTERN.match(namespace):
+            raise ValueError(f"Invalid namespace '{namespace}'.")
+
+    def _directory(self, namespace):
+        self._validate(namespace)
+        if namespace == DEFAULT_NAMESPACE:
+            return self.root
+        return os.path.join(self.root, "namespaces", namespace)
+
+    def paths(self, namespace, version=None):
+        """
+        Return the (index, metadata) filepaths of a namespace.
+
+        Args:
+            namespace (str): The namespace.
+            version (str, optional): A snapshot version. Defaults to the one named by CURRENT,
+                or the unversioned files when the namespace has no CURRENT file.
+        """
+        directory = self._directory(namespace)
+        version = version or self.current_version(namespace)
+        if version is not None:
+            self._validate_version(version)
+            directory = os.path.join(directory, SNAPSHOTS_DIRNAME, version)
+        elif namespace == DEFAULT_NAMESPACE and os.path.abspath(self.root) == os.path.abspath(FAISS_DB_DIR):
+            return os.path.join(directory, "faiss_index.bin"), DEFAULT_METADATA_PATH
+        return os.path.join(directory, "faiss_index.bin"), os.path.join(directory, "metadata.db")
+
+    @staticmethod
+    def _validate_version(version):
+        if not isinstance(version, str) or not VERSION_PATTERN.match(version) or version.strip(".") == "":
+            raise ValueError(f"Invalid snapshot version '{version}'.")
+
+    def current_version(self, namespace):
+        """
+        Return the snapshot version named by a namespace's CURRENT file, or None if it has none.
+        """
+        try:
+            with open(os.path.join(self._directory(namespace), CURRENT_FILENAME)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_current(self, namespace, version):
+        """
+        Point a namespace's CURRENT file at a saved snapshot, atomically.
+
+        Raises:
+            KeyError: If the snapshot does not exist.
+        """
+        index_filepath, _ = self.paths(namespace, version)
+        if not os.path.exists(index_filepath):
+            raise KeyError(f"Snapshot '{version}' of namespace '{namespace}' not found.")
+        current_filepath = os.path.join(self._directory(namespace), CURRENT_FILENAME)
+        with open(current_filepath + ".tmp", "w") as f:
+            f.write(version + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_filepath + ".tmp", current_filepath)
+
+    def snapshots(self, namespace):
+        """
+        List the saved snapshot versions of a namespace, oldest first.
+        """
+        directory = os.path.join(self._directory(namespace), SNAPSHOTS_DIRNAME)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            version for version in os.listdir(directory)
+            if VERSION_PATTERN.match(version) and os.path.exists(os.path.join(directory, version, "faiss_index.bin"))
+        )
+
+    def save_snapshot(self, namespace, memory, version=None, activate=True):
+        """
+        Save a Memory as a new snapshot of a namespace.
+
+        Args:
+            namespace (str): The namespace.
+            memory (Memory): The memory to save, e.g. one rebuilt offline.
+            version (str, optional): The snapshot version. Defaults to the current UTC time.
+            activate (bool): Whether to point CURRENT at the new snapshot. A running server
+                keeps serving the old one until reload() is called.
+
+        Returns:
+            str: The version saved.
+        """
+        if version is None:
+            version = self._create_version(namespace)
+        index_filepath, metadata_filepath = self.paths(namespace, version)
+        if os.path.exists(index_filepath):
+            raise ValueError(f"Snapshot '{version}' of namespace '{namespace}' already exists.")
+        os.makedirs(os.path.dirname(index_filepath), exist_ok=True)
+        memory.save_to_disk(index_filepath, metadata_filepath)
+        if activate:
+            self.set_current(namespace, version)
+        print(f"Namespace '{namespace}' snapshot '{version}' saved")
+        return version
+
+    def _create_version(self, namespace):
+        """
+        Create the directory of a new snapshot version named after the current UTC time.
+
+        Returns:
+            str: The version created.
+        """
+        base = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        version, n = base, 1
+        while True:
+            try:
+                os.makedirs(os.path.dirname(self.paths(namespace, version)[0]))
+                return version
+            except FileExistsError:
+                version, n = f"{base}-{n}", n + 1
+
+    def prune_snapshots(self, namespace, keep=3):
+        """
+        Delete all but the newest keep snapshots of a namespace, never the current or a loaded one.
+
+        Returns:
+            list[str]: The deleted versions.
+        """
+        protected = {self.current_version(namespace)}
+        for memory in [self._memories.get(namespace), *self._retiring.values()]:
+            if memory is not None and memory._snapshot_paths is not None:
+                protected.add(os.path.basename(os.path.dirname(memory._snapshot_paths[0])))
+        versions = self.snapshots(namespace)
+        doomed = [version for version in versions[:max(len(versions) - keep, 0)] if version not in protected]
+        for version in doomed:
+            shutil.rmtree(os.path.dirname(self.paths(namespace, version)[0]))
+        return doomed
+
+    def exists(self, namespace):
+        """
+        Whether a namespace is loaded or saved on disk.
+        """
+        return namespace in self._memories or os.path.exists(self.paths(namespace)[0])
+
+    def namespaces(self):
+        """
+        List every namespace that is loaded or saved on disk.
+        """
+        names = set(self._memories)
+        if os.path.exists(self.paths(DEFAULT_NAMESPACE)[0]):
+            names.add(DEFAULT_NAMESPACE)
+        directory = os.path.join(self.root, "namespaces")
+        if os.path.isdir(directory):
+            names.update(
+                name for name in os.listdir(directory)
+                if NAMESPACE_PATTERN.match(name) and os.path.exists(self.paths(name)[0])
+            )
+        return sorted(names)
+
+    def loaded(self):
+        """
+        List the namespaces currently held in memory.
+        """
+        return sorted(self._memories)
+
+    def get(self, namespace, create=False):
+        """
+        Return the Memory of a namespace, loading it from disk on first use.
+
+        Args:
+            namespace (str): The namespace to open.
+            create (bool): Whether to create the namespace if it does not exist yet.
+
+        Raises:
+            KeyError: If the namespace does not exist and create is False.
+        """
+        self._validate(namespace)
+        memory = self._memories.get(namespace)
+        if memory is not None:
+            return memory
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(namespace, threading.Lock())
+        with load_lock:
+            memory = self._memories.get(namespace)
+            if memory is not None:
+                return memory
+
+            index_filepath, _ = self.paths(namespace)
+            if not os.path.exists(index_filepath) and not create:
+                raise KeyError(f"Namespace '{namespace}' not found.")
+            memory = self._load(namespace)
+
+            with self._lock:
+                self._memories[namespace] = memory
+            print(f"Namespace '{namespace}' loaded")
+            return memory
+
+    def _load(self, namespace, version=None):
+        """
+        Load a snapshot of a namespace into a new Memory, creating an empty one if it has none.
+        """
+        index_filepath, metadata_filepath = self.paths(namespace, version)
+        memory = self.memory_factory()
+        if not os.path.exists(index_filepath):
+            # Write an empty snapshot so the namespace gets a write-ahead log like any other
+            os.makedirs(os.path.dirname(index_filepath), exist_ok=True)
+            memory.save_to_disk(index_filepath, metadata_filepath)
+            print(f"Namespace '{namespace}' created")
+        versioned = (version or self.current_version(namespace)) is not None
+        memory.load_from_disk(
+            index_filepath, metadata_filepath, use_mmap=self.use_mmap,
+            versions=SnapshotVersions(self, namespace) if versioned else None
+        )
+        memory.start_checkpointing()
+        return memory
+
+    def add_reload_listener(self, listener):
+        """
+        Register listener(namespace, memory), called after reload() swaps in a new Memory,
+        for callers that hold on to a namespace's Memory.
+        """
+        self._reload_listeners.append(listener)
+
+    def reload(self, namespace, version=None):
+        """
+        Load a snapshot of a namespace and swap it in for the one being served.
+
+        The new snapshot is loaded while the old Memory keeps answering queries; the
+        swap is a single reference assignment. The old Memory is checkpointed and
+        closed retire_delay seconds later, once searches started against it are done.
+
+        Reloading the snapshot already being served does nothing: a second Memory on
+        the same files would share their write-ahead log, and retiring the first
+        would overwrite the snapshot and truncate the log under the second.
+
+        Args:
+            namespace (str): The namespace to reload.
+            version (str, optional): The snapshot to load, which becomes CURRENT once it has
+                loaded. Defaults to the version CURRENT names now.
+
+        Returns:
+            Memory: The Memory now serving the namespace.
+        """
+        index_filepath, metadata_filepath = self.paths(namespace, version)
+        if not os.path.exists(index_filepath):
+            raise KeyError(f"Snapshot '{version or self.current_version(namespace)}' of namespace '{namespace}' not found.")
+        with self._lock:
+            load_lock = self._load_locks.setdefault(namespace, threading.Lock())
+        with load_lock:
+            serving = self._memories.get(namespace)
+            if serving is not None and serving._snapshot_paths == (
+                    os.path.abspath(index_filepath), os.path.abspath(metadata_filepath)):
+                if version is not None:
+                    self.set_current(namespace, version)
+                print(f"Namespace '{namespace}' is already serving {index_filepath}")
+                return serving
+            memory = self._load(namespace, version)
+            if version is not None:
+                self.set_current(namespace, version)
+            with self._lock:
+                old = self._memories.get(namespace)
+                self._memories[namespace] = memory
+        print(f"Namespace '{namespace}' reloaded from {index_filepath}")
+
+        for listener in self._reload_listeners:
+            try:
+                listener(namespace, memory)
+            except Exception as e:
+                print(f"Error notifying reload listener: {e}")
+        if old is not None and old is not memory:
+            self._retire(old)
+        return memory
+
+    def _retire(self, memory):
+        """
+        Checkpoint and close a replaced Memory after retire_delay seconds.
+        """
+        memory.stop_checkpointing()
+
+        def close():
+            self._retiring.pop(timer, None)
+            try:
+                # Never checkpoint over files a Memory still being served has open
+                shared = any(
+                    other is not memory and other._snapshot_paths == memory._snapshot_paths
+                    for other in list(self._memories.values())
+                )
+                if memory.wal is not None and memory.wal.pending and not shared:
+                    memory.checkpoint()
+            finally:
+                memory.close()
+
+        timer = threading.Timer(self.retire_delay, close)
+        timer.daemon = True
+        self._retiring[timer] = memory
+        timer.start()
+
+    def close(self):
+        """
+        Close every loaded namespace.
+        """
+        for timer in list(self._retiring):
+            timer.cancel()
+            timer.function()
+        for namespace in list(self._memories):
+            memory = self._memories.pop(namespace)
+            try:
+                if memory.wal is not None and memory.wal.pending:
+                    memory.checkpoint()
+            finally:
+                memory.close()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+from document_text import SUPPORTED_EXTENSIONS, iter_segments
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Where UploadDriveDocumentHandler writes files, relative to the server's working directory
+UPLOAD_DIR = './uploads'
+
+# Chunk sizes are in words; all-minilm truncates its input at 256 word pieces
+CHUNK_WORDS = 180
+CHUNK_OVERLAP_WORDS = 40
+
+def chunk_pages(pages, chunk_words: int = CHUNK_WORDS, overlap_words: int = CHUNK_OVERLAP_WORDS):
+    """
+    Split the text of numbered pages into overlapping chunks of words and report
+    the pages each chunk spans. Chunks run across page breaks.
+
+    Pages are consumed as the chunks are, so only one chunk's worth of words is
+    held at a time and chunks of a document still being extracted come out early.
+
+    Args:
+        pages (iterable[tuple]): (page number, text) pairs, e.g. from the segments of iter_segments.
+
+    Yields:
+        tuple: (chunk, first page, last page). The page numbers are None for unpaginated documents.
+    """
+    words, word_pages = [], []
+    step = max(1, chunk_words - overlap_words)
+    for page_number, text in pages:
+        page_words = text.split()
+        words.extend(page_words)
+        word_pages.extend([page_number] * len(page_words))
+        # A chunk is final once words follow it; the last chunk waits for the end of the text
+        while len(words) > chunk_words:
+            yield " ".join(words[:chunk_words]), word_pages[0], word_pages[chunk_words - 1]
+            del words[:step], word_pages[:step]
+    if words:
+        yield " ".join(words), word_pages[0], word_pages[-1]
+
+def resolve_doc_path(doc_url: str) -> str:
+    """
+    Map a library doc_url such as /static/uploads/lib_docs/<uuid>.pdf to its file on disk.
+
+    Drive uploads are listed under /static/uploads/ but written to UPLOAD_DIR, so a
+    file missing from the static tree is looked up there by name.
+    """
+    path = os.path.join(BACKEND_DIR, doc_url.lstrip('/'))
+    if not os.path.exists(path):
+        uploaded = os.path.join(os.path.abspath(UPLOAD_DIR), os.path.basename(doc_url))
+        if os.path.exists(uploaded):
+            return uploaded
+    return path
+
+def document_version(doc: dict) -> str:
+    """
+    Fingerprint a library record and its file, so edits to either are picked up.
+    """
+    path = resolve_doc_path(doc["doc_url"])
+    try:
+        stat = os.stat(path)
+        file_state = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        file_state = "missing"
+    key = f"{doc.get('doc_name', '')}\n{doc['doc_url']}\n{doc.get('doc_uuid', '')}\n{file_state}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def iter_document_chunks(doc: dict):
+    """
+    Extract one library document and yield its chunks with their metadata.
+
+    The document title is always yielded as its own chunk, so title searches keep
+    working for documents whose text cannot be extracted. PDF chunks carry the
+    page they start on, and the page they end on if different, for citations. If
+    extraction fails part-way, the chunks already yielded stand.
+
+    Every chunk is stamped with the record's doc_id and document_version, which
+    LibrarySynchronizer compares to find the records that changed.
+
+    Args:
+        doc (dict): A libraryDocsCollection record with doc_name and doc_url.
+
+    Yields:
+        tuple: (content, metadata) for each chunk.
+    """
+    base_metadata = {"doc_url": doc["doc_url"], "doc_name": doc["doc_name"], "doc_version": document_version(doc)}
+    if doc.get("_id") is not None:
+        base_metadata["doc_id"] = str(doc["_id"])
+    if doc.get("doc_uuid"):
+        base_metadata["doc_uuid"] = doc["doc_uuid"]
+
+    title = doc["doc_name"].split(" - ")[-1]
+    yield title, {**base_metadata, "chunk": 0, "text": doc["doc_name"]}
+
+    path = resolve_doc_path(doc["doc_url"])
+    if not path.lower().endswith(SUPPORTED_EXTENSIONS) or not os.path.exists(path):
+        return
+    try:
+        with open(path, 'rb') as f:
+            file_body = f.read()
+        # Chunks are yielded while later pages are still being extracted
+        pages = ((position["page"], text) for text, position in iter_segments(os.path.basename(path), file_body))
+        for i, (chunk, first_page, last_page) in enumerate(chunk_pages(pages), start=1):
+            metadata = {**base_metadata, "chunk": i, "text": chunk}
+            if first_page is not None:
+                metadata["page"] = first_page
+                if last_page != first_page:
+                    metadata["page_end"] = last_page
+            yield chunk, metadata
+    except Exception as e:
+        print(f"Error extracting text from {path}: {e}")
+
+def index_library(memory, docs, batch_size: int = 64):
+    """
+    Stream library documents through text extraction and chunking into memory.
+
+    Chunks are embedded and inserted batch_size at a time, and only one document's
+    text is held at once, so memory use stays flat however large the library is.
+
+    Args:
+        memory (Memory): The vector memory to add chunks to.
+        docs (iterable): libraryDocsCollection records, e.g. a Mongo cursor.
+        batch_size (int): Number of chunks embedded per request.
+
+    Returns:
+        int: Number of chunks added.
+    """
+    contents, metadatas = [], []
+    added = 0
+    for doc in docs:
+        for content, metadata in iter_document_chunks(doc):
+            contents.append(content)
+            metadatas.append(metadata)
+            if len(contents) >= batch_size:
+                memory.add_memories(contents, metadatas=metadatas, batch_size=batch_size)
+                added += len(contents)
+                contents, metadatas = [], []
+        print(f"Indexed {doc['doc_name']}")
+    if contents:
+        memory.add_memories(contents, metadatas=metadatas, batch_size=batch_size)
+        added += len(contents)
+    return added
@@ -0,0 +1,282 @@
+import threading
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from library_indexer import document_version, index_library
+
+# Settings key in the metadata store holding the synchroniser's cursor
+SYNC_STATE_KEY = "library_sync"
+
+# Fields read from libraryDocsCollection records
+DOC_PROJECTION = {"_id": 1, "doc_name": 1, "doc_uuid": 1, "doc_url": 1, "updated_at": 1}
+
+def sync_cursor(docs, state=None) -> dict:
+    """
+    Return the poll cursor that follows the given records: their highest ObjectId
+    and, where set, their latest updated_at, each kept from state if that is later.
+
+    A record fetched for a newer updated_at can have a lower ObjectId than one seen
+    before, so the cursor never moves backwards. A Memory built offline from every
+    record stores this under SYNC_STATE_KEY, so a server starting from it only polls
+    for records added after the build.
+
+    Args:
+        docs (list[dict]): libraryDocsCollection records, at least one.
+        state (dict, optional): The cursor stored so far.
+    """
+    state = state or {}
+    ids = [doc["_id"] for doc in docs]
+    if state.get("last_id"):
+        ids.append(ObjectId(state["last_id"]))
+    cursor = {"last_id": str(max(ids))}
+    stamps = [doc["updated_at"] for doc in docs if doc.get("updated_at")]
+    if state.get("last_updated_at"):
+        stamps.append(datetime.fromisoformat(state["last_updated_at"]))
+    if stamps:
+        cursor["last_updated_at"] = max(stamps).isoformat()
+    return cursor
+
+class LibrarySynchronizer:
+    """
+    Keeps a Memory in step with libraryDocsCollection while the server runs.
+
+    New records are found with a polling cursor on the highest ObjectId (and
+    updated_at, where writers set it) seen so far, or from a change stream when
+    the deployment supports one. A periodic reconciliation pass compares every
+    record's fingerprint with the one stored in its chunks' metadata, which
+    catches edits and deletes a poll cannot see. Only the documents that changed
+    are extracted and embedded; each pass is applied with Memory.staged_update,
+    so searches keep running against the previous index until the new one is
+    swapped in.
+    """
+
+    def __init__(
+            self,
+            memory,
+            collection,
+            interval: float = 30,
+            reconcile_every: int = 20,
+            use_change_stream: bool = True,
+            batch_size: int = 64
+        ):
+        """
+        Args:
+            memory (Memory): The memory to keep in step; its metadata store holds the cursor.
+            collection: The libraryDocsCollection to follow.
+            interval (float): Seconds between polls.
+            reconcile_every (int): Number of polls between reconciliation passes.
+            use_change_stream (bool): Whether to follow a change stream when the deployment supports one.
+            batch_size (int): Number of chunks embedded per request.
+        """
+        self.memory = memory
+        self.collection = collection
+        self.interval = interval
+        self.reconcile_every = reconcile_every
+        self.use_change_stream = use_change_stream
+        self.batch_size = batch_size
+        self._lock = threading.Lock()  # Serialises sync passes
+        self._stop = threading.Event()
+        self._thread = None
+        self._stream = None
+        self.stats = {"indexed": 0, "removed": 0, "passes": 0, "errors": 0}
+
+    def set_memory(self, memory):
+        """
+        Follow the collection into another Memory, e.g. one swapped in by IndexManager.reload.
+        Waits for a pass in progress to finish first.
+        """
+        with self._lock:
+            self.memory = memory
+
+    def _state(self):
+        return self.memory.store.get_setting(SYNC_STATE_KEY, {})
+
+    def _save_state(self, **changes):
+        self.memory.set_setting(SYNC_STATE_KEY, {**self._state(), **changes})
+
+    def _indexed_chunk_ids(self, doc_filter):
+        """
+        Return the vector IDs of the chunks matching a metadata filter.
+        """
+        faiss_ids = self.memory.store.filter_ids(doc_filter)
+        rows = self.memory.store.get_many(faiss_ids.tolist())
+        return [vector_id for vector_id, _ in rows.values()]
+
+    def _index(self, docs):
+        """
+        Replace the chunks of the given records with freshly extracted ones.
+
+        Returns:
+            int: Number of chunks added.
+        """
+        for doc in docs:
+            self._remove({"doc_url": doc["doc_url"]})
+        added = index_library(self.memory, docs, self.batch_size)
+        self.stats["indexed"] += len(docs)
+        return added
+
+    def _remove(self, doc_filter):
+        vector_ids = self._indexed_chunk_ids(doc_filter)
+        if vector_ids:
+            self.memory.bulk_delete(vector_ids)
+        return len(vector_ids)
+
+    def poll(self):
+        """
+        Index the records inserted, or stamped with a newer updated_at, since the last poll.
+
+        Returns:
+            int: Number of records indexed.
+        """
+        state = self._state()
+        clauses = []
+        if state.get("last_id"):
+            clauses.append({"_id": {"$gt": ObjectId(state["last_id"])}})
+        if state.get("last_updated_at"):
+            clauses.append({"updated_at": {"$gt": datetime.fromisoformat(state["last_updated_at"])}})
+        query = {"$or": clauses} if clauses else {}
+        docs = [doc for doc in self.collection.find(query, DOC_PROJECTION).sort("_id", 1) if doc.get("doc_url")]
+        if not docs:
+            return 0
+
+        with self.memory.staged_update():
+            self._index(docs)
+        self._save_state(**sync_cursor(docs, state))
+        return len(docs)
+
+    def reconcile(self):
+        """
+        Compare every library record with the chunks in the index, then index new
+        and changed records and remove the chunks of deleted ones.
+
+        Returns:
+            tuple: (indexed, removed) record counts.
+        """
+        library = {}
+        for doc in self.collection.find({}, DOC_PROJECTION):
+            if doc.get("doc_url"):
+                library[doc["doc_url"]] = doc
+
+        indexed = {}  # doc_url -> set of doc_version values of its chunks
+        for _, _, metadata in self.memory.store.iter_rows():
+            doc_url = metadata.get("doc_url")
+            if doc_url:
+                indexed.setdefault(doc_url, set()).add(metadata.get("doc_version"))
+
+        changed = [doc for doc_url, doc in library.items() if indexed.get(doc_url) != {document_version(doc)}]
+        deleted = [doc_url for doc_url in indexed if doc_url not in library]
+        if changed or deleted:
+            with self.memory.staged_update():
+                for doc_url in deleted:
+                    self._remove({"doc_url": doc_url})
+                    print(f"Removed {doc_url} from the index")
+                self._index(changed)
+            self.stats["removed"] += len(deleted)
+        if library:
+            self._save_state(**sync_cursor(list(library.values()), self._state()))
+        return len(changed), len(deleted)
+
+    def sync_once(self, reconcile: bool = False):
+        """
+        Run one poll, or one reconciliation pass.
+
+        Returns:
+            int: Number of records indexed or removed.
+        """
+        with self._lock:
+            changed = sum(self.reconcile()) if reconcile else self.poll()
+            self.stats["passes"] += 1
+            return changed
+
+    def _handle_change(self, change):
+        """
+        Apply one change-stream event.
+        """
+        operation = change["operationType"]
+        with self._lock:
+            if operation in ("insert", "update", "replace"):
+                doc = change.get("fullDocument")
+                if doc and doc.get("doc_url"):
+                    with self.memory.staged_update():
+                        # The record's doc_url may have changed, so drop its chunks by record ID too
+                        self._remove({"doc_id": str(doc["_id"])})
+                        self._index([doc])
+            elif operation == "delete":
+                with self.memory.staged_update():
+                    removed = self._remove({"doc_id": str(change["documentKey"]["_id"])})
+                if removed:
+                    self.stats["removed"] += 1
+            self._save_state(resume_token=change["_id"])
+
+    def _follow_change_stream(self):
+        """
+        Apply change-stream events until stopped.
+
+        Returns:
+            bool: False if the deployment has no change streams (a standalone server),
+            so the caller should poll instead.
+        """
+        resume_token = self._state().get("resume_token")
+        try:
+            self._stream = self.collection.watch(full_document="updateLookup", resume_after=resume_token)
+        except OperationFailure as e:
+            if resume_token is not None:
+                # The oplog no longer holds the token; the next reconciliation pass covers the gap
+                print(f"Cannot resume library change stream ({e}); polling until the next reconciliation")
+                self._save_state(resume_token=None)
+            else:
+                print(f"Change streams unavailable ({e}); polling libraryDocsCollection instead")
+                self.use_change_stream = False
+            return False
+        print("Following libraryDocsCollection change stream")
+        with self._stream as stream:
+            while not self._stop.is_set():
+                try:
+                    change = stream.try_next()
+                except Exception:
+                    if self._stop.is_set():
+                        break  # stop() closed the stream
+                    raise
+                if change is None:
+                    self._stop.wait(1.0)
+                    continue
+                self._handle_change(change)
+                self.stats["passes"] += 1
+        return True
+
+    def start(self):
+        """
+        Reconcile once to catch up, then follow the collection in a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            polls = 0
+            reconcile = True
+            while not self._stop.is_set():
+                try:
+                    self.sync_once(reconcile=reconcile)
+                    if reconcile and self.use_change_stream and self._follow_change_stream():
+                        continue
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Error synchronising library index: {e}")
+                polls += 1
+                reconcile = polls % self.reconcile_every == 0
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=run, name="library-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            if self._stream is not None:
+                self._stream.close()
+            self._thread.join()
+            self._thread = None
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import signal
 import sys
 import json
 import argparse
@@ -12,8 +14,6 @@ import tornado.escape
 from dotenv import load_dotenv
 from googleapiclient.discovery import build
 import tornado
-from docx import Document
-import PyPDF2
 import glob  # Import the glob module
 from urllib.parse import urlparse, parse_qs, unquote
 import requests
@@ -21,10 +21,12 @@ from bs4 import BeautifulSoup
 import tornado.websocket
 from auth import *
 from vector_db import Memory
-from pdf2image import convert_from_bytes
-import cv2
-import pytesseract
-import subprocess
+from embedding_backends import create_backend
+from async_memory import AsyncMemory, MemoryBusyError
+from index_manager import DEFAULT_NAMESPACE, IndexManager
+from document_text import get_extraction_cache
+from extraction_executor import ExtractionBusyError, ExtractionExecutor
+from library_sync import LibrarySynchronizer
 import uuid
 from mongo_db import libraryDocsCollection
 from auth import *
@@ -43,16 +45,90 @@ gemmini_client = OpenAI(api_key=os.getenv("GEMINI_API_KEY"), base_url="https://g
 
 UPLOAD_DIR = './uploads'
 
-# Initialize vector database
-memory = Memory(use_gpu=False)
+# Largest list of queries one /api/query request may batch
+MAX_QUERIES_PER_REQUEST = 20
+
+# Vector search runs on a bounded thread pool off the IOLoop
+SEARCH_WORKERS = 4
+SEARCH_MAX_QUEUE = 64
+SEARCH_TIMEOUT_SECONDS = 20
+
+# Seconds between polls of libraryDocsCollection for documents to index
+LIBRARY_SYNC_INTERVAL_SECONDS = 30
+
+# Embedding backend: "ollama", "onnx", "sentence-transformers" or "hashing", or a primary and
+# a fallback for when the Ollama daemon is slow or down, e.g. "ollama+onnx"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "ollama")
+OLLAMA_TIMEOUT_SECONDS = 30
+
+# Text extraction of uploads runs on its own threads, which share one process pool for
+# PDF parsing and OCR; jobs beyond the queue get a 503
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", 2))
+EXTRACTION_MAX_QUEUE = 8
+EXTRACTION_TIMEOUT_SECONDS = 300
+
+# Bearer token accepted by /api/admin/index; the endpoint is disabled when unset
+INDEX_ADMIN_TOKEN = os.getenv("INDEX_ADMIN_TOKEN")
+
+# Started before the vector database, so the extraction pool's workers are forked
+# before Faiss and the background threads are running
+extraction_executor = ExtractionExecutor(
+    max_workers=EXTRACTION_WORKERS, max_queue=EXTRACTION_MAX_QUEUE, timeout=EXTRACTION_TIMEOUT_SECONDS
+)
+
+# Initialize vector database. Each namespace is memory-mapped on first use, so startup
+# does not wait on reading it and workers share its pages, and folds online changes from
+# its write-ahead log into a new snapshot in the background.
+embedding_backend = create_backend(EMBEDDING_BACKEND, ollama_timeout=OLLAMA_TIMEOUT_SECONDS)
+index_manager = IndexManager(memory_factory=lambda: Memory(use_gpu=False, embedding_backend=embedding_backend))
 try:
     logging.info("Loading vector database from disk...")
-    memory.load_from_disk()
+    memory = index_manager.get(DEFAULT_NAMESPACE, create=True)
     logging.info("Vector database loaded successfully.")
-except FileNotFoundError:
-    logging.warning("Vector database not found on disk. It will be empty until data is added.")
 except Exception as e:
     logging.error(f"Error loading vector database: {e}")
+    memory = Memory(use_gpu=False, embedding_backend=embedding_backend)
+async_memory = AsyncMemory(memory, max_workers=SEARCH_WORKERS, max_queue=SEARCH_MAX_QUEUE, timeout=SEARCH_TIMEOUT_SECONDS)
+
+# Index library uploads, edits and deletions in the background as they happen
+library_sync = LibrarySynchronizer(memory, libraryDocsCollection, interval=LIBRARY_SYNC_INTERVAL_SECONDS)
+
+def use_default_memory(namespace, new_memory):
+    """
+    Point everything holding the default namespace's Memory at one swapped in by a reload.
+    """
+    global memory
+    if namespace != DEFAULT_NAMESPACE:
+        return
+    memory = new_memory
+    async_memory.memory = new_memory
+    library_sync.set_memory(new_memory)
+
+index_manager.add_reload_listener(use_default_memory)
+index_reload_lock = asyncio.Lock()
+
+async def reload_default_snapshot(version=None):
+    """
+    Load a snapshot of the default namespace off the IOLoop and swap it in. Queries are
+    served from the previous snapshot until the new one has loaded.
+    """
+    async with index_reload_lock:
+        return await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, index_manager.reload, DEFAULT_NAMESPACE, version
+        )
+
+async def reload_on_signal():
+    try:
+        await reload_default_snapshot()
+    except Exception as e:
+        logging.error(f"Error reloading vector database: {e}", exc_info=True)
+
+def handle_sighup():
+    """
+    Make `kill -HUP <pid>` reload the default namespace from the snapshot CURRENT names.
+    Must be called on the running IOLoop.
+    """
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(reload_on_signal()))
 
 async def generate_draft(prompt: str) -> str:
     """
@@ -139,92 +215,21 @@ async def generate_draft(prompt: str) -> str:
     
     return draft_text
 
-def get_document_text(file_data) -> str:
+async def get_document_text(file_data) -> str:
     """
     Extracts text content from docx or pdf file data.
     Employ OCD processing for pdf files.
-    """
-    filename = file_data['filename']
-    file_body = file_data['body']
-
-    text = ""
-    if filename.lower().endswith(".docx"):
-        # Create a BytesIO object from the file body
-        from io import BytesIO
-        byte_stream = BytesIO(file_body)
-        document = Document(byte_stream)
-        for paragraph in document.paragraphs:
-            text += paragraph.text + ' '
-
-    elif filename.lower().endswith(".pdf"):
-        # Create a BytesIO object from the file body
-        from io import BytesIO
-        byte_stream = BytesIO(file_body)
-        try:
-            # Use PdfReader from PyPDF2
-            temporary_text = ""
-            reader = PyPDF2.PdfReader(byte_stream)
-            for page_num in range(len(reader.pages)):
-                temporary_text += reader.pages[page_num].extract_text() + ' '
-            
-            if any(c.isalpha() or c.isdigit() for c in temporary_text):
-                text += temporary_text
-            else:
-                # If PyPDF2 fails, try converting to images and using OCR
-                # Ensure the 'tmp' folder exists in the parent folder of this script
-                parent_folder = os.path.dirname(os.path.abspath(__file__))
-                store_folder = os.path.join(parent_folder, "tmp")
-                os.makedirs(store_folder, exist_ok=True)
-
-                images = convert_from_bytes(file_body)
-                for idx, img in enumerate(images):
-                    img.save(os.path.join(store_folder, f'page{idx}.jpg'), 'JPEG')
-                
-                img_list = os.listdir(store_folder)
-                img_list.sort()
-                for i in range(len(img_list)):
-                    img = cv2.imread(f"{store_folder}/{img_list[i]}")
-                    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-                    # Performing OTSU threshold
-                    ret, thresh1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)
-                    
-                    # Specify structure shape and kernel size. 
-                    # Kernel size increases or decreases the area 
-                    # of the rectangle to be detected.
-                    # A smaller value like (10, 10) will detect 
-                    # each word instead of a sentence.
-                    rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (18, 18))
-                    
-                    # Applying dilation on the threshold image
-                    dilation = cv2.dilate(thresh1, rect_kernel, iterations = 1)
-                    
-                    # Finding contours
-                    contours, hierarchy = cv2.findContours(dilation, cv2.RETR_EXTERNAL, 
-                                                                    cv2.CHAIN_APPROX_NONE)
-                    
-                    # Creating a copy of image
-                    im2 = img.copy()
-                    
-                    for cnt in contours:
-                        x, y, w, h = cv2.boundingRect(cnt)
-                        
-                        # Drawing a rectangle on copied image
-                        rect = cv2.rectangle(im2, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                        
-                        # Cropping the text block for giving input to OCR
-                        cropped = im2[y:y + h, x:x + w]
-                        text += pytesseract.image_to_string(cropped)    
-                try:    
-                    for i in img_list:  subprocess.run(["rm", f"{store_folder}/{i}"])
-                except: ...
-        except Exception as e:
-            print(f"Error reading PDF file {filename}: {e}")
-            raise HTTPError(400, f"Could not read PDF file {filename}.")
-    else:
-        raise HTTPError(400, f"Unsupported file type: {filename}. Only .docx and .pdf are supported.")
 
-    return text
+    Extraction runs in the extraction processes, so the IOLoop keeps serving other requests.
+    """
+    try:
+        return await extraction_executor.extract_text(file_data['filename'], file_data['body'])
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    except ExtractionBusyError as e:
+        raise HTTPError(503, str(e))
+    except asyncio.TimeoutError:
+        raise HTTPError(504, "Document text extraction timed out")
 
 class DraftHandler(BaseCORSHandler):
     async def post(self):
@@ -268,7 +273,7 @@ class AnalysisHandler(BaseCORSHandler):
             with open(file_path, 'wb') as f:
                 f.write(file_body)
 
-            text = get_document_text(file_info)
+            text = await get_document_text(file_info)
 
             # Generate summary
             # Try OpenAI first, then fallback to other clients if it fails
@@ -469,24 +474,56 @@ class QueryHandler(BaseCORSHandler):
             self.set_status(400)
             return self.write({"error": 'Missing "type" or "query" in request body'})
 
-        response_payload = []
+        # "query" may also be a list of queries, answered together with results grouped per query
+        queries = query_text if isinstance(query_text, list) else [query_text]
+        if not all(isinstance(q, str) and q.strip() for q in queries):
+            self.set_status(400)
+            return self.write({"error": '"query" must be a non-empty string or a list of non-empty strings'})
+        if len(queries) > MAX_QUERIES_PER_REQUEST:
+            self.set_status(400)
+            return self.write({"error": f"At most {MAX_QUERIES_PER_REQUEST} queries are allowed per request"})
+
+        # Optional metadata filter, e.g. {"jurisdiction": "UG"}, applied before the search
+        search_filter = data.get("filter")
+        if search_filter is not None and not isinstance(search_filter, dict):
+            self.set_status(400)
+            return self.write({"error": '"filter" must be an object of metadata field -> value(s)'})
+
+        grouped_payload = []
         try:
             if query_type in ["Contract Search", "Laws & Regulations", "Case Law"]:
-                search_results = memory.search_memory(query_text, k=5)
-                for result in search_results:
-                    meta = result.get('metadata', {})
-                    response_payload.append({
-                        "title": meta.get('doc_name', 'N/A'),
-                        "snippet": f"Found in document library with distance: {result.get('distance', 0):.4f}",
-                        "link": meta.get('doc_url', '#')
-                    })
+                try:
+                    all_results = await async_memory.search_documents_many(queries, k=5, hybrid=True, filter=search_filter)
+                except ValueError as e:
+                    self.set_status(400)
+                    return self.write({"error": str(e)})
+                except MemoryBusyError as e:
+                    self.set_status(503)
+                    return self.write({"error": str(e)})
+                except asyncio.TimeoutError:
+                    self.set_status(504)
+                    return self.write({"error": "Search timed out"})
+                for search_results in all_results:
+                    response_payload = []
+                    for result in search_results:
+                        meta = result.get('metadata', {})
+                        response_payload.append({
+                            "title": meta.get('doc_name', 'N/A'),
+                            "snippet": result.get('snippet') or f"Found in document library with score: {result.get('score', 0):.4f}",
+                            "link": meta.get('doc_url', '#'),
+                            "page": meta.get('page')
+                        })
+                    grouped_payload.append(response_payload)
 
             else:
                 self.set_status(400)
                 return self.write({"error": f"Unsupported query type: {query_type}"})
 
             self.set_header("Content-Type", "application/json")
-            self.write({"results": response_payload})
+            if isinstance(query_text, list):
+                self.write({"results": [{"query": q, "results": r} for q, r in zip(queries, grouped_payload)]})
+            else:
+                self.write({"results": grouped_payload[0]})
         except Exception as e:
             logging.error(f"An error occurred during query processing: {e}", exc_info=True)
             raise HTTPError(500, "An error occurred during query processing.")
@@ -517,7 +554,8 @@ class UploadDriveDocumentHandler(BaseCORSHandler):
             libraryDocsCollection.insert_one({
                 "doc_name": filename, # Original filename
                 "doc_uuid": file_uuid,
-                "doc_url": f"/static/uploads/{stored_filename}" # URL for direct access
+                "doc_url": f"/static/uploads/{stored_filename}", # URL for direct access
+                "updated_at": datetime.utcnow() # Picked up by the library synchroniser
             })
             
             self.set_header("Content-Type", "application/json")
@@ -539,8 +577,8 @@ class DocumentComparisonHandler(BaseCORSHandler):
             doc2_file_data = files['file2'][0]
 
             # Extract text content from files
-            doc1_content = get_document_text(doc1_file_data)
-            doc2_content = get_document_text(doc2_file_data)
+            doc1_content = await get_document_text(doc1_file_data)
+            doc2_content = await get_document_text(doc2_file_data)
 
             # Use OpenAI API to compare documents
             comparison_response = openai_client.chat.completions.create(
@@ -586,7 +624,14 @@ class DocumentLibraryHandler(BaseCORSHandler):
             if search_term:
                 search_term_lower = search_term.lower()
                 # Use FAISS vector database for semantic search
-                vector_results = memory.search_memory(search_term_lower, k=5)
+                try:
+                    vector_results = await async_memory.search_documents(search_term_lower, k=5, hybrid=True)
+                except MemoryBusyError as e:
+                    self.set_status(503)
+                    return self.write({"error": str(e)})
+                except asyncio.TimeoutError:
+                    self.set_status(504)
+                    return self.write({"error": "Search timed out"})
                 
                 # Extract document information from search results
                 if vector_results:
@@ -597,7 +642,9 @@ class DocumentLibraryHandler(BaseCORSHandler):
                             document_list.append({
                                 'name': doc_name,
                                 'url': meta.get('doc_url', '#'),
-                                'relevance': str(result.get('distance', 1.0))
+                                'page': meta.get('page'),
+                                'relevance': str(result.get('score', 0.0)),
+                                'snippet': result.get('snippet', '')
                             })
                             print(document_list)
             else:
@@ -630,15 +677,20 @@ class AgenticSearchWebSocketHandler(tornado.websocket.WebSocketHandler):
             await self.write_message(json.dumps({"type": "status", "content": "Searching Legal AI Africa's document library..."}))
 
             # 2. Vector DB Search
-            vector_results = memory.search_memory(query, k=3)
+            try:
+                vector_results = await async_memory.search_documents(query, k=3, hybrid=True)
+            except (MemoryBusyError, asyncio.TimeoutError) as e:
+                logging.warning(f"Library search skipped: {e or 'timed out'}")
+                vector_results = []
             vector_payload = []
             if vector_results:
                 for result in vector_results:
                     meta = result.get('metadata', {})
                     vector_payload.append({
                         "title": meta.get('doc_name', 'N/A'),
-                        "snippet": f"Found in document library. Distance: {result.get('distance', 0):.4f}",
-                        "link": meta.get('doc_url', '#')
+                        "snippet": result.get('snippet') or f"Found in document library. Score: {result.get('score', 0):.4f}",
+                        "link": meta.get('doc_url', '#'),
+                        "page": meta.get('page')
                     })
                 await self.write_message(json.dumps({"type": "vector_results", "content": vector_payload}))
             else:
@@ -721,6 +773,58 @@ class AgenticSearchWebSocketHandler(tornado.websocket.WebSocketHandler):
             logging.error(f"Agentic search error: {e}", exc_info=True)
             await self.write_message(json.dumps({"error": f"An error occurred: {e}"}))
 
+class SearchMetricsHandler(BaseCORSHandler):
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        self.write({
+            "search": async_memory.metrics(),
+            "namespaces": {"loaded": index_manager.loaded()},
+            "embedding": embedding_backend.stats(),
+            "extraction": extraction_executor.metrics(),
+            "extraction_cache": get_extraction_cache().stats() if get_extraction_cache() else None,
+            "library_sync": library_sync.stats
+        })
+
+class IndexAdminHandler(BaseCORSHandler):
+    def _authorize(self):
+        auth_header = self.request.headers.get("Authorization", "")
+        token = auth_header.replace("Bearer ", "") if auth_header.startswith("Bearer ") else ""
+        if not INDEX_ADMIN_TOKEN or not secrets.compare_digest(token, INDEX_ADMIN_TOKEN):
+            raise HTTPError(403, "Forbidden")
+
+    def get(self):
+        self._authorize()
+        self.set_header("Content-Type", "application/json")
+        self.write({
+            "current": index_manager.current_version(DEFAULT_NAMESPACE),
+            "snapshots": index_manager.snapshots(DEFAULT_NAMESPACE),
+            "vectors": memory.index.ntotal
+        })
+
+    async def post(self):
+        """
+        Reload the default namespace from the snapshot named in the body's "version",
+        or from the one CURRENT names when no version is given.
+        """
+        self._authorize()
+        try:
+            data = tornado.escape.json_decode(self.request.body) if self.request.body else {}
+        except json.JSONDecodeError:
+            raise HTTPError(400, "Invalid JSON")
+        if index_reload_lock.locked():
+            raise HTTPError(409, "A reload is already in progress.")
+        try:
+            new_memory = await reload_default_snapshot(data.get("version"))
+        except KeyError as e:
+            raise HTTPError(404, str(e))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        self.set_header("Content-Type", "application/json")
+        self.write({
+            "current": index_manager.current_version(DEFAULT_NAMESPACE),
+            "vectors": new_memory.index.ntotal
+        })
+
 class UserDocumentsHandler(BaseCORSHandler):
     def get(self):
         # Get token from Authorization header
@@ -880,6 +984,8 @@ class Application(Application): # type: ignore
             (r"/api/query", QueryHandler),
             (r"/api/compare-documents", DocumentComparisonHandler),
             (r"/api/documents", DocumentLibraryHandler),
+            (r"/api/metrics/search", SearchMetricsHandler),
+            (r"/api/admin/index", IndexAdminHandler),
             (r"/api/uploads/(.*)", StaticFileHandler, {'path': UPLOAD_DIR}),
             (r"/api/upload-drive-document", UploadDriveDocumentHandler),
             (r"/api/static/uploads/(.*)", StaticFileHandler, {'path': os.path.join(os.path.dirname(__file__), "static/uploads")}),
@@ -918,7 +1024,10 @@ class Application(Application): # type: ignore
 def run_server(port: int = 4040):
     app = Application()
     app.listen(port)
-    tornado.ioloop.IOLoop.current().start()
+    library_sync.start()
+    io_loop = tornado.ioloop.IOLoop.current()
+    io_loop.add_callback(handle_sighup)
+    io_loop.start()
 
 def run_exec_mode(prompt: str):
     result = {"draft": generate_draft(prompt)}
@@ -0,0 +1,413 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import numpy as np
+
+DEFAULT_METADATA_PATH = os.path.join(os.path.dirname(__file__), "faiss_db/metadata.db")
+
+# Metadata fields holding free text, which are not indexed for filtering
+UNFILTERED_FIELDS = ("text", "content")
+
+def _filter_values(value):
+    """
+    Return the JSON-encoded values a metadata value is indexed under; a list is indexed under each element.
+    """
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [json.dumps(v) for v in values if v is None or isinstance(v, (str, int, float, bool))]
+
+def _filter_postings(rows):
+    """
+    Build (field, value, faiss_id) postings of the filterable fields of metadata rows.
+    """
+    postings = []
+    for faiss_id, _, metadata in rows:
+        for field, value in (metadata or {}).items():
+            if field in UNFILTERED_FIELDS:
+                continue
+            postings.extend((field, encoded, int(faiss_id)) for encoded in set(_filter_values(value)))
+    return postings
+
+class MetadataStore:
+    """
+    An indexed SQLite store mapping Faiss integer IDs to vector IDs and metadata.
+
+    Rows are read and written individually, so lookups fetch only the rows that are
+    needed and updates touch a single row instead of rewriting the whole store.
+    """
+
+    def __init__(self, path=":memory:", use_mmap=False, mmap_size=1 << 30):
+        """
+        Open (or create) the metadata store.
+
+        Args:
+            path (str): Filepath of the SQLite database, or ":memory:" for an in-memory store.
+            use_mmap (bool): Whether SQLite should memory-map the database file for reads.
+            mmap_size (int): Maximum number of bytes SQLite memory-maps when use_mmap is set.
+        """
+        self.path = path if path == ":memory:" else os.path.abspath(path)
+        self.use_mmap = use_mmap
+        self.mmap_size = mmap_size
+        self._lock = threading.RLock()
+        self._conn = self._connect(self.path, use_mmap, mmap_size)
+        self._index_existing_rows()
+
+    @staticmethod
+    def _connect(path, use_mmap=False, mmap_size=1 << 30):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        if use_mmap:
+            conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "faiss_id INTEGER PRIMARY KEY, vector_id TEXT NOT NULL UNIQUE, metadata TEXT NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS tombstones (faiss_id INTEGER PRIMARY KEY)")
+        # Inverted index of metadata field values, for filtered search
+        conn.execute("CREATE TABLE IF NOT EXISTS filter_index (field TEXT NOT NULL, value TEXT NOT NULL, faiss_id INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS filter_index_field_value ON filter_index (field, value, faiss_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS filter_index_faiss_id ON filter_index (faiss_id)")
+        conn.commit()
+        return conn
+
+    def _index_existing_rows(self):
+        """
+        Build the filter index of a database written before filtered search existed.
+        """
+        if self.get_setting('filter_index_built'):
+            return
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM filter_index")
+            for rows in self._batches(self.iter_rows()):
+                self._conn.executemany(
+                    "INSERT INTO filter_index (field, value, faiss_id) VALUES (?, ?, ?)", _filter_postings(rows)
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('filter_index_built', 'true')"
+            )
+
+    @staticmethod
+    def _batches(iterable, size=1000):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _unindex(self, faiss_ids):
+        self._conn.executemany("DELETE FROM filter_index WHERE faiss_id = ?", [(int(i),) for i in faiss_ids])
+
+    @property
+    def is_persistent(self):
+        return self.path != ":memory:"
+
+    def insert_many(self, rows):
+        """
+        Insert new rows in a single transaction.
+
+        Args:
+            rows (list[tuple]): (faiss_id, vector_id, metadata) tuples.
+
+        Raises:
+            ValueError: If a vector ID or Faiss ID already exists.
+        """
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO vectors (faiss_id, vector_id, metadata) VALUES (?, ?, ?)",
+                        [(int(faiss_id), vector_id, json.dumps(metadata, default=str)) for faiss_id, vector_id, metadata in rows]
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO filter_index (field, value, faiss_id) VALUES (?, ?, ?)", _filter_postings(rows)
+                    )
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Duplicate vector ID: {e}") from e
+
+    def upsert_many(self, rows):
+        """
+        Insert rows, replacing any existing rows with the same Faiss ID or vector ID.
+
+        Args:
+            rows (list[tuple]): (faiss_id, vector_id, metadata) tuples.
+        """
+        with self._lock, self._conn:
+            # Replaced rows may sit under another Faiss ID with the same vector ID
+            replaced = [int(faiss_id) for faiss_id, _, _ in rows]
+            for start in range(0, len(rows), 500):
+                vector_ids = [row[1] for row in rows[start:start + 500]]
+                replaced.extend(row[0] for row in self._conn.execute(
+                    f"SELECT faiss_id FROM vectors WHERE vector_id IN ({','.join('?' * len(vector_ids))})", vector_ids
+                ))
+            self._unindex(set(replaced))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (faiss_id, vector_id, metadata) VALUES (?, ?, ?)",
+                [(int(faiss_id), vector_id, json.dumps(metadata, default=str)) for faiss_id, vector_id, metadata in rows]
+            )
+            self._conn.executemany(
+                "INSERT INTO filter_index (field, value, faiss_id) VALUES (?, ?, ?)", _filter_postings(rows)
+            )
+
+    def delete_many(self, faiss_ids):
+        """
+        Delete the rows with the given Faiss IDs.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM vectors WHERE faiss_id = ?", [(int(i),) for i in faiss_ids])
+            self._unindex(faiss_ids)
+
+    def update_metadata(self, vector_id, metadata):
+        """
+        Replace the metadata of a single vector.
+
+        Raises:
+            ValueError: If the vector ID does not exist.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE vectors SET metadata = ? WHERE vector_id = ?", (json.dumps(metadata, default=str), vector_id)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"Vector ID '{vector_id}' not found.")
+            faiss_id = self._conn.execute("SELECT faiss_id FROM vectors WHERE vector_id = ?", (vector_id,)).fetchone()[0]
+            self._unindex([faiss_id])
+            self._conn.executemany(
+                "INSERT INTO filter_index (field, value, faiss_id) VALUES (?, ?, ?)",
+                _filter_postings([(faiss_id, vector_id, metadata)])
+            )
+
+    def get_many(self, faiss_ids):
+        """
+        Fetch the rows for the given Faiss IDs.
+
+        Args:
+            faiss_ids (list[int]): Faiss IDs to look up.
+
+        Returns:
+            dict: faiss_id -> (vector_id, metadata) for the IDs that exist.
+        """
+        faiss_ids = [int(i) for i in faiss_ids]
+        rows = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(faiss_ids), 500):
+                chunk = faiss_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for faiss_id, vector_id, metadata in self._conn.execute(
+                    f"SELECT faiss_id, vector_id, metadata FROM vectors WHERE faiss_id IN ({placeholders})", chunk
+                ):
+                    rows[faiss_id] = (vector_id, json.loads(metadata))
+        return rows
+
+    def filter_ids(self, filter):
+        """
+        Find the Faiss IDs whose metadata matches a filter.
+
+        Args:
+            filter (dict): field -> value, or field -> list of values. A row matches when,
+                for every field, its value (or one element of its list value) is one of the given values.
+
+        Returns:
+            np.ndarray: The matching Faiss IDs in ascending order, as int64.
+
+        Raises:
+            ValueError: If the filter is empty, names a free-text field or has a non-scalar value.
+        """
+        if not isinstance(filter, dict) or not filter:
+            raise ValueError("filter must be a non-empty dict of metadata field -> value(s).")
+        clauses, params = [], []
+        for field, value in filter.items():
+            if field in UNFILTERED_FIELDS:
+                raise ValueError(f"Metadata field '{field}' cannot be filtered on.")
+            values = value if isinstance(value, (list, tuple)) else [value]
+            encoded = _filter_values(values)
+            if not encoded or len(encoded) != len(values):
+                raise ValueError(f"Filter values for '{field}' must be strings, numbers, booleans or None.")
+            clauses.append(f"SELECT faiss_id FROM filter_index WHERE field = ? AND value IN ({','.join('?' * len(encoded))})")
+            params.extend([field, *encoded])
+        query = " INTERSECT ".join(clauses) + " ORDER BY faiss_id"
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute(query, params)]
+        return np.array(ids, dtype=np.int64)
+
+    def get_faiss_id(self, vector_id):
+        """
+        Look up the Faiss ID of a vector ID, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT faiss_id FROM vectors WHERE vector_id = ?", (vector_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_metadata(self, vector_id):
+        """
+        Look up the metadata of a vector ID, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM vectors WHERE vector_id = ?", (vector_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def next_faiss_id(self):
+        """
+        Return the next unused Faiss ID.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(faiss_id) FROM vectors").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def iter_rows(self, batch_size=1000):
+        """
+        Iterate over every (faiss_id, vector_id, metadata) row in Faiss ID order.
+        """
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT faiss_id, vector_id, metadata FROM vectors WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for faiss_id, vector_id, metadata in rows:
+                yield faiss_id, vector_id, json.loads(metadata)
+            last_id = rows[-1][0]
+
+    def iter_ids(self, batch_size=10000):
+        """
+        Iterate over every (faiss_id, vector_id) pair in Faiss ID order without reading metadata.
+        """
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT faiss_id, vector_id FROM vectors WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def renumber(self, faiss_ids):
+        """
+        Give the rows with the given Faiss IDs the dense IDs 0..n-1, in the order given,
+        and delete every other row.
+
+        Args:
+            faiss_ids (list[int]): Current Faiss IDs in ascending order.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (faiss_id INTEGER PRIMARY KEY)")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT INTO keep (faiss_id) VALUES (?)", [(int(i),) for i in faiss_ids])
+            self._conn.execute("DELETE FROM vectors WHERE faiss_id NOT IN (SELECT faiss_id FROM keep)")
+            self._conn.execute("DELETE FROM filter_index WHERE faiss_id NOT IN (SELECT faiss_id FROM keep)")
+            # New IDs never exceed old ones, so renumbering in ascending order cannot collide
+            renumbered = [(new_id, int(old_id)) for new_id, old_id in enumerate(faiss_ids) if new_id != old_id]
+            self._conn.executemany("UPDATE vectors SET faiss_id = ? WHERE faiss_id = ?", renumbered)
+            self._conn.executemany("UPDATE filter_index SET faiss_id = ? WHERE faiss_id = ?", renumbered)
+            self._conn.execute("DELETE FROM keep")
+
+    def add_tombstones(self, faiss_ids):
+        """
+        Record Faiss IDs that were deleted but are still physically present in the index.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO tombstones (faiss_id) VALUES (?)", [(int(i),) for i in faiss_ids])
+
+    def tombstones(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT faiss_id FROM tombstones")}
+
+    def clear_tombstones(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tombstones")
+
+    def get_setting(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_setting(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+
+    def save_as(self, path, reopen=False):
+        """
+        Copy the store to a database file.
+
+        The copy is written to a temporary file and renamed into place.
+
+        Args:
+            path (str): Filepath of the destination database.
+            reopen (bool): Whether to continue working against the copy, opened with the same
+                mmap settings. Otherwise the store keeps its own file and the copy is left untouched.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if path == self.path:
+                self._conn.commit()
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            destination = sqlite3.connect(tmp_path)
+            try:
+                self._conn.backup(destination)
+                # Written in WAL mode, so opening the copy does not rewrite its header
+                destination.execute("PRAGMA journal_mode=WAL")
+            finally:
+                destination.close()
+            # Drop stale WAL files of a previous database at the destination
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            os.replace(tmp_path, path)
+            if reopen:
+                self._conn.close()
+                self.path = path
+                self._conn = self._connect(path, self.use_mmap, self.mmap_size)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_pickle(pickle_path, db_path):
+    """
+    Convert a legacy metadata.pkl file into a MetadataStore database.
+
+    Args:
+        pickle_path (str): Filepath of the pickled vector IDs and metadata.
+        db_path (str): Filepath of the database to create.
+    """
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+
+    store = MetadataStore()
+    # Faiss IDs were list positions; a vector ID that was reused keeps its last position
+    rows = {}
+    for faiss_id, vector_id in enumerate(data['vector_ids']):
+        rows[vector_id] = (faiss_id, vector_id, data['metadata'].get(vector_id, {}))
+    store.insert_many(list(rows.values()))
+    store.set_setting('dimension', data['dimension'])
+    if 'index_config' in data:
+        store.set_setting('index_config', data['index_config'])
+    store.save_as(db_path)
+    store.close()
+    print(f"Migrated {pickle_path} to {db_path}")
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+
+class SQLiteCache:
+    """
+    Base class of the persistent caches kept in one SQLite table, capped at
+    max_entries and evicted least-recently-used first.
+
+    Recency is a logical clock in a last_used column. A hit only records its clock
+    value in memory; recorded hits are written in one batch by the next put, or
+    once flush_every of them have piled up, instead of an UPDATE and a commit per
+    hit. A crash loses at most that recency, never an entry. The number of entries
+    is counted when the cache is opened and kept up to date from then on, so puts
+    do not count the table.
+
+    Subclasses set TABLE, SCHEMA (its column definitions, with an INTEGER last_used
+    column), COLUMNS (the columns a put writes, other than last_used) and
+    KEY_COLUMNS (the leading COLUMNS that form the primary key).
+    """
+
+    TABLE = None
+    SCHEMA = None
+    COLUMNS = ()
+    KEY_COLUMNS = ()
+
+    def __init__(self, path, max_entries, flush_every=256):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Filepath of the SQLite cache database.
+            max_entries (int): Maximum number of entries kept before LRU eviction.
+            flush_every (int): Number of recorded hits that are written without waiting for a put.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched = {}  # key tuple -> clock value of its last hit, not yet written
+        self._key_where = " AND ".join(f"{column} = ?" for column in self.KEY_COLUMNS)
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({self.SCHEMA})")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.TABLE}_last_used ON {self.TABLE}(last_used)")
+        self._conn.commit()
+        self._clock, self._count = self._conn.execute(
+            f"SELECT COALESCE(MAX(last_used), 0), COUNT(*) FROM {self.TABLE}"
+        ).fetchone()
+
+    def _tick(self):
+        # A logical clock orders accesses without depending on wall-clock resolution
+        self._clock += 1
+        return self._clock
+
+    def _touch(self, key):
+        """
+        Count a hit on the entry with the given key tuple. Called with the lock held.
+        """
+        self.hits += 1
+        self._touched[key] = self._tick()
+        if len(self._touched) >= self.flush_every:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """
+        Write the recorded hits to last_used, without committing. Called with the lock held.
+        """
+        if self._touched:
+            self._conn.executemany(
+                f"UPDATE {self.TABLE} SET last_used = ? WHERE {self._key_where}",
+                [(clock, *key) for key, clock in self._touched.items()]
+            )
+            self._touched = {}
+
+    def _put_rows(self, rows):
+        """
+        Insert or replace entries, then evict the least recently used ones past
+        max_entries, in one transaction. Called with the lock held.
+
+        Args:
+            rows (list[tuple]): Values of COLUMNS for each entry.
+        """
+        n_keys = len(self.KEY_COLUMNS)
+        rows = list({row[:n_keys]: row for row in rows}.values())
+        self._flush_touched()
+        added = sum(
+            self._conn.execute(f"SELECT 1 FROM {self.TABLE} WHERE {self._key_where}", row[:n_keys]).fetchone() is None
+            for row in rows
+        )
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO {self.TABLE} ({', '.join(self.COLUMNS)}, last_used) "
+            f"VALUES ({', '.join('?' * (len(self.COLUMNS) + 1))})",
+            [(*row, self._tick()) for row in rows]
+        )
+        self._count += added
+        if self._count > self.max_entries:
+            evicted = self._conn.execute(
+                f"DELETE FROM {self.TABLE} WHERE rowid IN "
+                f"(SELECT rowid FROM {self.TABLE} ORDER BY last_used ASC LIMIT ?)",
+                (self._count - self.max_entries,)
+            ).rowcount
+            self._count -= evicted
+            self.evictions += evicted
+        self._conn.commit()
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: Number of entries, hits, misses, evictions and the hit rate.
+        """
+        with self._lock:
+            entries = self._count
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        """
+        Remove every entry and reset the counters.
+        """
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._conn.commit()
+            self._touched = {}
+            self._count = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def close(self):
+        """
+        Write the recorded hits and close the underlying database connection.
+        """
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
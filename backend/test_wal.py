@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from embedding_backends import HashingBackend
+from index_manager import DEFAULT_NAMESPACE, IndexManager
+from vector_db import Memory
+from wal import WriteAheadLog, decode_vectors, encode_vectors
+
+def test_torn_record_is_discarded_before_appending(tmp_path):
+    path = str(tmp_path / "index.wal")
+    wal = WriteAheadLog(path, fsync=False)
+    wal.append({"op": "add", "faiss_id": 1})
+    wal.close()
+    # A crash mid-append leaves part of a record without its newline
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "fai')
+
+    wal = WriteAheadLog(path, fsync=False)
+    assert wal.pending == 1
+    wal.append({"op": "add", "faiss_id": 2})
+    wal.close()
+
+    assert [record["faiss_id"] for record in WriteAheadLog(path, fsync=False).records()] == [1, 2]
+
+def test_log_of_only_a_torn_record_is_emptied(tmp_path):
+    path = tmp_path / "index.wal"
+    path.write_text('{"op": "del')
+    wal = WriteAheadLog(str(path), fsync=False)
+    wal.append({"op": "delete", "faiss_ids": [3]})
+    wal.close()
+
+    assert list(WriteAheadLog(str(path), fsync=False).records()) == [{"op": "delete", "faiss_ids": [3]}]
+
+def test_vectors_round_trip():
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3)
+    assert np.array_equal(decode_vectors(encode_vectors(vectors), 3), vectors)
+
+def test_add_is_logged_before_it_is_applied(tmp_path):
+    index_path, metadata_path = str(tmp_path / "index.bin"), str(tmp_path / "metadata.db")
+    backend = HashingBackend(32)
+    memory = Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    memory.add_memories(["alpha", "beta"])
+    memory.save_to_disk(index_path, metadata_path)
+
+    memory = Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    memory.load_from_disk(index_path, metadata_path)
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+    memory._apply_add = crash
+    with pytest.raises(KeyboardInterrupt):
+        memory.add_memory("gamma", vector_id="gamma")
+
+    recovered = Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    recovered.load_from_disk(index_path, metadata_path)
+    assert recovered.index.ntotal == 3
+    assert recovered.search_memory("gamma", k=1)[0]["id"] == "gamma"
+
+def test_checkpoint_publishes_a_new_version(tmp_path):
+    backend = HashingBackend(32)
+    manager = IndexManager(
+        root=str(tmp_path), memory_factory=lambda: Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    )
+    offline = Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    offline.add_memories(["alpha", "beta"], vector_ids=["alpha", "beta"])
+    version = manager.save_snapshot(DEFAULT_NAMESPACE, offline)
+    _, metadata_path = manager.paths(DEFAULT_NAMESPACE, version)
+    with open(metadata_path, "rb") as f:
+        published = f.read()
+
+    memory = manager.get(DEFAULT_NAMESPACE)
+    memory.add_memory("gamma", vector_id="gamma")
+    memory.checkpoint()
+
+    with open(metadata_path, "rb") as f:
+        assert f.read() == published
+    assert manager.current_version(DEFAULT_NAMESPACE) != version
+    manager.close()
+    reopened = IndexManager(
+        root=str(tmp_path), memory_factory=lambda: Memory(use_gpu=False, cache_path=None, embedding_backend=backend)
+    )
+    assert reopened.get(DEFAULT_NAMESPACE).search_memory("gamma", k=1)[0]["id"] == "gamma"
+    reopened.close()
@@ -1,28 +1,257 @@
+import math
 import os
-import pickle
+import threading
+import time
+from contextlib import contextmanager
 import faiss
 import numpy as np
-import ollama
+from bm25 import BM25Index
+from embedding_backends import OllamaBackend
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from full_vectors import FullVectorFile
+from metadata_store import DEFAULT_METADATA_PATH, MetadataStore, migrate_pickle
+from wal import WriteAheadLog, decode_vectors, encode_vectors
+
+# Supported Faiss index layouts. "auto" picks one of the others by vector count.
+INDEX_TYPES = ("auto", "flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "pq")
+
+# Index layouts that store compressed codes instead of float32 vectors
+QUANTIZED_INDEX_TYPES = ("sq8", "pq", "ivf_pq")
+
+# Index layouts that must be trained before vectors are added to them
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq", "sq8", "pq")
+
+# Fewest vectors a trained layout is trained on: 39 per centroid, as Faiss recommends,
+# for the 256 centroids of an 8-bit PQ codebook. Until then vectors are kept in a flat index.
+MIN_TRAINING_VECTORS = 39 * 256
+
+# Vector-count thresholds used by index_type="auto"
+AUTO_FLAT_MAX_VECTORS = 10_000
+AUTO_HNSW_MAX_VECTORS = 200_000
+AUTO_IVF_FLAT_MAX_VECTORS = 1_000_000
+
+# Deleted-but-present vectors, as a share of the index, that trigger an automatic compact()
+MAX_TOMBSTONE_RATIO = 0.2
+
+# Rank offset of reciprocal-rank fusion in search_hybrid
+RRF_K = 60
+
+# Largest filtered ID set scored exhaustively when an approximate filtered search comes back short
+FILTER_EXACT_MAX_IDS = 100_000
+
+class _SharedLock:
+    """
+    A lock held by any number of readers at once, or by a single writer.
+
+    A waiting writer holds off new readers, so a steady stream of searches cannot
+    starve it. Readers must therefore not take it again while holding it.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writers_waiting = 0
+        self._writing = False
+
+    @contextmanager
+    def shared(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
 
 class Memory:
     """
     A class to handle memory storage and retrieval for an LLM using Faiss and Ollama for embeddings.
     """
 
-    def __init__(self, use_gpu=False):
+    def __init__(
+            self,
+            use_gpu=False,
+            cache_path=DEFAULT_CACHE_PATH,
+            cache_max_entries=200_000,
+            index_type="flat",
+            nlist=None,
+            pq_m=8,
+            hnsw_m=32,
+            nprobe=16,
+            ef_search=64,
+            rerank_factor=0,
+            embedding_backend=None
+        ):
         """
         Initialize the Memory class with Faiss configuration.
         
         Args:
             use_gpu (bool): Whether to use GPU acceleration if available.
+            cache_path (str, optional): Filepath of the on-disk embedding cache, or None to disable it.
+            cache_max_entries (int, optional): Maximum number of cached embeddings.
+            index_type (str, optional): One of "flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "pq" or "auto".
+                "sq8" stores 1 byte per dimension and "pq" pq_m bytes per vector, instead of 4 bytes per dimension.
+            nlist (int, optional): Number of IVF clusters. Derived from the training set size if None.
+            pq_m (int, optional): Number of product-quantizer sub-vectors for "pq" and "ivf_pq".
+            hnsw_m (int, optional): Number of neighbours per node for "hnsw".
+            nprobe (int, optional): Default number of IVF clusters visited per query.
+            ef_search (int, optional): Default HNSW search queue size per query.
+            rerank_factor (int, optional): For quantized index types, keep full float32 vectors in a file
+                on disk and re-rank rerank_factor * k candidates per query by exact distance. 0 disables it.
+            embedding_backend (EmbeddingBackend, optional): Backend that embeds texts. Defaults to
+                all-minilm through Ollama. Share one backend between Memory objects so its batch
+                and concurrency limits apply to all of them.
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type '{index_type}'. Expected one of {INDEX_TYPES}.")
         self.use_gpu = use_gpu
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rerank_factor = rerank_factor
+        self.embedding_backend = embedding_backend or OllamaBackend()
+        self.embedding_cache = EmbeddingCache(cache_path, cache_max_entries) if cache_path else None
         self.dimension = None  # Embedding dimension will be set after the first embedding
         self.index = None
-        self.vector_ids = []
-        self.metadata = {}
+        self.store = MetadataStore()  # In memory until saved to or loaded from disk
+        self.lexical = BM25Index()  # Keyword index over the same Faiss IDs
+        self._id_registry = None  # vector_id -> faiss_id, built from the store on first use
+        self._next_id = None  # Next unused Faiss ID, never reused after deletes
+        self._next_vector_number = None  # Counter behind generated "vector_<n>" IDs
+        self._tombstones = set()  # Deleted Faiss IDs the index could not physically remove
+        self._mmap_source = None  # Index file backing a memory-mapped, read-only index
+        self._published_index = None  # Index searched while a staged update writes to a copy
+        self._compact_on_publish = False  # compact() was called during a staged update
+        self.full_vectors = None  # FullVectorFile used for re-ranking quantized search results
+        self.wal = None  # Write-ahead log attached by load_from_disk
+        self._snapshot_paths = None  # (index, metadata) filepaths the log applies to
+        self._versions = None  # Creates and publishes new versions of an immutable snapshot
+        self._staged_paths = None  # (index, metadata) filepaths of the unpublished version changes go to
+        self._write_lock = threading.RLock()
+        self._search_lock = _SharedLock()  # Held shared by searches, exclusively while compact() renumbers
+        self._checkpoint_thread = None
+        self._stop_checkpointing = threading.Event()
         self._build_index()
 
+    def _index_config(self):
+        return {
+            'index_type': self.index_type,
+            'nlist': self.nlist,
+            'pq_m': self.pq_m,
+            'hnsw_m': self.hnsw_m,
+            'nprobe': self.nprobe,
+            'ef_search': self.ef_search,
+            'rerank_factor': self.rerank_factor
+        }
+
+    def _ensure_staged(self):
+        """
+        Move the metadata and full vectors of a published snapshot, which is never
+        modified, into a new version before they are changed.
+        """
+        if self._versions is None or self._staged_paths is not None:
+            return
+        index_filepath, metadata_filepath = self._versions.create()
+        self.store.save_as(metadata_filepath, reopen=True)
+        if self.full_vectors is not None:
+            self.full_vectors.save_as(self._full_vectors_path(index_filepath), reopen=True)
+        self._staged_paths = (os.path.abspath(index_filepath), os.path.abspath(metadata_filepath))
+        print(f"Changes are staged in {os.path.dirname(index_filepath)} until the next checkpoint")
+
+    def _discard_staged(self):
+        """
+        Delete a staged version that was never published. The write-ahead log of the
+        loaded snapshot still holds its changes.
+        """
+        if self._staged_paths is not None:
+            self._versions.discard(self._staged_paths[0]) # type: ignore
+            self._staged_paths = None
+
+    def _ensure_writable(self):
+        """
+        Replace a memory-mapped, read-only index with an in-memory copy before it is modified.
+        """
+        self._ensure_staged()
+        if self._mmap_source is not None:
+            print(f"Loading {self._mmap_source} into memory for writing...")
+            self.index = faiss.read_index(self._mmap_source)
+            self._mmap_source = None
+
+    def _reader_index(self):
+        """
+        Return the index searches run against: the last published one while a staged update is in progress.
+        """
+        published = self._published_index
+        return published if published is not None else self.index
+
+    @contextmanager
+    def staged_update(self):
+        """
+        Context manager that applies a batch of writes to a private copy of the index
+        and publishes it with a single reference swap on exit.
+
+        Searches keep running against the previous index while the batch is applied,
+        instead of racing with add_with_ids and remove_ids on the live one. Metadata
+        and keyword changes are visible at once; vector hits of added rows show up
+        when the copy is published. GPU indexes cannot be copied and are updated in place.
+
+        Compaction renumbers every Faiss ID, which the published index still uses,
+        so deletes inside the batch postpone it until the copy has been published.
+        """
+        with self._write_lock:
+            if self._published_index is not None:
+                # Nested inside another staged update
+                yield self
+                return
+            on_gpu = self.use_gpu and faiss.get_num_gpus() > 0 and self._current_index_type() != "hnsw"
+            if not on_gpu:
+                self._published_index = self.index
+                if self._mmap_source is not None:
+                    self._ensure_writable()  # Reads a private copy from the mapped file
+                else:
+                    self.index = faiss.clone_index(self.index)
+            try:
+                yield self
+            finally:
+                self._published_index = None
+            if self._compact_on_publish:
+                self._compact_on_publish = False
+                self.compact()
+
+    @staticmethod
+    def _mmap_flags(index_filepath):
+        """
+        Pick the Faiss I/O flags that memory-map the given index file.
+        """
+        with open(index_filepath, 'rb') as f:
+            fourcc = f.read(4)
+        # IVF inverted lists are mapped with IO_FLAG_MMAP, flat code arrays with IO_FLAG_MMAP_IFC
+        if fourcc[:2] in (b"Iw", b"Iv"):
+            return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
     def _build_index(self):
         """
         Initialize and build the Faiss index.
@@ -30,81 +259,390 @@ class Memory:
         try:
             if self.use_gpu and faiss.get_num_gpus() > 0:
                 print("Using GPU version of Faiss...")
-                index_flat = faiss.IndexFlatL2(0)  # Dimension will be set later
-                res = faiss.StandardGpuResources()  # type: ignore # Use a single GPU
-                index_flat = faiss.index_cpu_to_gpu(res, 0, index_flat) # type: ignore
-                self.index = faiss.IndexIDMap(index_flat)
             else:
                 print("Using CPU version of Faiss...")
-                index_flat = faiss.IndexFlatL2(0)  # Dimension will be set later
-                self.index = faiss.IndexIDMap(index_flat)
+            self.index = self._create_index("flat", 0)  # Dimension will be set later
         except Exception as e:
             print(f"Error initializing Faiss index: {e}")
             raise
 
-    def get_embedding(self, text, model="all-minilm:latest"):
+    def _to_gpu(self, index):
+        """
+        Move an index to the first GPU when GPU acceleration is enabled and available.
+        """
+        if self.use_gpu and faiss.get_num_gpus() > 0:
+            res = faiss.StandardGpuResources() # type: ignore
+            return faiss.index_cpu_to_gpu(res, 0, index) # type: ignore
+        return index
+
+    def _resolve_index_type(self, n_vectors):
+        """
+        Map the configured index type to a concrete one, choosing by vector count for "auto".
+        """
+        if self.index_type != "auto":
+            return self.index_type
+        if n_vectors < AUTO_FLAT_MAX_VECTORS:
+            return "flat"
+        if n_vectors < AUTO_HNSW_MAX_VECTORS:
+            return "hnsw"
+        if n_vectors < AUTO_IVF_FLAT_MAX_VECTORS:
+            return "ivf_flat"
+        return "ivf_pq"
+
+    def _create_index(self, index_type, dimension, train_vectors=None):
+        """
+        Create an empty Faiss index of the given type, training it on train_vectors if it needs training.
+
+        A layout that needs training gets a flat index instead when there are too few
+        train_vectors for it; _grow_index trains it once enough vectors have been added.
+
+        Args:
+            index_type (str): One of "flat", "ivf_flat", "ivf_pq", "hnsw", "sq8" or "pq".
+            dimension (int): Embedding dimension.
+            train_vectors (np.ndarray, optional): Vectors used to train IVF and quantized variants.
+
+        Returns:
+            faiss.Index: An index that accepts add_with_ids.
+        """
+        n_train = 0 if train_vectors is None else len(train_vectors)
+        if index_type == "flat" or (index_type in TRAINED_INDEX_TYPES and n_train < self._min_training_vectors(index_type)):
+            return faiss.IndexIDMap2(self._to_gpu(faiss.IndexFlatL2(dimension)))
+
+        if index_type == "hnsw":
+            # HNSW has no GPU implementation and does not take ids itself
+            return faiss.IndexIDMap2(faiss.IndexHNSWFlat(dimension, self.hnsw_m))
+
+        if index_type in ("sq8", "pq"):
+            if index_type == "sq8":
+                index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+            else:
+                pq_m = self._pq_subquantizers(dimension)
+                nbits = max(1, min(8, int(math.log2(max(n_train // 39, 2)))))
+                index = faiss.IndexPQ(dimension, pq_m, nbits)
+            # Train before wrapping: IndexIDMap2 copies is_trained when it is created
+            if train_vectors is not None:
+                index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+            return faiss.IndexIDMap2(index)
+
+        if index_type in ("ivf_flat", "ivf_pq"):
+            # IVF indexes store ids in their inverted lists, so they need no IDMap wrapper
+            nlist = self.nlist or int(4 * math.sqrt(max(n_train, 1)))
+            # Keep at least 39 training points per cluster, as Faiss recommends
+            nlist = max(1, min(nlist, n_train // 39 if n_train >= 39 else 1))
+            quantizer = faiss.IndexFlatL2(dimension)
+            if index_type == "ivf_flat":
+                index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+            else:
+                pq_m = self._pq_subquantizers(dimension)
+                # Codebooks also need enough points per centroid: 2 ** nbits * 39
+                nbits = max(1, min(8, int(math.log2(max(n_train // 39, 2)))))
+                index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, nbits)
+            index.nprobe = min(self.nprobe, nlist)
+            if train_vectors is not None:
+                index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+            return self._to_gpu(index)
+
+        raise ValueError(f"Unsupported index type '{index_type}'.")
+
+    def _min_training_vectors(self, index_type):
+        """
+        Return how many vectors an index of the given type waits for before it is trained.
+        """
+        if index_type in ("ivf_flat", "ivf_pq") and self.nlist:
+            return max(MIN_TRAINING_VECTORS, 39 * self.nlist)
+        return MIN_TRAINING_VECTORS
+
+    def _grow_index(self):
+        """
+        Rebuild the index once it holds enough vectors for a better layout: a flat
+        index buffering vectors for a layout that needs training is trained once it
+        has MIN_TRAINING_VECTORS of them, and "auto" moves on to the next layout
+        as its vector-count thresholds are crossed. Indexes are never shrunk back.
+        """
+        n_vectors = self.index.ntotal - len(self._tombstones) # type: ignore
+        current = self._current_index_type()
+        target = self._resolve_index_type(n_vectors)
+        if self.index_type == "auto":
+            order = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+            if current not in order or order.index(target) <= order.index(current):
+                return
+        elif current != "flat" or target not in TRAINED_INDEX_TYPES:
+            return
+        if target in TRAINED_INDEX_TYPES and n_vectors < self._min_training_vectors(target):
+            return
+        print(f"Faiss index reached {n_vectors} vectors; rebuilding it as {target}")
+        self.rebuild_index()
+
+    def _pq_subquantizers(self, dimension):
+        """
+        Return the largest number of sub-quantizers up to pq_m that divides the dimension.
+        """
+        return max(m for m in range(1, min(self.pq_m, dimension) + 1) if dimension % m == 0)
+
+    def _current_index_type(self, index=None):
+        """
+        Detect the concrete type of the loaded Faiss index, or of the given one.
+        """
+        index = index if index is not None else self.index
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if isinstance(index, faiss.IndexHNSW):
+            return "hnsw"
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            return "sq8"
+        if isinstance(index, faiss.IndexPQ):
+            return "pq"
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+        return "flat"
+
+    def _search_params(self, nprobe=None, ef_search=None, selector=None, index=None):
+        """
+        Build per-query search parameters for the current index type, optionally
+        restricted to the IDs accepted by a Faiss IDSelector.
+        """
+        index_type = self._current_index_type(index)
+        if index_type in ("ivf_flat", "ivf_pq"):
+            if selector is not None:
+                return faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe, sel=selector)
+            return faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe)
+        if index_type == "hnsw":
+            if selector is not None:
+                return faiss.SearchParametersHNSW(efSearch=ef_search or self.ef_search, sel=selector)
+            return faiss.SearchParametersHNSW(efSearch=ef_search or self.ef_search)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+
+    def _keeps_full_vectors(self):
+        """
+        Whether full float32 vectors are kept on disk for re-ranking the current index.
+        """
+        return self.rerank_factor > 0 and self._current_index_type() in QUANTIZED_INDEX_TYPES
+
+    def _full_vector_file(self):
+        """
+        Return the full-vector file, creating a temporary one until the index is first saved.
+        """
+        if self.full_vectors is None:
+            self.full_vectors = FullVectorFile(self.dimension)
+        return self.full_vectors
+
+    def _supports_removal(self):
+        """
+        Whether vectors can be physically removed from the current index.
+        """
+        return self._current_index_type() != "hnsw"
+
+    def _registry(self):
         """
-        Generate an embedding for the given text using Ollama's embed function.
+        Return the vector_id -> faiss_id hash map, building it from the store on first use.
+        """
+        if self._id_registry is None:
+            self._id_registry = {vector_id: faiss_id for faiss_id, vector_id in self.store.iter_ids()}
+        return self._id_registry
+
+    def _next_faiss_id(self):
+        """
+        Return the next unused Faiss ID, reading the persisted counter on first use.
+        """
+        if self._next_id is None:
+            self._next_id = max(
+                self.store.get_setting('next_faiss_id', 0),
+                self.store.next_faiss_id(),
+                max(self._tombstones, default=-1) + 1
+            )
+        return self._next_id
+
+    def _new_vector_id(self):
+        """
+        Generate the next unused "vector_<n>" ID.
+
+        The counter is separate from Faiss IDs, which compact() renumbers.
+        """
+        if self._next_vector_number is None:
+            self._next_vector_number = self.store.get_setting('next_vector_number', self._next_faiss_id() + 1)
+        registry = self._registry()
+        while f"vector_{self._next_vector_number}" in registry:
+            self._next_vector_number += 1
+        vector_id = f"vector_{self._next_vector_number}"
+        self._next_vector_number += 1
+        return vector_id
+
+    def _reconstruct_all(self):
+        """
+        Read every (faiss_id, vector) pair back out of the current index.
+
+        Returns:
+            tuple: An int64 id array and a float32 matrix of the matching vectors.
+        """
+        index = self.index
+        if index.ntotal == 0: # type: ignore
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimension or 0), dtype=np.float32)
+
+        if isinstance(index, faiss.IndexIDMap):
+            ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+            if self.full_vectors is not None:
+                # Quantized codes only approximate the vectors; use the exact copies
+                return ids, self.full_vectors.read(ids)
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+            return ids, vectors
+
+        if self.use_gpu and faiss.get_num_gpus() > 0:
+            index = faiss.index_gpu_to_cpu(index) # type: ignore
+        ivf = faiss.extract_index_ivf(index)
+        invlists = ivf.invlists
+        ids = np.concatenate([
+            faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+            for l in range(ivf.nlist) if invlists.list_size(l) > 0
+        ]).astype(np.int64)
+        if self.full_vectors is not None:
+            return ids, self.full_vectors.read(ids)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        vectors = ivf.reconstruct_batch(ids)
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        return ids, vectors
+
+    def rebuild_index(self, index_type=None):
+        """
+        Rebuild the Faiss index, optionally switching its type, and retrain it on every stored vector.
+
+        For "auto" the type is chosen from the current vector count. Rebuilding from
+        a quantized index re-encodes its approximate vectors, unless full vectors are
+        kept on disk for re-ranking.
+
+        A layout that needs training is kept flat while there are fewer vectors than
+        it is trained on, with a warning; asking for it explicitly then fails instead.
+
+        Args:
+            index_type (str, optional): New index type. Defaults to the configured one.
+
+        Raises:
+            ValueError: If index_type is unsupported, or needs training and there are too few vectors.
+        """
+        try:
+            if index_type is not None and index_type not in INDEX_TYPES:
+                raise ValueError(f"Unsupported index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+            if self.dimension is None:
+                if index_type is not None:
+                    self.index_type = index_type
+                return
+
+            ids, vectors = self._reconstruct_all()
+            if self._tombstones:
+                live = ~np.isin(ids, list(self._tombstones))
+                ids, vectors = ids[live], vectors[live]
+            configured, self.index_type = self.index_type, index_type or self.index_type
+            concrete_type = self._resolve_index_type(len(ids))
+            if concrete_type in TRAINED_INDEX_TYPES and len(ids) < self._min_training_vectors(concrete_type):
+                message = f"{len(ids)} vectors are too few to train {concrete_type}, which needs {self._min_training_vectors(concrete_type)}"
+                if index_type is not None:
+                    self.index_type = configured
+                    raise ValueError(message)
+                print(f"Warning: {message}; keeping them in a flat index until then")
+            self._ensure_staged()
+            self._mmap_source = None
+            index = self._create_index(concrete_type, self.dimension, train_vectors=vectors if len(ids) else None)
+            if len(ids):
+                index.add_with_ids(vectors, ids) # type: ignore
+            self.index = index
+            if self._keeps_full_vectors():
+                self._full_vector_file().write(ids, vectors)
+            elif self.full_vectors is not None:
+                self.full_vectors.close()
+                self.full_vectors = None
+            self._tombstones = set()
+            self.store.clear_tombstones()
+            print(f"Faiss index rebuilt as {self._current_index_type()} with {self.index.ntotal} vectors")
+        except Exception as e:
+            print(f"Error rebuilding Faiss index: {e}")
+            raise
+
+    def get_embedding(self, text, model=None):
+        """
+        Generate an embedding for the given text with the embedding backend.
         
         Args:
             text (str): The text to generate an embedding for.
+            model (str, optional): A model for the backend to use instead of its own.
         
         Returns:
             np.ndarray: The embedding vector.
         """
-        try:
-            # Prepare the ollama command
-            #command = ['ollama', 'embed', '--json', text]
+        return self.get_embeddings([text], model=model)[0]
 
-            # Call the command using subprocess
-            #result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    def get_embeddings(self, texts, model=None):
+        """
+        Generate embeddings for a batch of texts with the embedding backend, which
+        sends them to its model in batches of up to its max_batch_size.
+
+        Texts already in the embedding cache are served from it and only the
+        remaining ones are sent to the backend.
 
-            #if result.returncode != 0:
-            #    print(f"Ollama error: {result.stderr}")
-            #    raise Exception("Failed to generate embedding using Ollama.")
+        Args:
+            texts (list[str]): The texts to generate embeddings for.
+            model (str, optional): A model for the backend to use instead of its own.
+                Its embeddings are cached under that model's key.
 
-            # Parse the JSON output
-            #output = result.stdout.strip()
-            #embedding_data = json.loads(output)
+        Returns:
+            np.ndarray: A float32 matrix with one embedding per row.
+        """
+        try:
+            texts = list(texts)
+            key = self.embedding_backend.key_for(model)
+            cached = self.embedding_cache.get_many(key, texts) if self.embedding_cache else [None] * len(texts)
+            missing = [i for i, vector in enumerate(cached) if vector is None]
 
-            # Get the embedding vector
-            embedding = ollama.embed(model, text).embeddings[0] #embedding_data.get('embedding')
-            if embedding is None:
-                raise Exception("Embedding not found in Ollama's output.")
+            if missing:
+                missing_texts = [texts[i] for i in missing]
+                new_vectors, produced_by = self.embedding_backend.embed_keyed(missing_texts, model)
+                if self.embedding_cache:
+                    # A fallback backend's vectors are cached under its own model
+                    self.embedding_cache.put_many(produced_by, missing_texts, new_vectors)
+                for i, vector in zip(missing, new_vectors):
+                    cached[i] = vector
 
-            # Convert the embedding to a NumPy array
-            embedding_vector = np.array(embedding, dtype=np.float32)
+            # Stack the embeddings into a single float32 matrix
+            embedding_matrix = np.vstack(cached).astype(np.float32, copy=False)
 
             # Set the dimension if not already set
             if self.dimension is None:
-                self.dimension = len(embedding_vector)
+                self.dimension = embedding_matrix.shape[1]
                 # Update the Faiss index with the correct dimension
                 self._update_index_dimension()
 
-            return embedding_vector
+            return embedding_matrix
         except Exception as e:
-            print(f"Error generating embedding: {e}")
+            print(f"Error generating embeddings: {e}")
             raise
 
     def _update_index_dimension(self):
         """
         Update the Faiss index with the correct embedding dimension after obtaining the first embedding.
+
+        Layouts that need training start as a flat index; _grow_index trains them
+        once enough vectors have been added.
         """
         try:
-            if self.use_gpu and faiss.get_num_gpus() > 0:
-                index_flat = faiss.IndexFlatL2(self.dimension)
-                res = faiss.StandardGpuResources() # type: ignore
-                index_flat = faiss.index_cpu_to_gpu(res, 0, index_flat) # type: ignore
-                self.index = faiss.IndexIDMap(index_flat)
-            else:
-                index_flat = faiss.IndexFlatL2(self.dimension)
-                self.index = faiss.IndexIDMap(index_flat)
+            index_type = self._resolve_index_type(0)
+            self.index = self._create_index(index_type, self.dimension)
+            # The new index replaces any memory-mapped one, which must not be re-read for writing
+            self._mmap_source = None
 
             print(f"Faiss index updated with dimension: {self.dimension}")
         except Exception as e:
             print(f"Error updating Faiss index dimension: {e}")
             raise
 
+    def _ensure_trained(self, vectors):
+        """
+        Replace an empty, untrained index, such as one saved by an older version,
+        before vectors are added to it.
+        """
+        if not self.index.is_trained: # type: ignore
+            self.index = self._create_index(self._resolve_index_type(len(vectors)), self.dimension, train_vectors=vectors)
+
     def add_memory(self, content: str, metadata: dict = None, vector_id: str = None): # type: ignore
         """
         Add text content with optional metadata to Faiss after generating its embedding.
@@ -115,72 +653,520 @@ class Memory:
             vector_id (str, optional): Custom ID for the vector.
         """
         try:
+            self._ensure_writable()
+
             # Generate embedding for the content using Ollama
             vector = self.get_embedding(content)
 
-            # Generate a unique ID if not provided
-            if not vector_id:
-                vector_id = f"vector_{len(self.vector_ids) + 1}"
+            return self.add_vectors(
+                np.array([vector], dtype=np.float32),
+                [content],
+                [metadata] if metadata is not None else None, # type: ignore
+                [vector_id] if vector_id else None # type: ignore
+            )[0]
+        except Exception as e:
+            print(f"Error adding vector to Faiss: {e}")
+            raise
 
-            # Use integer IDs for Faiss
-            faiss_id = len(self.vector_ids)
+    def add_vectors(self, vectors, contents: list, metadatas: list = None, vector_ids: list = None): # type: ignore
+        """
+        Add precomputed embedding vectors to Faiss with a single add_with_ids call.
 
-            # Add the vector to the index with its integer ID
-            self.index.add_with_ids(np.array([vector], dtype=np.float32), np.array([faiss_id], dtype=np.int64)) # type: ignore
+        Args:
+            vectors (np.ndarray): A float32 matrix with one embedding per row.
+            contents (list[str]): The text content each vector was generated from.
+            metadatas (list[dict], optional): Metadata for each vector.
+            vector_ids (list[str], optional): Custom IDs for each vector.
 
-            # Store the mapping from faiss_id to vector_id
-            self.vector_ids.append(vector_id)
-            if metadata is not None:
-                self.metadata[vector_id] = metadata
-            else:
-                self.metadata[vector_id] = {'content': content}
+        Returns:
+            list: The vector IDs of the added contents.
+        """
+        with self._write_lock:
+            return self._add_vectors(vectors, contents, metadatas, vector_ids)
+
+    def _add_vectors(self, vectors, contents, metadatas, vector_ids):
+        try:
+            self._ensure_writable()
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                self._update_index_dimension()
 
-            return vector_id
+            # Assign consecutive integer IDs for Faiss
+            start = self._next_faiss_id()
+            faiss_ids = np.arange(start, start + len(vectors), dtype=np.int64)
+
+            rows = []
+            for i, content in enumerate(contents):
+                vector_id = vector_ids[i] if vector_ids and vector_ids[i] else self._new_vector_id()
+                metadata = metadatas[i] if metadatas else None
+                rows.append((faiss_ids[i], vector_id, metadata if metadata is not None else {'content': content}))
+
+            # Logged before it is applied, so a crash in between is repaired by replay
+            self._reject_duplicate_ids(rows)
+            self._log({
+                "op": "add",
+                "rows": [[int(faiss_id), vector_id, metadata] for faiss_id, vector_id, metadata in rows],
+                "contents": list(contents),
+                "vectors": encode_vectors(vectors),
+                "dimension": int(vectors.shape[1])
+            })
+            # The logged Faiss IDs are taken even if applying them fails
+            self._next_id = start + len(vectors)
+            self._apply_add(vectors, rows, texts=contents)
+
+            return [row[1] for row in rows]
         except Exception as e:
-            print(f"Error adding vector to Faiss: {e}")
+            print(f"Error adding vectors to Faiss: {e}")
             raise
 
-    def search_memory(self, query: str, k: int = 1):
+    @staticmethod
+    def _lexical_text(metadata):
+        """
+        Pick the text the keyword index holds for a vector whose content is not at hand.
+        """
+        return metadata.get('text') or metadata.get('content') or metadata.get('doc_name', '')
+
+    def _reject_duplicate_ids(self, rows):
+        """
+        Raise ValueError if a vector ID of the given rows is taken, or repeated among them.
+        """
+        registry = self._registry()
+        seen = set()
+        for _, vector_id, _ in rows:
+            if vector_id in registry or vector_id in seen:
+                raise ValueError(f"Vector ID '{vector_id}' already exists.")
+            seen.add(vector_id)
+
+    def _apply_add(self, vectors, rows, replace=False, texts=None):
+        """
+        Add vectors and their metadata rows to the index, store and keyword index.
+
+        Args:
+            vectors (np.ndarray): A float32 matrix with one embedding per row.
+            rows (list[tuple]): (faiss_id, vector_id, metadata) tuples for each vector.
+            replace (bool): Whether existing rows may be overwritten, as when replaying the log.
+            texts (list[str], optional): Text to keyword-index for each vector. Taken from the metadata if None.
+        """
+        faiss_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        registry = self._registry()
+        if not replace:
+            self._reject_duplicate_ids(rows)
+
+        # Store the mapping from faiss_id to vector_id first, so duplicate IDs are rejected
+        # before the index is touched
+        if replace:
+            self.store.upsert_many(rows)
+        else:
+            self.store.insert_many(rows)
+        try:
+            self._ensure_trained(vectors)
+            self.index.add_with_ids(vectors, faiss_ids) # type: ignore
+        except Exception:
+            self.store.delete_many(faiss_ids)
+            raise
+        if self._keeps_full_vectors():
+            self._full_vector_file().write(faiss_ids, vectors)
+        self._grow_index()
+
+        for faiss_id, vector_id, _ in rows:
+            registry[vector_id] = int(faiss_id)
+        # Advanced before the keyword index, so a failure there cannot hand out these IDs again
+        self._next_id = max(self._next_faiss_id(), int(faiss_ids.max()) + 1)
+        self.store.set_setting('next_faiss_id', self._next_id)
+        self.lexical.add(faiss_ids, texts if texts is not None else [self._lexical_text(row[2]) for row in rows])
+        if self._next_vector_number is not None:
+            self.store.set_setting('next_vector_number', self._next_vector_number)
+
+    def _apply_delete(self, rows):
+        """
+        Delete vectors and their metadata rows.
+
+        Vectors the index cannot physically remove are tombstoned instead: they are
+        skipped by searches and dropped by the next compact().
+
+        Args:
+            rows (list[tuple]): (faiss_id, vector_id) pairs to delete.
+        """
+        self._ensure_writable()
+        faiss_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        if self._supports_removal():
+            self.index.remove_ids(faiss_ids) # type: ignore
+        else:
+            self._tombstones.update(faiss_ids.tolist())
+            self.store.add_tombstones(faiss_ids)
+        self.store.delete_many(faiss_ids)
+        self.lexical.remove(faiss_ids)
+        registry = self._registry()
+        for faiss_id, vector_id in rows:
+            if registry.get(vector_id) == faiss_id:
+                del registry[vector_id]
+
+    def _apply_update(self, faiss_id, vector_id, vector, metadata):
+        """
+        Replace the vector and metadata stored under an existing Faiss ID.
+        """
+        self._ensure_writable()
+        ids = np.array([faiss_id], dtype=np.int64)
+
+        # Remove the old vector
+        self.index.remove_ids(ids) # type: ignore
+
+        # Add the new vector with the same Faiss ID
+        self.index.add_with_ids(np.array([vector], dtype=np.float32), ids) # type: ignore
+        if self._keeps_full_vectors():
+            self._full_vector_file().write(ids, np.array([vector], dtype=np.float32))
+
+        # Update metadata
+        self.store.upsert_many([(faiss_id, vector_id, metadata)])
+        self.lexical.add([faiss_id], [self._lexical_text(metadata)])
+
+    def _log(self, record):
+        """
+        Append an operation to the write-ahead log, if one is attached.
+        """
+        if self.wal is not None:
+            self.wal.append(record)
+
+    def set_setting(self, key, value):
+        """
+        Store a JSON-serializable value, such as a synchroniser's cursor, with the metadata.
+        """
+        with self._write_lock:
+            self._ensure_staged()
+            self._log({"op": "setting", "key": key, "value": value})
+            self.store.set_setting(key, value)
+
+    def add_memories(self, contents: list, metadatas: list = None, vector_ids: list = None, batch_size: int = 64): # type: ignore
+        """
+        Add many text contents to Faiss, embedding and inserting them in batches.
+
+        Each batch is embedded with one Ollama call and inserted with one add_with_ids
+        call, instead of one round-trip and one insertion per content.
+
+        Args:
+            contents (list[str]): The text contents to add to the index.
+            metadatas (list[dict], optional): Metadata for each content.
+            vector_ids (list[str], optional): Custom IDs for each content.
+            batch_size (int, optional): Number of contents embedded per request.
+
+        Returns:
+            list: The vector IDs of the added contents.
+        """
+        if metadatas is not None and len(metadatas) != len(contents):
+            raise ValueError("metadatas must have the same length as contents.")
+        if vector_ids is not None and len(vector_ids) != len(contents):
+            raise ValueError("vector_ids must have the same length as contents.")
+
+        added_ids = []
+        for start in range(0, len(contents), batch_size):
+            end = start + batch_size
+            batch = contents[start:end]
+            vectors = self.get_embeddings(batch)
+            added_ids.extend(self.add_vectors(
+                vectors,
+                batch,
+                metadatas[start:end] if metadatas is not None else None, # type: ignore
+                vector_ids[start:end] if vector_ids is not None else None # type: ignore
+            ))
+        return added_ids
+
+    def search_memory(self, query: str, k: int = 1, nprobe: int = None, ef_search: int = None, filter: dict = None): # type: ignore
         """
         Search for similar contents in Faiss based on a query text.
 
         Args:
             query (str): The query text to search with.
             k (int, optional): Number of similar contents to retrieve.
+            nprobe (int, optional): IVF clusters to visit for this query. Defaults to self.nprobe.
+            ef_search (int, optional): HNSW search queue size for this query. Defaults to self.ef_search.
+            filter (dict, optional): Metadata field -> value or list of values that results must match,
+                e.g. {"doc_type": "judgment", "jurisdiction": ["UG", "KE"]}. Applied before the search,
+                so k results come back whenever k contents match.
 
         Returns:
             list: A list of dicts containing 'id', 'distance', and 'metadata' of the most similar contents.
         """
+        return self.search_many([query], k=k, nprobe=nprobe, ef_search=ef_search, filter=filter)[0]
+
+    def search_many(self, queries: list, k: int = 1, nprobe: int = None, ef_search: int = None, filter: dict = None): # type: ignore
+        """
+        Search for similar contents for several query texts at once.
+
+        All queries are embedded with one Ollama call and searched with one
+        index.search call on the stacked query matrix, and the metadata of every
+        hit is fetched in one store lookup.
+
+        Args:
+            queries (list[str]): The query texts to search with.
+            k (int, optional): Number of similar contents to retrieve per query.
+            nprobe (int, optional): IVF clusters to visit per query. Defaults to self.nprobe.
+            ef_search (int, optional): HNSW search queue size per query. Defaults to self.ef_search.
+            filter (dict, optional): Metadata filter applied to every query. See search_memory.
+
+        Returns:
+            list: One list of result dicts per query, in the order of queries, each shaped like search_memory's.
+        """
         try:
-            if self.dimension is None or self.index.ntotal == 0: # type: ignore
+            queries = list(queries)
+            if self.dimension is None or self._reader_index().ntotal == 0: # type: ignore
                 print("Index is empty or not initialized.")
+                return [[] for _ in queries]
+            if not queries:
                 return []
 
-            # Generate embedding for the query using Ollama
-            query_vector = self.get_embedding(query)
-
-            # Search for the k most similar vectors
-            distances, indices = self.index.search(np.array([query_vector], dtype=np.float32), k) # type: ignore
-
-            # Prepare results
-            results = []
-            for i in range(len(indices[0])):
-                faiss_idx = indices[0][i]
-                distance = distances[0][i]
-                if faiss_idx != -1 and faiss_idx < len(self.vector_ids):
-                    vector_id = self.vector_ids[faiss_idx]
-                    result = {
-                        "id": vector_id,
-                        "distance": distance,
-                        "metadata": self.metadata.get(vector_id, {})
-                    }
-                    results.append(result)
-
-            return results
+            # Generate embeddings for the queries using Ollama, before compaction is held off
+            query_vectors = self.get_embeddings(queries)
+
+            with self._search_lock.shared():
+                allowed_ids = self.store.filter_ids(filter) if filter is not None else None
+                if allowed_ids is not None and len(allowed_ids) == 0:
+                    return [[] for _ in queries]
+                hits_per_query = self._vector_hits(query_vectors, k, nprobe, ef_search, allowed_ids)
+
+                # Fetch metadata for the hits only
+                rows = self.store.get_many({faiss_idx for hits in hits_per_query for faiss_idx, _ in hits})
+
+                # Prepare results
+                all_results = []
+                for hits in hits_per_query:
+                    results = []
+                    for faiss_idx, distance in hits:
+                        if faiss_idx in rows:
+                            vector_id, metadata = rows[faiss_idx]
+                            result = {
+                                "id": vector_id,
+                                "distance": distance,
+                                "metadata": metadata
+                            }
+                            results.append(result)
+                    all_results.append(results[:k])
+
+                return all_results
         except Exception as e:
             print(f"Error searching Faiss index: {e}")
             raise
 
+    def _vector_hits(self, query_vectors, k, nprobe=None, ef_search=None, allowed_ids=None):
+        """
+        Search a matrix of query vectors with one index.search call.
+
+        Args:
+            allowed_ids (np.ndarray, optional): Sorted Faiss IDs the search is restricted to.
+
+        Returns:
+            list: For each query, up to k (faiss_id, distance) pairs, skipping tombstoned ones.
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        rerank = self.full_vectors is not None and self._keeps_full_vectors()
+        candidates = k * self.rerank_factor if rerank else k
+        index = self._reader_index()
+
+        if allowed_ids is not None:
+            distances, indices = self._filtered_search(query_vectors, candidates, allowed_ids, nprobe, ef_search, index)
+        else:
+            # Fetch extra to make up for tombstoned vectors
+            fetch_k = min(candidates + len(self._tombstones), index.ntotal) # type: ignore
+            distances, indices = index.search( # type: ignore
+                query_vectors, fetch_k, params=self._search_params(nprobe, ef_search, index=index)
+            )
+        hits_per_query = []
+        for query_vector, row_indices, row_distances in zip(query_vectors, indices, distances):
+            hits = [
+                (int(faiss_idx), distance) for faiss_idx, distance in zip(row_indices, row_distances)
+                if faiss_idx != -1 and faiss_idx not in self._tombstones
+            ][:candidates]
+            if rerank and hits:
+                # Re-rank the candidates by exact L2 distance to their full vectors
+                exact = self.full_vectors.read([faiss_idx for faiss_idx, _ in hits]) # type: ignore
+                exact_distances = ((exact - query_vector) ** 2).sum(axis=1)
+                order = np.argsort(exact_distances, kind="stable")
+                hits = [(hits[i][0], exact_distances[i]) for i in order]
+            hits_per_query.append(hits[:k])
+        return hits_per_query
+
+    def _filtered_search(self, query_vectors, k, allowed_ids, nprobe=None, ef_search=None, index=None):
+        """
+        Search only the vectors whose Faiss IDs are in allowed_ids.
+
+        The index skips every other vector through an IDSelectorBitmap. An approximate
+        index can still return fewer than k hits when few vectors match (HNSW leaves
+        the graph region, IVF probes lists without matches); those queries are redone
+        exhaustively: IVF over every list, other indexes by exact scoring of the
+        allowed vectors.
+
+        Returns:
+            tuple: (distances, indices) matrices shaped like index.search's, padded with -1 indices.
+        """
+        index = index if index is not None else self._reader_index()
+        fetch_k = min(k, len(allowed_ids))
+        index_type = self._current_index_type(index)
+        on_gpu = self.use_gpu and faiss.get_num_gpus() > 0 and index_type != "hnsw"
+        if index_type == "pq" or on_gpu:
+            # IndexPQ and GPU indexes take no selector
+            return self._exact_search(query_vectors, fetch_k, allowed_ids, index)
+
+        mask = np.zeros(int(allowed_ids[-1]) + 1, dtype=bool)
+        mask[allowed_ids] = True
+        bitmap = np.packbits(mask, bitorder="little")  # Must stay alive while the selector is used
+        # IDSelectorBitmap takes the bitmap's length in bytes
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        if index_type == "hnsw":
+            ef_search = max(ef_search or self.ef_search, fetch_k)
+        distances, indices = index.search( # type: ignore
+            query_vectors, fetch_k, params=self._search_params(nprobe, ef_search, selector, index)
+        )
+
+        short = np.flatnonzero((indices != -1).sum(axis=1) < fetch_k)
+        if len(short):
+            if index_type in ("ivf_flat", "ivf_pq"):
+                nlist = faiss.extract_index_ivf(index).nlist
+                retry = index.search( # type: ignore
+                    query_vectors[short], fetch_k, params=self._search_params(nlist, None, selector, index)
+                )
+            elif len(allowed_ids) <= FILTER_EXACT_MAX_IDS:
+                retry = self._exact_search(query_vectors[short], fetch_k, allowed_ids, index)
+            else:
+                retry = None
+            if retry is not None:
+                distances[short], indices[short] = retry
+        return distances, indices
+
+    def _exact_search(self, query_vectors, k, faiss_ids, index=None):
+        """
+        Score the vectors with the given Faiss IDs exhaustively against the query vectors.
+        """
+        if self.full_vectors is not None:
+            vectors = self.full_vectors.read(faiss_ids)
+        else:
+            index = index if index is not None else self._reader_index()
+            vectors = index.reconstruct_batch(faiss_ids) # type: ignore
+        distances, positions = faiss.knn(query_vectors, np.ascontiguousarray(vectors, dtype=np.float32), k)
+        indices = np.where(positions >= 0, np.asarray(faiss_ids)[np.maximum(positions, 0)], -1)
+        return distances, indices
+
+    def search_hybrid(self, query: str, k: int = 5, fetch_k: int = None, rrf_k: int = RRF_K, nprobe: int = None, ef_search: int = None, filter: dict = None): # type: ignore
+        """
+        Search with both the keyword index and the Faiss index and fuse the two rankings.
+
+        Exact citations, case names and section numbers are found by BM25 even when
+        their embeddings are not close to the query's. Each hit scores
+        1 / (rrf_k + rank) in every ranking it appears in.
+
+        Args:
+            query (str): The query text to search with.
+            k (int, optional): Number of contents to retrieve.
+            fetch_k (int, optional): Number of hits taken from each ranking before fusion. Defaults to 4 * k.
+            rrf_k (int, optional): Rank offset that damps the weight of top ranks.
+            nprobe (int, optional): IVF clusters to visit for this query. Defaults to self.nprobe.
+            ef_search (int, optional): HNSW search queue size for this query. Defaults to self.ef_search.
+            filter (dict, optional): Metadata filter applied to both rankings. See search_memory.
+
+        Returns:
+            list: A list of dicts containing 'id', 'score', 'distance', 'bm25' and 'metadata', best first.
+            'distance' or 'bm25' is None for hits found by only one of the rankings.
+        """
+        return self.search_hybrid_many([query], k=k, fetch_k=fetch_k, rrf_k=rrf_k, nprobe=nprobe, ef_search=ef_search, filter=filter)[0]
+
+    def search_hybrid_many(self, queries: list, k: int = 5, fetch_k: int = None, rrf_k: int = RRF_K, nprobe: int = None, ef_search: int = None, filter: dict = None): # type: ignore
+        """
+        Run search_hybrid for several query texts, embedding and vector-searching them as one batch.
+
+        Args:
+            queries (list[str]): The query texts to search with.
+            k (int, optional): Number of contents to retrieve per query.
+            fetch_k (int, optional): Number of hits taken from each ranking before fusion. Defaults to 4 * k.
+            rrf_k (int, optional): Rank offset that damps the weight of top ranks.
+            nprobe (int, optional): IVF clusters to visit per query. Defaults to self.nprobe.
+            ef_search (int, optional): HNSW search queue size per query. Defaults to self.ef_search.
+            filter (dict, optional): Metadata filter applied to every query. See search_memory.
+
+        Returns:
+            list: One list of result dicts per query, in the order of queries, each shaped like search_hybrid's.
+        """
+        try:
+            queries = list(queries)
+            if not queries:
+                return []
+            fetch_k = fetch_k or 4 * k
+            has_vectors = self.dimension is not None and self._reader_index().ntotal > 0 # type: ignore
+            query_vectors = self.get_embeddings(queries) if has_vectors else None
+
+            with self._search_lock.shared():
+                allowed_ids = self.store.filter_ids(filter) if filter is not None else None
+                if allowed_ids is not None and len(allowed_ids) == 0:
+                    return [[] for _ in queries]
+                if has_vectors:
+                    vector_hits = self._vector_hits(query_vectors, fetch_k, nprobe, ef_search, allowed_ids)
+                else:
+                    vector_hits = [[] for _ in queries]
+
+                ranked_per_query = []
+                for query, query_vector_hits in zip(queries, vector_hits):
+                    fused = {}
+                    for hits, key in ((query_vector_hits, "distance"), (self.lexical.search(query, fetch_k, allowed_ids), "bm25")):
+                        for rank, (faiss_idx, value) in enumerate(hits, start=1):
+                            hit = fused.setdefault(faiss_idx, {"score": 0.0, "distance": None, "bm25": None})
+                            hit["score"] += 1.0 / (rrf_k + rank)
+                            hit[key] = value
+                    ranked_per_query.append(sorted(fused.items(), key=lambda item: item[1]["score"], reverse=True)[:k])
+
+                rows = self.store.get_many({faiss_idx for ranked in ranked_per_query for faiss_idx, _ in ranked})
+                all_results = []
+                for ranked in ranked_per_query:
+                    results = []
+                    for faiss_idx, hit in ranked:
+                        if faiss_idx in rows:
+                            vector_id, metadata = rows[faiss_idx]
+                            results.append({"id": vector_id, **hit, "metadata": metadata})
+                    all_results.append(results)
+                return all_results
+        except Exception as e:
+            print(f"Error searching hybrid index: {e}")
+            raise
+
+    def search_documents(self, query: str, k: int = 5, group_key: str = "doc_url", fetch_k: int = None, hybrid: bool = False, **search_kwargs): # type: ignore
+        """
+        Search chunked documents and collapse the hits to one result per document.
+
+        Each result carries the metadata of the document's best-matching chunk and
+        that chunk's text as its snippet.
+
+        Args:
+            query (str): The query text to search with.
+            k (int, optional): Number of documents to retrieve.
+            group_key (str, optional): Metadata field that identifies a chunk's document.
+            fetch_k (int, optional): Number of chunks to search before collapsing. Defaults to 10 * k.
+            hybrid (bool, optional): Whether to rank chunks with search_hybrid instead of search_memory.
+            **search_kwargs: Passed through to the search method.
+
+        Returns:
+            list: The search method's result dicts with an added 'snippet', best document first.
+        """
+        return self.search_documents_many([query], k, group_key, fetch_k, hybrid, **search_kwargs)[0]
+
+    def search_documents_many(self, queries: list, k: int = 5, group_key: str = "doc_url", fetch_k: int = None, hybrid: bool = False, **search_kwargs): # type: ignore
+        """
+        Run search_documents for several query texts as one batch.
+
+        Returns:
+            list: One list of result dicts per query, in the order of queries, each shaped like search_documents'.
+        """
+        search = self.search_hybrid_many if hybrid else self.search_many
+        all_documents = []
+        for hits in search(queries, k=fetch_k or 10 * k, **search_kwargs):
+            documents = {}
+            for hit in hits:
+                metadata = hit["metadata"]
+                key = metadata.get(group_key) or hit["id"]
+                if key in documents:
+                    continue
+                documents[key] = {**hit, "snippet": metadata.get("text", metadata.get("content", ""))}
+                if len(documents) == k:
+                    break
+            all_documents.append(list(documents.values()))
+        return all_documents
+
     def update_memory(self, vector_id: str, new_content: str):
         """
         Update an existing content in Faiss by its ID.
@@ -190,90 +1176,452 @@ class Memory:
             new_content (str): New content to replace the existing one.
         """
         try:
-            # Find the index of the vector to update
-            if vector_id not in self.vector_ids:
-                raise ValueError(f"Vector ID '{vector_id}' not found.")
-            faiss_id = self.vector_ids.index(vector_id)
-
-            # Remove the old vector
-            self.index.remove_ids(np.array([faiss_id], dtype=np.int64)) # type: ignore
-
             # Generate embedding for the new content using Ollama
             new_vector = self.get_embedding(new_content)
+            metadata = {'content': new_content}
 
-            # Add the new vector with the same Faiss ID
-            self.index.add_with_ids(np.array([new_vector], dtype=np.float32), np.array([faiss_id], dtype=np.int64)) # type: ignore
+            with self._write_lock:
+                # Find the index of the vector to update
+                faiss_id = self._registry().get(vector_id)
+                if faiss_id is None:
+                    raise ValueError(f"Vector ID '{vector_id}' not found.")
 
-            # Update metadata
-            self.metadata[vector_id] = {'content': new_content}
+                # Each change is logged before it is applied
+                if self._supports_removal():
+                    self._log({
+                        "op": "update",
+                        "faiss_id": faiss_id,
+                        "vector_id": vector_id,
+                        "metadata": metadata,
+                        "vectors": encode_vectors(np.array([new_vector])),
+                        "dimension": int(len(new_vector))
+                    })
+                    self._apply_update(faiss_id, vector_id, new_vector, metadata)
+                else:
+                    # Tombstone the old vector and add the new one under a fresh Faiss ID
+                    new_id = self._next_faiss_id()
+                    self._log({"op": "delete", "rows": [[faiss_id, vector_id]]})
+                    self._apply_delete([(faiss_id, vector_id)])
+                    self._log({
+                        "op": "add",
+                        "rows": [[new_id, vector_id, metadata]],
+                        "vectors": encode_vectors(np.array([new_vector])),
+                        "dimension": int(len(new_vector))
+                    })
+                    self._apply_add(np.array([new_vector], dtype=np.float32), [(new_id, vector_id, metadata)])
 
             print(f"Content with ID '{vector_id}' updated successfully.")
         except Exception as e:
             print(f"Error updating vector in Faiss: {e}")
             raise
 
+    def delete_memory(self, vector_id: str):
+        """
+        Delete a content from Faiss by its ID.
+
+        Args:
+            vector_id (str): ID of the content to delete.
+        """
+        if self.bulk_delete([vector_id]) == 0:
+            raise ValueError(f"Vector ID '{vector_id}' not found.")
+
+    def bulk_delete(self, vector_ids: list):
+        """
+        Delete several contents from Faiss by their IDs. Unknown IDs are ignored.
+
+        Compacts the index once tombstoned vectors exceed MAX_TOMBSTONE_RATIO of it.
+
+        Args:
+            vector_ids (list[str]): IDs of the contents to delete.
+
+        Returns:
+            int: Number of contents deleted.
+        """
+        try:
+            with self._write_lock:
+                registry = self._registry()
+                rows = [(registry[vector_id], vector_id) for vector_id in dict.fromkeys(vector_ids) if vector_id in registry]
+                if not rows:
+                    return 0
+                self._log({"op": "delete", "rows": [list(row) for row in rows]})
+                self._apply_delete(rows)
+
+                if len(self._tombstones) > MAX_TOMBSTONE_RATIO * max(self.index.ntotal, 1): # type: ignore
+                    self.compact()
+            return len(rows)
+        except Exception as e:
+            print(f"Error deleting vectors from Faiss: {e}")
+            raise
+
+    def compact(self):
+        """
+        Drop tombstoned vectors and renumber the remaining ones with dense Faiss IDs 0..n-1.
+
+        The compacted index is built first, then published together with the
+        renumbered metadata and keyword index while searches are held off, so no
+        search maps IDs of one numbering to rows of the other. Inside a staged
+        update, whose published index still uses the old IDs, compaction is
+        postponed until the update has been published.
+
+        Logged operations refer to the old IDs, so a loaded index is checkpointed
+        straight after compaction.
+        """
+        try:
+            with self._write_lock:
+                if self.dimension is None:
+                    return
+                if self._published_index is not None:
+                    self._compact_on_publish = True
+                    return
+                self._ensure_writable()
+                ids, vectors = self._reconstruct_all()
+                positions = {int(faiss_id): i for i, faiss_id in enumerate(ids)}
+
+                # Keep stored rows that still have a live vector, in Faiss ID order
+                live_ids = [
+                    faiss_id for faiss_id, _ in self.store.iter_ids()
+                    if faiss_id in positions and faiss_id not in self._tombstones
+                ]
+                vectors = vectors[[positions[faiss_id] for faiss_id in live_ids]] if live_ids else vectors[:0]
+                new_ids = np.arange(len(live_ids), dtype=np.int64)
+
+                index = self._create_index(
+                    self._current_index_type(), self.dimension, train_vectors=vectors if len(live_ids) else None
+                )
+                if len(live_ids):
+                    index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), new_ids) # type: ignore
+                with self._search_lock.exclusive():
+                    self.store.renumber(live_ids)
+                    self.lexical.renumber(live_ids)
+                    if self.full_vectors is not None:
+                        self.full_vectors.renumber(live_ids)
+                    self.index = index
+                    self._tombstones = set()
+
+                self.store.clear_tombstones()
+                self._id_registry = None
+                self._next_id = len(live_ids)
+                self.store.set_setting('next_faiss_id', self._next_id)
+                print(f"Faiss index compacted to {self.index.ntotal} vectors")
+
+                if self.wal is not None and self._snapshot_paths is not None:
+                    self.checkpoint()
+        except Exception as e:
+            print(f"Error compacting Faiss index: {e}")
+            raise
+
+    def _indexed_faiss_ids(self):
+        """
+        Return the set of Faiss IDs currently held by the index.
+        """
+        index = self.index
+        if isinstance(index, faiss.IndexIDMap):
+            return set(faiss.vector_to_array(index.id_map).tolist())
+        ivf = faiss.extract_index_ivf(index)
+        ids = set()
+        for l in range(ivf.nlist):
+            size = ivf.invlists.list_size(l)
+            if size:
+                ids.update(faiss.rev_swig_ptr(ivf.invlists.get_ids(l), size).tolist())
+        return ids
+
+    def _replay_wal(self):
+        """
+        Re-apply operations logged after the last snapshot.
+
+        Replay is idempotent: additions already captured by the snapshot are skipped,
+        updates simply overwrite the same Faiss ID again, deletes of absent IDs are
+        no-ops and settings are stored again.
+        """
+        records = list(self.wal.records()) # type: ignore
+        if not records:
+            return
+        self._ensure_writable()
+        present = self._indexed_faiss_ids()
+        for record in records:
+            if record["op"] == "setting":
+                self.store.set_setting(record["key"], record["value"])
+                continue
+            if self.dimension is None:
+                self.dimension = record["dimension"]
+                self._update_index_dimension()
+            if record["op"] == "delete":
+                rows = [tuple(row) for row in record["rows"] if row[0] in present]
+                if rows:
+                    self._apply_delete(rows)
+                    if self._supports_removal():
+                        present.difference_update(row[0] for row in rows)
+                continue
+            vectors = decode_vectors(record["vectors"], record["dimension"])
+            if record["op"] == "add":
+                keep = [i for i, row in enumerate(record["rows"]) if row[0] not in present]
+                if keep:
+                    contents = record.get("contents")
+                    self._apply_add(
+                        vectors[keep], [tuple(record["rows"][i]) for i in keep], replace=True,
+                        texts=[contents[i] for i in keep] if contents else None
+                    )
+                    present.update(record["rows"][i][0] for i in keep)
+            elif record["op"] == "update":
+                if record["faiss_id"] in present:
+                    self._apply_update(record["faiss_id"], record["vector_id"], vectors[0], record["metadata"])
+                else:
+                    self._apply_add(vectors, [(record["faiss_id"], record["vector_id"], record["metadata"])], replace=True)
+                    present.add(record["faiss_id"])
+        print(f"Replayed {len(records)} operations from {self.wal.path}") # type: ignore
+
+    def checkpoint(self):
+        """
+        Write a fresh snapshot of the loaded index and truncate the write-ahead log.
+
+        A snapshot loaded with versions is never rewritten. The changes are saved into
+        the version they were staged in, which is published in its place, and the log
+        starts over next to it.
+        """
+        if self._snapshot_paths is None:
+            raise ValueError("No snapshot to checkpoint. Call load_from_disk first.")
+        with self._write_lock:
+            if self._versions is None:
+                self._save_to_disk(*self._snapshot_paths)
+                return
+            if self._staged_paths is None:
+                return
+            index_filepath, metadata_filepath = self._staged_paths
+            self._save_to_disk(index_filepath, metadata_filepath)
+            self._versions.publish(index_filepath, self._snapshot_paths[0])
+            # The published version is immutable in turn, so the next change is staged in another
+            if self.wal is not None:
+                self.wal.truncate()
+                self.wal.close()
+                self.wal = WriteAheadLog(os.path.splitext(index_filepath)[0] + ".wal")
+            self._snapshot_paths, self._staged_paths = self._staged_paths, None
+
+    def start_checkpointing(self, interval: float = 300, max_pending: int = 1000):
+        """
+        Checkpoint in a background thread every interval seconds, or sooner once
+        max_pending operations have been logged.
+
+        Args:
+            interval (float): Seconds between checkpoints while the log is non-empty.
+            max_pending (int): Number of logged operations that triggers an early checkpoint.
+        """
+        if self._checkpoint_thread is not None:
+            return
+        self._stop_checkpointing.clear()
+
+        def run():
+            last = time.monotonic()
+            while not self._stop_checkpointing.wait(1.0):
+                pending = self.wal.pending if self.wal else 0
+                if pending and (pending >= max_pending or time.monotonic() - last >= interval):
+                    try:
+                        self.checkpoint()
+                    except Exception as e:
+                        print(f"Error checkpointing Faiss index: {e}")
+                    last = time.monotonic()
+
+        self._checkpoint_thread = threading.Thread(target=run, name="faiss-checkpoint", daemon=True)
+        self._checkpoint_thread.start()
+
+    def stop_checkpointing(self):
+        """
+        Stop the background checkpoint thread.
+        """
+        if self._checkpoint_thread is not None:
+            self._stop_checkpointing.set()
+            self._checkpoint_thread.join()
+            self._checkpoint_thread = None
+
     def save_to_disk(
             self, 
             index_filepath=os.path.join(os.path.dirname(__file__), "faiss_db/faiss_index.bin"), 
-            metadata_filepath=os.path.join(os.path.dirname(__file__), "faiss_db/metadata.pkl")
+            metadata_filepath=DEFAULT_METADATA_PATH
         ):
         """
         Save the index and metadata to disk.
 
+        Saving over the loaded snapshot folds the write-ahead log into it. Other paths
+        get a copy; metadata changes keep going to the files the Memory was loaded from.
+
         Args:
             index_filepath (str): Filepath to save the Faiss index.
-            metadata_filepath (str): Filepath to save the metadata and vector IDs.
+            metadata_filepath (str): Filepath of the metadata database.
         """
+        with self._write_lock:
+            self._save_to_disk(index_filepath, metadata_filepath)
+
+    def _save_to_disk(self, index_filepath, metadata_filepath):
         try:
-            # Save the Faiss index
-            faiss.write_index(self.index, index_filepath)
+            # Save the keyword index and full vectors first: if the Faiss index write then
+            # fails, replaying the log onto them only re-applies operations they already hold
+            self.lexical.save(self._lexical_path(index_filepath))
+            if self.full_vectors is not None:
+                self.full_vectors.save_as(self._full_vectors_path(index_filepath))
+
+            # Save the Faiss index. Write to a temporary file and rename it into place,
+            # so a process that has the old file memory-mapped keeps a consistent view.
+            faiss.write_index(self.index, index_filepath + ".tmp")
+            os.replace(index_filepath + ".tmp", index_filepath)
             print(f"Faiss index saved to {index_filepath}")
 
-            # Save metadata and vector IDs
-            data = {
-                'vector_ids': self.vector_ids,
-                'metadata': self.metadata,
-                'dimension': self.dimension
+            # Save metadata, vector IDs and the index configuration
+            settings = {
+                'dimension': self.dimension,
+                'index_config': self._index_config(),
+                'embedding_model': self.embedding_backend.model_key
             }
-            with open(metadata_filepath, 'wb') as f:
-                pickle.dump(data, f)
+            missing = object()
+            changed = {key: value for key, value in settings.items() if self.store.get_setting(key, missing) != value}
+            if changed:
+                self._ensure_staged()
+            for key, value in changed.items():
+                self.store.set_setting(key, value)
+            self.store.save_as(metadata_filepath)
             print(f"Metadata saved to {metadata_filepath}")
 
+            # The new snapshot captures every logged operation
+            if self.wal is not None and self._snapshot_paths == (os.path.abspath(index_filepath), os.path.abspath(metadata_filepath)):
+                self.wal.truncate()
+
         except Exception as e:
             print(f"Error saving to disk: {e}")
             raise
 
+    @staticmethod
+    def _lexical_path(index_filepath):
+        return os.path.splitext(index_filepath)[0] + ".bm25.npz"
+
+    @staticmethod
+    def _full_vectors_path(index_filepath):
+        return os.path.splitext(index_filepath)[0] + ".f32"
+
+    def _rebuild_lexical(self):
+        """
+        Rebuild the keyword index from the text held in the metadata store.
+        """
+        self.lexical = BM25Index(self.lexical.k1, self.lexical.b)
+        batch_ids, batch_texts = [], []
+        for faiss_id, _, metadata in self.store.iter_rows():
+            if faiss_id in self._tombstones:
+                continue
+            batch_ids.append(faiss_id)
+            batch_texts.append(self._lexical_text(metadata))
+            if len(batch_ids) >= 10_000:
+                self.lexical.add(batch_ids, batch_texts)
+                batch_ids, batch_texts = [], []
+        self.lexical.add(batch_ids, batch_texts)
+        print(f"Keyword index rebuilt with {len(self.lexical)} documents")
+
     def load_from_disk(
             self, 
             index_filepath = os.path.join(os.path.dirname(__file__), "faiss_db/faiss_index.bin"),
-            metadata_filepath = os.path.join(os.path.dirname(__file__), "faiss_db/metadata.pkl")
+            metadata_filepath = DEFAULT_METADATA_PATH,
+            use_mmap = False,
+            use_wal = True,
+            versions = None
     ):
         """
         Load the index and metadata from disk.
 
+        With use_mmap the index file is memory-mapped read-only instead of read into
+        memory, so loading takes constant time and worker processes share its pages.
+        The index is read into memory the first time it is modified. Metadata is
+        always read on demand from its database, one row per hit.
+
+        A legacy metadata.pkl next to metadata_filepath is migrated on first load, and
+        the keyword index (faiss_index.bm25.npz for faiss_index.bin) is rebuilt from
+        the metadata when it is missing.
+
+        Operations in the write-ahead log next to the index file (faiss_index.wal for
+        faiss_index.bin) are replayed on top of the snapshot, and later changes are
+        appended to it until the next checkpoint.
+
         Args:
             index_filepath (str): Filepath to load the Faiss index from.
-            metadata_filepath (str): Filepath to load the metadata and vector IDs from.
+            metadata_filepath (str): Filepath of the metadata database.
+            use_mmap (bool): Whether to memory-map the index and metadata files.
+            use_wal (bool): Whether to replay and keep appending to the write-ahead log.
+            versions (optional): Set for a published snapshot, whose files are never modified.
+                Its create() returns the (index, metadata) filepaths of a new version to stage
+                changes in, and publish(index_filepath, base_filepath) publishes that version
+                when it is checkpointed.
         """
         try:
             # Load the Faiss index
-            self.index = faiss.read_index(index_filepath)
-            print(f"Faiss index loaded from {index_filepath}")
+            if use_mmap and not self.use_gpu:
+                self.index = faiss.read_index(index_filepath, self._mmap_flags(index_filepath))
+                self._mmap_source = index_filepath
+                print(f"Faiss index memory-mapped from {index_filepath}")
+            else:
+                self.index = faiss.read_index(index_filepath)
+                self._mmap_source = None
+                print(f"Faiss index loaded from {index_filepath}")
 
-            # Load metadata and vector IDs
-            with open(metadata_filepath, 'rb') as f:
-                data = pickle.load(f)
-            self.vector_ids = data['vector_ids']
-            self.metadata = data['metadata']
-            self.dimension = data['dimension']
+            # Open metadata and vector IDs, migrating a pickle saved by older versions
+            if not os.path.exists(metadata_filepath):
+                pickle_filepath = os.path.splitext(metadata_filepath)[0] + ".pkl"
+                if not os.path.exists(pickle_filepath):
+                    raise FileNotFoundError(f"Metadata file not found: {metadata_filepath}")
+                migrate_pickle(pickle_filepath, metadata_filepath)
+            self.store.close()
+            self._discard_staged()
+            self._versions = versions
+            self.store = MetadataStore(metadata_filepath, use_mmap=use_mmap)
+            self._id_registry = None
+            self._next_id = None
+            self._next_vector_number = None
+            self._tombstones = self.store.tombstones()
+            self.dimension = self.store.get_setting('dimension', self.index.d)
+            # Indexes saved before index types were configurable have no index_config
+            for key, value in self.store.get_setting('index_config', {}).items():
+                setattr(self, key, value)
+            embedding_model = self.store.get_setting('embedding_model')
+            if embedding_model is not None and embedding_model != self.embedding_backend.model_key:
+                print(
+                    f"Warning: index was built with embedding model {embedding_model} "
+                    f"but is searched with {self.embedding_backend.model_key}"
+                )
 
-            # If use_gpu is True, transfer the index to GPU
-            if self.use_gpu and faiss.get_num_gpus() > 0:
+            # Open the full vectors kept for re-ranking, recreating them from the codes if missing
+            if self.full_vectors is not None:
+                self.full_vectors.close()
+                self.full_vectors = None
+            if self._keeps_full_vectors():
+                full_vectors_filepath = self._full_vectors_path(index_filepath)
+                if os.path.exists(full_vectors_filepath):
+                    self.full_vectors = FullVectorFile(self.dimension, full_vectors_filepath)
+                else:
+                    print(f"Full vectors not found at {full_vectors_filepath}; re-ranking against reconstructed vectors")
+                    ids, vectors = self._reconstruct_all()
+                    self._ensure_staged()
+                    if self._staged_paths is not None:
+                        full_vectors_filepath = self._full_vectors_path(self._staged_paths[0])
+                    self.full_vectors = FullVectorFile(self.dimension, full_vectors_filepath)
+                    self.full_vectors.write(ids, vectors)
+
+            # Load the keyword index saved with the snapshot
+            lexical_filepath = self._lexical_path(index_filepath)
+            if os.path.exists(lexical_filepath):
+                self.lexical = BM25Index.load(lexical_filepath)
+            else:
+                self._rebuild_lexical()
+
+            # Replay operations logged since the snapshot and keep logging new ones
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
+            self._snapshot_paths = (os.path.abspath(index_filepath), os.path.abspath(metadata_filepath))
+            if use_wal:
+                self.wal = WriteAheadLog(os.path.splitext(index_filepath)[0] + ".wal")
+                self._replay_wal()
+
+            # If use_gpu is True, transfer the index to GPU (HNSW has no GPU implementation)
+            if self.use_gpu and faiss.get_num_gpus() > 0 and self._current_index_type() != "hnsw":
                 res = faiss.StandardGpuResources() # type: ignore
                 self.index = faiss.index_cpu_to_gpu(res, 0, self.index) # type: ignore
                 print("Index transferred to GPU")
 
-            print(f"Metadata loaded from {metadata_filepath}")
+            print(f"Metadata opened from {metadata_filepath}")
             print(f"Index has {self.index.ntotal} vectors")
         except Exception as e:
             print(f"Error loading from disk: {e}")
@@ -284,39 +1632,79 @@ class Memory:
         Close the Faiss index and release resources.
         """
         try:
+            self.stop_checkpointing()
+            if self.full_vectors is not None:
+                self.full_vectors.close()
+                self.full_vectors = None
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
+                self._snapshot_paths = None
             if self.index:
-                self.index.reset()
-                self.vector_ids = []
-                self.metadata = {}
+                if self._mmap_source is not None:
+                    # A mapped index cannot be reset in place; drop the mapping instead
+                    self._mmap_source = None
+                    self.index = self._create_index("flat", 0)
+                else:
+                    self.index.reset()
+                # Detach from the metadata database without deleting its rows
+                self.store.close()
+                self.store = MetadataStore()
+                self.lexical = BM25Index()
+                self._id_registry = None
+                self._next_id = None
+                self._next_vector_number = None
+                self._tombstones = set()
                 self.dimension = None
                 print("Faiss index cleared.")
+            self._discard_staged()
+            self._versions = None
         except Exception as e:
             print(f"Error closing Faiss index: {e}")
 
 if __name__ == "__main__":
     # Initialize Memory using Ollama for embeddings
-    memory = Memory(use_gpu=False)
+    memory = Memory(use_gpu=False, index_type="auto")
 
-    # Add some sample contents 
+    # Index the full text of every library document in overlapping chunks
     from mongo_db import *
-    docs = [doc for doc in libraryDocsCollection.find()]
-    vector_num = 1
-    for _ in docs:
-        memory.add_memory(_["doc_name"].split(" - ")[-1], metadata={"doc_url":_["doc_url"], "doc_name":_["doc_name"]})
+    from library_indexer import index_library
+    from library_sync import DOC_PROJECTION, SYNC_STATE_KEY, sync_cursor
+    from document_text import get_extraction_cache
+    docs = [doc for doc in libraryDocsCollection.find({}, DOC_PROJECTION) if doc.get("doc_url")]
+    chunk_count = index_library(memory, docs)
+    print(f"Indexed {chunk_count} chunks")
+    # Start the server's LibrarySynchronizer after the records indexed here
+    if docs:
+        memory.store.set_setting(SYNC_STATE_KEY, sync_cursor(docs))
+    if get_extraction_cache():
+        print(f"Extraction cache: {get_extraction_cache().stats()}")
+
+    # Pick and train the index type that suits the library size
+    memory.rebuild_index()
+
+    if memory.embedding_cache:
+        print(f"Embedding cache: {memory.embedding_cache.stats()}")
 
-    # Save the index and metadata to disk
-    memory.save_to_disk()
+    # Save the index and metadata as a new snapshot and make it current. A running
+    # server switches to it on `kill -HUP` or a POST to /api/admin/index.
+    from index_manager import DEFAULT_NAMESPACE, IndexManager, SnapshotVersions
+    index_manager = IndexManager()
+    version = index_manager.save_snapshot(DEFAULT_NAMESPACE, memory)
 
     # Create a new Memory object and load from disk
     #new_memory = Memory(use_gpu=False)
-    memory.load_from_disk()
+    memory.load_from_disk(
+        *index_manager.paths(DEFAULT_NAMESPACE, version), versions=SnapshotVersions(index_manager, DEFAULT_NAMESPACE)
+    )
 
     # Search for similar contents
     query = "Kwoyelo Judgment"
-    search_results = memory.search_memory(query, k=3)
+    search_results = memory.search_documents(query, k=3, hybrid=True)
     print("\nSearch results:")
     for result in search_results:
         print(f"ID: {result['id']}, Distance: {result['distance']}, Metadata: {result['metadata']['doc_url']}")
+        print(f"    {result['snippet'][:200]}")
 
     # Update a memory
     #new_content = "This is the updated content for the first example."
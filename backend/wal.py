@@ -0,0 +1,115 @@
+import base64
+import json
+import os
+import threading
+import numpy as np
+
+def encode_vectors(vectors):
+    """
+    Encode a float32 matrix as base64 text for a log record.
+    """
+    return base64.b64encode(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+def decode_vectors(data, dimension):
+    """
+    Decode vectors written by encode_vectors back into a float32 matrix.
+    """
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dimension)
+
+class WriteAheadLog:
+    """
+    An append-only log of index operations, one JSON record per line.
+
+    Records appended since the last snapshot are replayed on top of it at load time,
+    and the log is truncated once a new snapshot has been written.
+    """
+
+    def __init__(self, path, fsync=True):
+        """
+        Open (or create) the log file.
+
+        Args:
+            path (str): Filepath of the log.
+            fsync (bool): Whether every append is flushed to stable storage before returning.
+        """
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._discard_torn_tail()
+        self._file = open(path, "a", encoding="utf-8")
+        self.pending = sum(1 for _ in self.records())
+
+    def _discard_torn_tail(self):
+        """
+        Cut a torn final line, left by a crash mid-append, off the log, so the next
+        record starts on a line of its own instead of being appended to it.
+        """
+        try:
+            f = open(self.path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            # Walk back from the end to just after the last newline
+            while end > 0:
+                start = max(end - 65536, 0)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                print(f"Discarding a torn record of {size - end} bytes at the end of {self.path}")
+                f.truncate(end)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    def append(self, record):
+        """
+        Append one operation record to the log.
+
+        Args:
+            record (dict): A JSON-serializable operation with an "op" key.
+        """
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.pending += 1
+
+    def records(self):
+        """
+        Iterate over the logged records in order.
+
+        A torn final line left by a crash mid-append is ignored; it is cut off the
+        file the next time the log is opened.
+        """
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    return
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+
+    def truncate(self):
+        """
+        Discard every record, after they have been captured by a snapshot.
+        """
+        with self._lock:
+            self._file.truncate(0)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.pending = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()